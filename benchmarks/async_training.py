@@ -0,0 +1,59 @@
+import argparse
+import functools
+import os
+import tempfile
+import time
+
+
+def run_training(mode, timesteps, n_envs=None, n_actors=None, max_staleness=None, grid_size=None):
+    """ Trains PPO for <timesteps> steps with the synchronous vectorized envs ('sync', <n_envs> envs in subprocesses)
+    or the asynchronous actor-learner ('async', <n_actors> actors). The models and logs go to a temporary folder.
+    It returns the wall time, the env steps per second and the fraction of the run spent in the gradient updates """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from src.opengym.__main__ import GymGame
+    from src.rl_algorithms.ppo import Defaults, PPOAlgorithm
+
+    folder = tempfile.mkdtemp(prefix=f"{mode}_training_")
+    Defaults.TOTAL_TIMESTEPS = timesteps
+    Defaults.SAVE_FREQ = timesteps
+    Defaults.LOGS_PATH = os.path.join(folder, 'logs')
+    Defaults.SAVE_PATH = os.path.join(folder, 'models')
+    Defaults.VERBOSITY = 0
+    env_factory = functools.partial(GymGame, grid_size)
+    start = time.perf_counter()
+    if mode == 'sync':
+        Defaults.NUM_THREADS = n_envs or Defaults.NUM_THREADS
+        Defaults.SUBPROC_ENVS = True
+        algorithm = PPOAlgorithm(env_factory, use_vecenv=True, use_wandb=False)
+        algorithm.train()
+        elapsed = time.perf_counter() - start
+        totals = algorithm.telemetry.totals
+        return {"time_s": elapsed, "env_steps_per_sec": algorithm.model.num_timesteps / elapsed,
+                "learner_busy": totals["train_time_s"] / elapsed, "staleness_mean": 0.0, "dropped_segments": 0}
+    Defaults.ASYNC_ACTORS = n_actors or Defaults.ASYNC_ACTORS
+    Defaults.ASYNC_MAX_STALENESS = max_staleness if max_staleness is not None else Defaults.ASYNC_MAX_STALENESS
+    summary = PPOAlgorithm(env_factory, use_async=True, use_wandb=False).train_async('benchmark')
+    return {"time_s": time.perf_counter() - start, "env_steps_per_sec": summary["env_steps_per_sec"],
+            "learner_busy": summary["learner_busy"], "staleness_mean": summary["staleness_mean"], "dropped_segments": summary["dropped_segments"]}
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Asynchronous training benchmark',
+                                     description='Compares the throughput of the asynchronous actor-learner training with the synchronous --vecenv training.')
+    parser.add_argument('-t', '--timesteps', type=int, default=20480, help='Timesteps of every training')
+    parser.add_argument('--envs', type=int, default=None, help='Envs of the synchronous training (all the CPUs by default)')
+    parser.add_argument('--actors', type=int, default=None, help='Actor processes of the asynchronous training (all the CPUs but one by default)')
+    parser.add_argument('--max-staleness', type=int, default=None, help='Maximum staleness of the asynchronous training')
+    parser.add_argument('-g', '--grid', type=int, default=None, help='Size of the egocentric grid observation')
+    parser.add_argument('-m', '--modes', nargs='+', default=['sync', 'async'], choices=['sync', 'async'], help='Trainings to run')
+    args = parser.parse_args()
+
+    results = {mode: run_training(mode, args.timesteps, args.envs, args.actors, args.max_staleness, args.grid) for mode in args.modes}
+    print(f"\n{'Training':{12}}{'Time [s]':>10}{'Env steps/s':>14}{'Learner busy':>15}{'Staleness':>12}{'Dropped':>10}")
+    for mode, result in results.items():
+        print(f"{mode:{12}}{result['time_s']:>10.1f}{result['env_steps_per_sec']:>14.1f}{100 * result['learner_busy']:>14.1f}%"
+              f"{result['staleness_mean']:>12.2f}{result['dropped_segments']:>10}")
+    if len(results) == 2:
+        print(f"\n[BENCHMARK INFO] Async / sync throughput: {results['async']['env_steps_per_sec'] / results['sync']['env_steps_per_sec']:.2f}x")
@@ -0,0 +1,43 @@
+import argparse
+import os
+
+from src.utils.memory import current_rss_mb
+
+
+def measure_env_memory(n_envs=8):
+    """ Memory of the first GymGame of a process (which loads the shared world assets) and of every additional one """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from src.opengym.__main__ import GymGame
+
+    baseline = current_rss_mb()
+    envs = [GymGame()]
+    envs[0].reset(seed=0)
+    first = current_rss_mb()
+    for seed in range(1, n_envs):
+        envs.append(GymGame())
+        envs[-1].reset(seed=seed)
+    last = current_rss_mb()
+    return {"first_env_mb": first - baseline,
+            "per_env_mb": (last - first) / max(1, n_envs - 1),
+            "shared_assets_mb": {key: value / 1024**2 for key, value in envs[0].game.assets.memory_report().items()}
+            }
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Env memory benchmark',
+                                     description='Measures the memory of every GymGame of a process to size n_envs against the available RAM.')
+    parser.add_argument('-n', '--envs', type=int, default=8, help='Number of envs to create')
+    parser.add_argument('--ram-gb', type=float, default=None, help='RAM available for the envs of one process')
+    args = parser.parse_args()
+
+    report = measure_env_memory(args.envs)
+    print(f"\nSHARED ASSETS (loaded once per process)\n")
+    for key, value in report["shared_assets_mb"].items():
+        print(f"{key:{25}} {value:>10.2f} MB")
+    print(f"\n{'First env':{25}} {report['first_env_mb']:>10.2f} MB")
+    print(f"{'Every additional env':{25}} {report['per_env_mb']:>10.2f} MB")
+    if args.ram_gb:
+        n_envs = 1 + int((args.ram_gb * 1024 - report['first_env_mb']) / max(report['per_env_mb'], 1e-3))
+        print(f"{'Max n_envs':{25}} {max(0, n_envs):>10}")
@@ -0,0 +1,44 @@
+import argparse
+import os
+import sys
+
+from src.utils.memory import MemoryProfiler
+
+
+def measure_memory_growth(policy='random', n_episodes=40, every=10, warmup=3, top=10, console=True):
+    """ Runs headless episodes of a registered policy in this process under the memory profiler. It returns the
+    final report: traced and RSS growth per episode after the warmup, by subsystem and by allocation site (None if
+    the warmup is not over) """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from src.rl_algorithms.evaluation import run_episode
+
+    profiler = MemoryProfiler(every=every, top=top, warmup=warmup, console=console).start()
+    try:
+        for seed in range(n_episodes):
+            run_episode(policy, seed)
+            profiler.episode_end()
+        return profiler.report() if not profiler.reports or profiler.reports[-1]["episode"] != profiler.episodes else profiler.reports[-1]
+    finally:
+        profiler.stop()
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Memory growth benchmark',
+                                     description='Fails if the memory of the episodes of a policy does not return to its baseline.')
+    parser.add_argument('-p', '--policy', default='random', help='Registered policy whose episodes are run')
+    parser.add_argument('-n', '--episodes', type=int, default=40, help='Number of episodes')
+    parser.add_argument('--every', type=int, default=10, help='Episodes between two allocation reports')
+    parser.add_argument('--warmup', type=int, default=3, help='Episodes run before the baseline snapshot')
+    parser.add_argument('--max-growth-kb', type=float, default=8, help='Maximum traced memory growth per episode [KB]')
+    args = parser.parse_args()
+    if args.episodes <= args.warmup:
+        parser.error(f"--episodes ({args.episodes}) must be greater than --warmup ({args.warmup})")
+
+    report = measure_memory_growth(args.policy, args.episodes, args.every, args.warmup)
+    growth_kb = report["traced_growth_mb_per_episode"] * 1024
+    if growth_kb > args.max_growth_kb:
+        print(f"\n[MEMORY INFO] FAIL: the traced memory grows {growth_kb:.1f} KB per episode (maximum {args.max_growth_kb} KB)")
+        sys.exit(1)
+    print(f"\n[MEMORY INFO] OK: the traced memory grows {growth_kb:.1f} KB per episode (maximum {args.max_growth_kb} KB)")
@@ -0,0 +1,114 @@
+import argparse
+import numpy as np
+import time
+
+from collections import deque
+from src.pygame.tilemap import Spot
+from src.utils.pathfinding import HierarchicalPathfinder, a_star_algorithm, grid_a_star, grid_lookup, jump_point_search
+
+
+BACKENDS = ('a_star', 'grid_a_star', 'jps', 'hpa')
+
+
+def generate_open_map(size, density=0.15, seed=0):
+    """ Open map of <size> x <size> tiles with random rectangular obstacles of 1 to 8 tiles covering about <density>
+    of it, like the large procedurally generated maps """
+    rng = np.random.default_rng(seed)
+    grid = np.zeros((size, size), dtype=bool)
+    while grid.mean() < density:
+        row, col = rng.integers(0, size, 2)
+        height, width = rng.integers(1, 9, 2)
+        grid[row:row + height, col:col + width] = True
+    return grid
+
+
+def largest_component(grid):
+    """ Free tiles (row, col) connected to the free tile with the most free tiles around it """
+    rows, cols = grid.shape
+    seen = np.zeros_like(grid)
+    best = []
+    for start in map(tuple, np.argwhere(~grid)):
+        if seen[start]:
+            continue
+        component, frontier = [start], deque([start])
+        seen[start] = True
+        while frontier:
+            row, col = frontier.popleft()
+            for neighbor in ((row + 1, col), (row - 1, col), (row, col + 1), (row, col - 1)):
+                if 0 <= neighbor[0] < rows and 0 <= neighbor[1] < cols and not grid[neighbor] and not seen[neighbor]:
+                    seen[neighbor] = True
+                    component.append(neighbor)
+                    frontier.append(neighbor)
+        if len(component) > len(best):
+            best = component
+        if len(best) * 2 > grid.size - grid.sum():
+            break
+    return best
+
+
+def build_graph_map(grid):
+    """ Spot graph of the current A* (see WorldAssets.build_graph_map) """
+    rows, cols = grid.shape
+    graph_map = [[Spot(row, col, 1, 1, rows, cols) for col in range(cols)] for row in range(rows)]
+    for row, col in zip(*np.nonzero(grid)):
+        graph_map[row][col].make_obstacle()
+    for spots in graph_map:
+        for spot in spots:
+            spot.update_neighbors(graph_map)
+    return graph_map
+
+
+def build_backend(backend, grid):
+    """ Query function (start, end) -> actions of a backend, built for the map """
+    if backend == 'a_star':
+        graph_map = build_graph_map(grid)
+        return lambda start, end: a_star_algorithm(graph_map, graph_map[start[0]][start[1]], graph_map[end[0]][end[1]])
+    if backend == 'hpa':
+        return HierarchicalPathfinder(grid).find_path
+    is_blocked = grid_lookup(grid)
+    search = grid_a_star if backend == 'grid_a_star' else jump_point_search
+    return lambda start, end: search(is_blocked, start, end)
+
+
+def benchmark(size, backends=BACKENDS, n_queries=20, density=0.15, seed=0):
+    """ Build time and mean query time of every backend on queries between random far apart tiles of a generated
+    map, and the mean length of their paths against the shortest ones (jump point search) """
+    grid = generate_open_map(size, density, seed)
+    tiles = largest_component(grid)
+    rng = np.random.default_rng(seed)
+    queries = []
+    while len(queries) < n_queries:
+        start, end = (tiles[i] for i in rng.integers(len(tiles), size=2))
+        if abs(start[0] - end[0]) + abs(start[1] - end[1]) >= size // 2:
+            queries.append((tuple(map(int, start)), tuple(map(int, end))))
+    shortest = [len(jump_point_search(grid_lookup(grid), start, end)) for start, end in queries]
+
+    results = {}
+    for backend in backends:
+        start_time = time.perf_counter()
+        find_path = build_backend(backend, grid)
+        build_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        lengths = [len(find_path(start, end)) for start, end in queries]
+        query_time = (time.perf_counter() - start_time) / n_queries
+        results[backend] = {"build_s": build_time, "query_ms": 1000 * query_time,
+                            "path_ratio": float(np.mean([length / optimal for length, optimal in zip(lengths, shortest)]))}
+    return results
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Path finding benchmark',
+                                     description='Compares the query time of the path finding backends as the map grows.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[64, 128, 256, 512], help='Sides of the generated maps [tiles]')
+    parser.add_argument('-b', '--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS, help='Backends to compare')
+    parser.add_argument('-n', '--queries', type=int, default=20, help='Number of queries on every map')
+    parser.add_argument('--density', type=float, default=0.15, help='Fraction of the map covered by obstacles')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the maps and the queries')
+    args = parser.parse_args()
+
+    print(f"\n{'Map':{12}}{'Backend':{15}}{'Build [s]':>12}{'Query [ms]':>14}{'Path / shortest':>18}")
+    for size in args.sizes:
+        for backend, result in benchmark(size, args.backends, args.queries, args.density, args.seed).items():
+            print(f"{f'{size}x{size}':{12}}{backend:{15}}{result['build_s']:>12.3f}{result['query_ms']:>14.2f}{result['path_ratio']:>18.3f}")
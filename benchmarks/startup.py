@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT_PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Frameworks that only the RL algorithms need
+HEAVY_MODULES = ['tensorflow', 'torch', 'wandb', 'stable_baselines3', 'sb3_contrib']
+
+# Code run by every CLI mode before entering its loop
+MODES = {'manual': "env = GymGame(); env.reset()",
+         'random': "env = GymGame(); get_algorithm('random')(env)",
+         'controlled': "env = GymGame(); get_algorithm('controlled')(env)",
+         'evaluation': "env = GymGame(); get_algorithm('ppo')(env)",
+         'train': "get_algorithm('ppo'); from src.rl_algorithms.ppo import Defaults"
+         }
+
+# Startup time budget of every CLI mode [s]
+BUDGETS = {'manual': 1.5,
+           'random': 1.5,
+           'controlled': 1.5,
+           'evaluation': 10,
+           'train': 10
+           }
+
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+from src.opengym.__main__ import GymGame
+from src.rl_algorithms import get_algorithm
+{code}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed,
+                  "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "heavy_modules": sorted(m for m in {heavy} if m in sys.modules)}}))
+"""
+
+
+def measure_startup(mode):
+    """ Runs the startup of a CLI mode in a fresh interpreter. It returns the wall time from the first import until
+    the mode is ready to run, the peak RSS and the heavy frameworks that were imported """
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy', PYTHONPATH=ROOT_PROJECT_PATH)
+    code = CHILD.format(code=MODES[mode], heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT_PROJECT_PATH, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Startup benchmark',
+                                     description='Measures the startup time of every mode of the opengym CLI against its budget.')
+    parser.add_argument('-n', '--repeats', type=int, default=3, help='Number of measurements per mode (median is reported)')
+    parser.add_argument('modes', nargs='*', default=list(MODES), help='Modes to measure')
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'Mode':{12}} {'Startup [s]':{14}} {'Budget [s]':{12}} {'Max RSS [MB]':{14}} Heavy modules")
+    for mode in args.modes:
+        measures = [measure_startup(mode) for _ in range(args.repeats)]
+        seconds = statistics.median(m['seconds'] for m in measures)
+        rss = statistics.median(m['max_rss_mb'] for m in measures)
+        status = 'OK' if seconds <= BUDGETS[mode] else 'OVER BUDGET'
+        failed = failed or seconds > BUDGETS[mode]
+        print(f"{mode:{12}} {seconds:<{14}.2f} {BUDGETS[mode]:<{12}.2f} {rss:<{14}.0f} {measures[0]['heavy_modules']} {status}")
+    sys.exit(1 if failed else 0)
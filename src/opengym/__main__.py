@@ -1,43 +1,56 @@
 import argparse
-import math
+import datetime
+import functools
 import numpy as np
+import os
 import pygame
-import pytweening
+import random
 import sys
 
 from gym import Env, spaces
-from random import random, choice
-
+from src.opengym.egocentric import EgocentricGrid, GRID_CHANNELS
 from src.pygame.__main__ import Game
-from src.pygame.settings import COMMON_ITEMS, CONSUMABLES, ENVIRONMENT_TEMPERATURE, PICKABLE_ITEMS, UNIQUE_ITEMS
-from src.rl_algorithms.ppo import PPOAlgorithm, Defaults
-from src.rl_algorithms.random import RandomAlgorithm
-from src.rl_algorithms.controlled import ControlledAlgorithm
+from src.pygame.settings import CONSUMABLES, PICKABLE_ITEMS, ROOT_PROJECT_PATH, TICKS_PER_HOUR
+from src.rl_algorithms import get_algorithm
 from src.utils.actions import Action
+from src.utils.logger import LogLevel, StepLogger
+from src.utils.profiling import PROFILERS, profile, step_limit
+
+
+def make_observation_space(grid_size=None):
+    observation_space = spaces.Dict(
+        {
+            "environment_temperature": spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
+            "energy_stored": spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
+            "water_stored": spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
+            "sleepiness": spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
+            "objects_at_sight": spaces.Box(low=0, high=1, shape=(1,), dtype=np.int32),
+            "objects_on_inventory": spaces.Box(low=0, high=1, shape=(1,), dtype=np.int32),
+            "on_water_source": spaces.Box(low=0, high=1, shape=(1,), dtype=np.int32),
+            "on_object": spaces.Box(low=0, high=1, shape=(1,), dtype=np.int32)
+        }
+    )
+    if grid_size is not None:
+        # Optional egocentric view of the surroundings (walls, objects, mobs and visibility)
+        observation_space.spaces["grid"] = spaces.Box(low=0, high=1, shape=(len(GRID_CHANNELS), grid_size, grid_size), dtype=np.uint8)
+    return observation_space
 
 
 class GymGame(Env):
 
-    def __init__(self):
+    def __init__(self, grid_size=None):
         self.game = Game()
         #self.state = self.game.new()
         self._valid_actions = None
         self.action_space = spaces.Discrete(9)
-        self.observation_space = spaces.Dict(
-            {
-                "environment_temperature": spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
-                "energy_stored": spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
-                "water_stored": spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
-                "sleepiness": spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
-                "objects_at_sight": spaces.Box(low=0, high=1, shape=(1,), dtype=np.int32),
-                "objects_on_inventory": spaces.Box(low=0, high=1, shape=(1,), dtype=np.int32),
-                "on_water_source": spaces.Box(low=0, high=1, shape=(1,), dtype=np.int32),
-                "on_object": spaces.Box(low=0, high=1, shape=(1,), dtype=np.int32)
-            }
-        )
-        #TODO wall positions?
-
-    def reset(self):
+        self.observation_space = make_observation_space(grid_size)
+        self.grid = EgocentricGrid(grid_size) if grid_size is not None else None
+
+    def reset(self, seed=None):
+        # Seed the generators of the game (spawns) and of the action space (random policy)
+        if seed is not None:
+            random.seed(seed)
+            self.action_space.seed(seed)
         self.state = self.game.new()
         
         # Reset the cumulative reward (return)
@@ -46,7 +59,9 @@ class GymGame(Env):
         # Reset the episodic number of steps
         self.episodic_step = 1
 
-        return self.game._get_obs()
+        if self.grid is not None:
+            self.grid.reset(self.game)
+        return self._get_obs()
 
     def step(self, action):
         # Flag that marks the termination of an episode
@@ -56,10 +71,7 @@ class GymGame(Env):
         assert self.action_space.contains(action), "Invalid Action"
         
         # Compute for reward
-        total_hours_pre = self.game.hours + (self.game.days * 24)
-
-        # Compute for random spawn
-        hours_pre = self.game.hours
+        ticks_pre = self.game.ticks
 
         # Executes action behaviour 
         for avatar in self.game.avatar_sprites:
@@ -86,44 +98,7 @@ class GymGame(Env):
         # Update information on the game >>>>>>>>>>>>>>>>>>>>>>
         for avatar in self.game.avatar_sprites:
             # Spawn random objects at empty locations stochastically
-            self.game.n_trials = round(abs(hours_pre - self.game.hours), 1)
-            if self.game.n_trials >= 12:
-                self.game.n_trials = 24 - self.game.n_trials
-            if self.game.n_trials != 0:
-                rest = self.game.n_trials - math.floor(self.game.n_trials)
-            else:
-                rest = 0
-            self.game.countdown += rest
-            self.game.countdown = round(self.game.countdown, 1)
-            for _ in range(math.floor(self.game.n_trials)):
-                capacity_items = (len(self.game.object_sprites) - (len(UNIQUE_ITEMS) - 1)) / (self.game.max_items - (len(UNIQUE_ITEMS) - 1))
-                if random() < pytweening.easeInQuad(1 - capacity_items):
-                    x_r, y_r = choice(self.game.spawn_coordinates)
-                    o_coordinates = []
-                    for o in self.game.object_sprites:
-                        if o.type in CONSUMABLES:
-                            o_coordinates.append([o.rect.x, o.rect.y])
-                    if (len(self.game.spawn_coordinates) == len(o_coordinates)):
-                        break
-                    while [int(x_r), int(y_r)] in o_coordinates:
-                        x_r, y_r = choice(self.game.spawn_coordinates)
-                    self.game.spawn_new_object(x_r, y_r, choice(COMMON_ITEMS))
-            if self.game.countdown >= 1:
-                for _ in range(math.floor(self.game.countdown)):
-                    capacity_items = (len(self.game.object_sprites) - (len(UNIQUE_ITEMS) - 1)) / (self.game.max_items - (len(UNIQUE_ITEMS) - 1))
-                    if random() < pytweening.easeInQuad(1 - capacity_items):
-                        x_r, y_r = choice(self.game.spawn_coordinates)
-                        o_coordinates = []
-                        for o in self.game.object_sprites:
-                            if o.type in CONSUMABLES:
-                                o_coordinates.append([o.rect.x, o.rect.y])
-                        if (len(self.game.spawn_coordinates) == len(o_coordinates)):
-                            break
-                        while [int(x_r), int(y_r)] in o_coordinates:
-                            x_r, y_r = choice(self.game.spawn_coordinates)
-                        self.game.spawn_new_object(x_r, y_r, choice(COMMON_ITEMS))
-                self.game.countdown = 1 - math.floor(self.game.countdown)
-            self.game.n_trials = 0
+            self.game.spawn_random_objects()
 
             # Restore game conditions
             self.game.on_water_source = False
@@ -131,6 +106,7 @@ class GymGame(Env):
 
             # Updates camera position in accordance with the entity
             self.game.camera.update(avatar)
+            self.game.stream_chunks()
 
             # Avatar hits an object
             hits = pygame.sprite.spritecollide(avatar, self.game.object_sprites, False)
@@ -138,10 +114,7 @@ class GymGame(Env):
                 self.game.hit_interaction(hit)
 
             # Update day/night cycle conditions
-            if self.game.hours >= 22 or self.game.hours < 6:
-                self.game.environment_temperature = ENVIRONMENT_TEMPERATURE - 10
-            else:
-                self.game.environment_temperature = ENVIRONMENT_TEMPERATURE
+            self.game.update_environment_temperature()
             avatar.drives.update_bmr(self.game.environment_temperature)
         
         # Update objects
@@ -152,8 +125,7 @@ class GymGame(Env):
 
         for avatar in self.game.avatar_sprites:
             # 1) Reward for executing the step
-            total_hours_post = self.game.hours + (self.game.days * 24)
-            time_elapsed = total_hours_post - total_hours_pre
+            time_elapsed = (self.game.ticks - ticks_pre) / TICKS_PER_HOUR
             # 2) Reward in terms of arousal values (negative impact)
             drives_values = 0
             if avatar.drives.hunger > 0.5:
@@ -172,10 +144,10 @@ class GymGame(Env):
         self.episodic_step += 1
 
         # Update observation objects at sight
-        self.game.raycasting()
+        self.game.raycasting(draw=False)
         
         # Return state
-        self.state = self.game._get_obs()
+        self.state = self._get_obs()
 
         # Conditions to end the episode
         for avatar in self.game.avatar_sprites:
@@ -185,6 +157,13 @@ class GymGame(Env):
         info = {}
         return self.state, reward, done, info
 
+    def _get_obs(self):
+        obs = self.game._get_obs()
+        if self.grid is not None:
+            for avatar in self.game.avatar_sprites:
+                obs["grid"] = self.grid.observe(avatar)
+        return obs
+
     def render(self):
         return self.game.draw_window()
 
@@ -226,7 +205,8 @@ class GymGame(Env):
         for avatar in self.game.avatar_sprites:
             return [self._is_valid_action(avatar, action) for action in Action]
 
-    def manual_run(self):
+    def manual_run(self, logger=None):
+        logger = logger if logger is not None else StepLogger()
         self.state = self.reset()
         self.pressed_keys = []
         self.relevant_keys = {pygame.K_RIGHT: Action.RIGHT.value,
@@ -240,38 +220,26 @@ class GymGame(Env):
                               pygame.K_q: Action.STAND_STILL.value
                               }
         while True:
-            print()
-            print('>'*50)
-            print(f'[Episodic Step] {self.episodic_step}')
-            print(f"[State S_t-1] {self.state}")
-            
             # Render the game
             self.render()
 
             # Get valid actions space
             self.get_valid_actions()
-            print(f"[Action space A_t] {[self.get_action_meanings(action) for action in self._valid_actions]}")
+            state_pre, episodic_step, valid_actions = self.state, self.episodic_step, self._valid_actions
 
             # Perform action
             action = self._process_event()
             while action not in self._valid_actions:
                 action = self._process_event()
-            print(f"[Action A_t] {self.get_action_meanings(action)}")
             state, reward, done, info = self.step(action)
-            print(f"[State S_t] {state}")
-            print(f"[Step reward R_t] {reward:.2f}")
-            print(f"[Episodic return G_t so far] {self.episodic_return:.2f}")
+            logger.step(episodic_step, state_pre, action, state, reward, self.episodic_return, valid_actions)
 
             # Render the game
             self.render()
 
             # Check end conditions
             if done == True:
-                print('<'*50)
-                print(f'\nSUMMARY\n')
-                data = [("Policy", "Total elapsed time", "Episodic return G_t"), ('Manual policy', f'{self.game.days} days, {self.game.hours:.2f} hours', f'{self.episodic_return:.2f}')]
-                for x, y, sum in data:
-                    print(f"{x:{25}} {y:{25}} {sum:{25}}")
+                logger.episode('Manual policy', self.game.days, self.game.hours, self.episodic_return, self.episodic_step)
                 break
         
         self.close()
@@ -302,29 +270,68 @@ if __name__ == "__main__":
     parser.add_argument('-a', '--algorithm', nargs='?', default='ppo', help='Runs an operation with a RL algorithm')
     parser.add_argument('-t', '--train', nargs='?', const=10000, type=int, help='Performs training on a RL algorithm')
     parser.add_argument('--vecenv', action='store_true', help='Performs training on a RL algorithm with vectorized environments')
+    parser.add_argument('--async', dest='async_training', action='store_true', help='Performs training on a RL algorithm with asynchronous actor processes and a learner')
+    parser.add_argument('--actors', type=int, default=None, help='Number of actor processes of the asynchronous training (all the CPUs but one by default)')
+    parser.add_argument('--max-staleness', type=int, default=None, help='Policy versions a trajectory of the asynchronous training can lag behind the learner')
     parser.add_argument('-e', '--evaluation', action='store_true', help='Performs evaluation on a RL algorithm')
+    parser.add_argument('-g', '--grid', type=int, default=None, help='Adds an egocentric grid observation of the given (odd) size')
+    parser.add_argument('--log-level', default='summary', choices=[level.name.lower() for level in LogLevel], help='Amount of information logged by the policy loops')
+    parser.add_argument('--log-every', type=int, default=1, help='Logs one out of every N steps')
+    parser.add_argument('--log-file', default=None, help='JSON lines file to store the logged steps and episode summaries')
+    parser.add_argument('--memory-profile', type=int, default=None, metavar='N', help='Reports the memory growth of the training every N episodes (tracemalloc)')
+    parser.add_argument('--profile', nargs='?', const='sampling', default=None, choices=PROFILERS, help='Profiles the selected operation (sampling profiler by default, or cprofile) and reports the time per subsystem')
+    parser.add_argument('--profile-steps', type=int, default=None, help='Steps to profile (the whole operation by default)')
+    parser.add_argument('--profile-episodes', type=int, default=None, help='Episodes to profile (the whole operation by default)')
+    parser.add_argument('--profile-output', default=None, help='Folder of the profile (profiles/<date> by default)')
 
     # Parse arguments
     args = parser.parse_args()
 
+    # Logging of the policy loops
+    logger = StepLogger(LogLevel[args.log_level.upper()], every=args.log_every, path=args.log_file)
+
     # Operations
-    if args.manual:
-        GymGame().manual_run()
-    elif args.random:
-        env = GymGame()
-        RandomAlgorithm(env).run()
-    elif args.controlled:
-        env = GymGame()
-        ControlledAlgorithm(env).run()
-    elif args.algorithm and args.train:
-        Defaults.TOTAL_TIMESTEPS = int(args.train)
-        if 'ppo' in args.algorithm:
-            if args.vecenv:
-                PPOAlgorithm(GymGame, use_vecenv=True).train()
-            else:
-                env = GymGame()
-                PPOAlgorithm(env).train()
-    elif args.algorithm and args.evaluation:
-        if 'ppo' in args.algorithm:
-            env = GymGame()
-            PPOAlgorithm(env).evaluation()
+    def run_operation():
+        if args.manual:
+            GymGame(args.grid).manual_run(logger)
+        elif args.random:
+            env = GymGame(args.grid)
+            get_algorithm('random')(env, logger=logger).run()
+        elif args.controlled:
+            env = GymGame(args.grid)
+            get_algorithm('controlled')(env, logger=logger).run()
+        elif args.algorithm and args.train:
+            if 'ppo' in args.algorithm:
+                from src.rl_algorithms.ppo import Defaults
+                Defaults.TOTAL_TIMESTEPS = int(args.train)
+                Defaults.MEMORY_PROFILE_EVERY = args.memory_profile
+                PPOAlgorithm = get_algorithm('ppo')
+                if args.async_training:
+                    Defaults.ASYNC_ACTORS = args.actors or Defaults.ASYNC_ACTORS
+                    Defaults.ASYNC_MAX_STALENESS = args.max_staleness if args.max_staleness is not None else Defaults.ASYNC_MAX_STALENESS
+                    PPOAlgorithm(functools.partial(GymGame, args.grid), use_async=True).train()
+                elif args.vecenv:
+                    PPOAlgorithm(functools.partial(GymGame, args.grid), use_vecenv=True).train()
+                else:
+                    env = GymGame(args.grid)
+                    PPOAlgorithm(env).train()
+        elif args.algorithm and args.evaluation:
+            if 'ppo' in args.algorithm:
+                env = GymGame(args.grid)
+                get_algorithm('ppo')(env, logger=logger).evaluation()
+
+    try:
+        if args.profile:
+            # The episodic operations run again until the limit of steps or episodes is reached
+            output = args.profile_output or os.path.join(ROOT_PROJECT_PATH, 'profiles', datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S"))
+            episodic = args.manual or args.random or args.controlled
+            def run_profiled():
+                with step_limit(GymGame, args.profile_steps, args.profile_episodes):
+                    run_operation()
+                    while episodic and (args.profile_steps is not None or args.profile_episodes is not None):
+                        run_operation()
+            profile(run_profiled, args.profile, output)
+        else:
+            run_operation()
+    finally:
+        logger.close()
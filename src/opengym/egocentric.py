@@ -0,0 +1,105 @@
+import numpy as np
+
+from src.pygame.chunks import LRUCache
+from src.pygame.settings import OBJECT_IMAGES, VISIBILITY_CACHE_SIZE
+from src.utils.geometry import segments_crossing
+
+
+# Channels of the egocentric grid. The water source is the 'water-dispenser' channel
+GRID_CHANNELS = ('wall', *OBJECT_IMAGES, 'mob', 'visible')
+WALL_CHANNEL = 0
+MOB_CHANNEL = len(GRID_CHANNELS) - 2
+VISIBLE_CHANNEL = len(GRID_CHANNELS) - 1
+
+
+class EgocentricGrid():
+    """ Symbolic k×k view centered on the avatar, as a (channels, k, k) uint8 array of 0/1 flags.
+
+    It is cut with NumPy slicing from a copy of the world grids padded by k // 2 tiles (outside of the map counts
+    as wall), so no rendering is involved. The wall channel is static, and the object and mob channels only update
+    the cells of the sprites that moved, appeared or disappeared since the last observation. The visibility (line
+    of sight from the avatar against the walls, within the field of view) only depends on the walls, so the masks
+    of the most recently visited tiles are cached in the shared world assets. The map of a streamed world is not
+    copied: every window is cut from the walls of the bundle and filled with the sprites of the chunks loaded """
+
+    def __init__(self, size=11):
+        if size % 2 == 0:
+            raise ValueError(f"The size of the egocentric grid must be odd, got {size}")
+        self.size = size
+        self.radius = size // 2
+        self.object_channels = {object: channel for channel, object in enumerate(GRID_CHANNELS) if object in OBJECT_IMAGES}
+        self.game = None
+        self.world = None
+
+    @property
+    def shape(self):
+        return (len(GRID_CHANNELS), self.size, self.size)
+
+    def reset(self, game):
+        self.game = game
+        if game.world is None:
+            self.world = np.zeros((VISIBLE_CHANNEL, *(np.array(game.obstacle_grid.shape) + 2 * self.radius)), dtype=np.uint8)
+            self.world[WALL_CHANNEL] = np.pad(game.obstacle_grid, self.radius, constant_values=True)
+        else:
+            self.world = None
+        self.visibility = game.assets.visibility_cache.setdefault(self.size, LRUCache(VISIBILITY_CACHE_SIZE, None))
+        self.marked = set()
+
+    def observe(self, avatar):
+        if self.world is None:
+            obs = self._streamed_window(avatar)
+        else:
+            obs = self._window(avatar)
+        key = (avatar.row, avatar.col)
+        visible = self.visibility.get(key)
+        if visible is None:
+            visible = self.visibility.put(key, self._visibility(obs[WALL_CHANNEL]))
+        obs[VISIBLE_CHANNEL] = visible
+        return obs
+
+    def _window(self, avatar):
+        # Dynamic channels of the padded world, only the cells that changed since the last observation
+        marked = {(self.object_channels[object.type], object.row + self.radius, object.col + self.radius) for object in self.game.object_sprites}
+        marked.update((MOB_CHANNEL, mob.row + self.radius, mob.col + self.radius) for mob in self.game.mob_sprites)
+        for cell in self.marked - marked:
+            self.world[cell] = 0
+        for cell in marked - self.marked:
+            self.world[cell] = 1
+        self.marked = marked
+
+        # Window around the avatar (the padding shifts the indices by the radius)
+        obs = np.empty(self.shape, dtype=np.uint8)
+        obs[:VISIBLE_CHANNEL] = self.world[:, avatar.row:avatar.row + self.size, avatar.col:avatar.col + self.size]
+        return obs
+
+    def _streamed_window(self, avatar):
+        # Walls of the window inside the map, the rest counts as wall
+        walls = self.game.obstacle_grid
+        row0, col0 = avatar.row - self.radius, avatar.col - self.radius
+        top, left = max(0, row0), max(0, col0)
+        bottom, right = min(walls.shape[0], row0 + self.size), min(walls.shape[1], col0 + self.size)
+        obs = np.zeros(self.shape, dtype=np.uint8)
+        obs[WALL_CHANNEL] = 1
+        obs[WALL_CHANNEL, top - row0:bottom - row0, left - col0:right - col0] = walls[top:bottom, left:right] != 0
+
+        # Objects and mobs of the window, all of them in the chunks loaded around the avatar
+        for sprite in (*self.game.object_sprites, *self.game.mob_sprites):
+            row, col = sprite.row - row0, sprite.col - col0
+            if 0 <= row < self.size and 0 <= col < self.size:
+                obs[self.object_channels[sprite.type] if sprite in self.game.object_sprites else MOB_CHANNEL, row, col] = 1
+        return obs
+
+    def _visibility(self, walls):
+        # Segments from the center of the avatar tile to the center of every tile of the window, in tiles
+        tilesize = self.game.tilesize
+        offsets = np.stack(np.mgrid[-self.radius:self.radius + 1, -self.radius:self.radius + 1], axis=-1).reshape(-1, 2)[:, ::-1]
+        ends = (offsets + 0.5) * tilesize
+        starts = np.full_like(ends, 0.5 * tilesize)
+        wall_tiles = np.flatnonzero(walls.reshape(-1))
+        rects = np.column_stack([offsets[wall_tiles] * tilesize, np.full((len(wall_tiles), 2), tilesize)])
+
+        # A wall tile does not hide itself
+        crossing = segments_crossing(starts, ends, rects)
+        crossing[wall_tiles, np.arange(len(wall_tiles))] = False
+        in_range = np.linalg.norm(offsets * tilesize, axis=1) <= self.game.field_of_view
+        return (~crossing.any(axis=1) & in_range).astype(np.uint8).reshape(self.size, self.size)
@@ -0,0 +1,215 @@
+import argparse
+import contextlib
+import importlib
+import json
+import numpy as np
+import os
+import random
+import sys
+
+from src.utils.actions import Action
+from src.utils.logger import LogLevel, StepLogger
+
+
+# Action trace of the gym environment test (tests/conftest.py)
+EXAMPLE_ACTIONS = (2, 0, 0, 0, 0, 2, 2, 2, 2, 2, 2, 2, 2, 6, 0, 0, 0, 6, 0, 0, 0, 6, 0, 0, 0,
+                   0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 2, 6, 3, 3, 3, 3, 3, 3, 3, 3, 3,
+                   3, 3, 3, 1, 1, 1, 3, 6, 1, 1, 1, 2, 6, 1, 1, 1, 2, 2, 2, 2, 2, 2, 0, 0, 0,
+                   6, 4, 4, 4, 4, 1, 1, 1, 3, 3, 3, 3, 3, 3, 0, 0, 0, 5, 3, 0, 0, 0, 5, 2, 0,
+                   0, 0, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 5, 2, 1, 1, 1, 1, 1, 1, 1, 1, 1,
+                   1, 1, 1, 3, 3, 3, 1, 1, 1, 1, 5, 1, 1, 1, 5, 1, 1, 1, 5, 8, 8, 8, 8, 8, 8,
+                   8, 8, 8, 8, 8, 8, 7)
+
+TRACES = ('example', 'random', 'controlled')
+
+
+def load_factory(path):
+    """ Env factory from a '<module>:<callable>' path, e.g. 'src.opengym.__main__:GymGame' """
+    module, name = path.split(':')
+    return getattr(importlib.import_module(module), name)
+
+
+class RandomStreams():
+    """ Independent streams of the global random module, one per name. The game draws its spawns from the global
+    generator, so each env (and the policy of the trace) runs inside its own stream: the reference and the
+    candidate see the same random numbers however the other one or the policy consume theirs """
+
+    def __init__(self, names, seed):
+        random.seed(seed)
+        self.states = {name: random.getstate() for name in names}
+
+    @contextlib.contextmanager
+    def use(self, name):
+        random.setstate(self.states[name])
+        try:
+            yield
+        finally:
+            self.states[name] = random.getstate()
+
+
+def make_trace(name, env, seed):
+    """ Policy of a trace as a function of the action mask of the reference env. It returns None when the trace is
+    over. The invalid actions of the example trace fall back to standing still, as in the gym environment test """
+    if name == 'example':
+        actions = iter(EXAMPLE_ACTIONS)
+        def next_action(mask):
+            action = next(actions, None)
+            if action is not None and not mask[action]:
+                action = Action.STAND_STILL.value
+            return action
+    elif name == 'random':
+        generator = random.Random(seed)
+        def next_action(mask):
+            return generator.choice(np.flatnonzero(mask).tolist())
+    elif name == 'controlled':
+        from src.rl_algorithms.controlled import ControlledAlgorithm
+        policy = ControlledAlgorithm(env, logger=StepLogger(LogLevel.SILENT))
+        def next_action(mask):
+            return policy.select_action(env.state)
+    else:
+        raise ValueError(f"Unknown trace '{name}', expected one of {TRACES}")
+    return next_action
+
+
+def dump_state(env):
+    """ Full state of the world of a GymGame as plain Python values """
+    game = env.game
+    return {"ticks": getattr(game, 'ticks', None),
+            "days": game.days,
+            "hours": game.hours,
+            "environment_temperature": game.environment_temperature,
+            "episodic_step": env.episodic_step,
+            "episodic_return": env.episodic_return,
+            "on_water_source": game.on_water_source,
+            "hitted_object": None if game.hitted_object is None else [game.hitted_object.type, game.hitted_object.col, game.hitted_object.row],
+            "avatars": [{"col": avatar.col,
+                         "row": avatar.row,
+                         "inventory": list(avatar.inventory),
+                         "memory": {key: list(value) for key, value in avatar.memory.items()},
+                         "drives": {key: getattr(avatar.drives, key) for key in ("stored_energy", "water", "hunger", "thirst", "sleepiness",
+                                                                                 "biological_clock", "internal_state", "resolved_state",
+                                                                                 "perceived_temperature", "basal_metabolic_rate")}
+                         } for avatar in game.avatar_sprites],
+            "objects": sorted([object.type, object.col, object.row] for object in game.object_sprites),
+            "mobs": sorted([mob.col, mob.row] for mob in game.mob_sprites),
+            "objects_at_sight": sorted([object.type, object.col, object.row] for object in game.sight_objects)
+            }
+
+
+def _equal(reference, candidate, atol):
+    reference, candidate = np.asarray(reference), np.asarray(candidate)
+    if reference.shape != candidate.shape:
+        return False
+    if atol == 0:
+        return np.array_equal(reference, candidate)
+    return np.allclose(reference, candidate, rtol=0, atol=atol)
+
+
+def compare_step(reference, candidate, atol=0):
+    """ Fields (obs/<key>, reward, done, mask) whose values differ between two (obs, reward, done, mask) tuples """
+    (obs_ref, reward_ref, done_ref, mask_ref), (obs_cand, reward_cand, done_cand, mask_cand) = reference, candidate
+    differences = {}
+    for key in sorted(set(obs_ref) | set(obs_cand)):
+        if key not in obs_ref or key not in obs_cand or not _equal(obs_ref[key], obs_cand[key], atol):
+            differences[f"obs/{key}"] = (obs_ref.get(key), obs_cand.get(key))
+    if reward_ref is not None and not _equal(reward_ref, reward_cand, atol):
+        differences["reward"] = (reward_ref, reward_cand)
+    if done_ref != done_cand:
+        differences["done"] = (done_ref, done_cand)
+    if not _equal(mask_ref, mask_cand, 0):
+        differences["mask"] = (mask_ref, mask_cand)
+    return differences
+
+
+def run_lockstep(reference, candidate, trace='random', seed=0, max_steps=10000, atol=0):
+    """ Drives the <reference> and <candidate> envs in lockstep from the same seed with the actions of <trace>
+    (chosen on the reference env) and stops at the first divergence of obs, reward, done or action mask.
+
+    It returns the number of steps run, the actions taken and, if they diverged, the step, the differing fields
+    and the state dumps of both envs at that point """
+    global_state = random.getstate()
+    streams = RandomStreams(('reference', 'candidate', 'policy'), seed)
+    try:
+        with streams.use('policy'):
+            next_action = make_trace(trace, reference, seed)
+        with streams.use('reference'):
+            obs_ref = reference.reset(seed=seed)
+            step_ref = (obs_ref, None, False, np.asarray(reference.valid_action_mask()))
+        with streams.use('candidate'):
+            obs_cand = candidate.reset(seed=seed)
+            step_cand = (obs_cand, None, False, np.asarray(candidate.valid_action_mask()))
+
+        actions = []
+        step = 0
+        while True:
+            differences = compare_step(step_ref, step_cand, atol)
+            if differences:
+                return {"trace": trace, "seed": seed, "steps": step, "actions": actions,
+                        "divergence": {"step": step,
+                                       "action": actions[-1] if actions else None,
+                                       "fields": differences,
+                                       "reference_state": dump_state(reference),
+                                       "candidate_state": dump_state(candidate)
+                                       }
+                        }
+            if step_ref[2] or step >= max_steps:
+                break
+            with streams.use('policy'):
+                action = next_action(step_ref[3])
+            if action is None:
+                break
+            actions.append(int(action))
+            with streams.use('reference'):
+                obs, reward, done, _ = reference.step(action)
+                step_ref = (obs, reward, done, np.asarray(reference.valid_action_mask()))
+            with streams.use('candidate'):
+                obs, reward, done, _ = candidate.step(action)
+                step_cand = (obs, reward, done, np.asarray(candidate.valid_action_mask()))
+            step += 1
+        return {"trace": trace, "seed": seed, "steps": step, "actions": actions, "divergence": None}
+    finally:
+        random.setstate(global_state)
+
+
+def check_equivalence(reference_factory, candidate_factory, traces=TRACES, seeds=(0,), max_steps=10000, atol=0):
+    """ Runs every trace over every seed and returns the report of each run (see run_lockstep) """
+    reference, candidate = reference_factory(), candidate_factory()
+    return [run_lockstep(reference, candidate, trace, seed, max_steps, atol) for trace in traces for seed in seeds]
+
+
+def format_divergence(report):
+    divergence = report["divergence"]
+    lines = [f"[EQUIVALENCE INFO] '{report['trace']}' trace, seed {report['seed']}: diverged at step {divergence['step']}"
+             f" after action {Action(divergence['action']).name if divergence['action'] is not None else None}",
+             f"[EQUIVALENCE INFO] Actions up to the divergence: {report['actions']}"]
+    for field, (reference, candidate) in divergence["fields"].items():
+        lines.append(f"[EQUIVALENCE INFO] {field}\n    reference: {np.asarray(reference).tolist()}\n    candidate: {np.asarray(candidate).tolist()}")
+    for name in ("reference_state", "candidate_state"):
+        lines.append(f"[EQUIVALENCE INFO] {name.replace('_', ' ').capitalize()}:\n{json.dumps(divergence[name], indent=2, default=str)}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Equivalence harness',
+                                     description='Runs a reference and a candidate env in lockstep and reports the first divergence.')
+    parser.add_argument('-c', '--candidate', required=True, help='Factory of the candidate env, as <module>:<callable>')
+    parser.add_argument('-r', '--reference', default='src.opengym.__main__:GymGame', help='Factory of the reference env, as <module>:<callable>')
+    parser.add_argument('-t', '--traces', nargs='+', choices=TRACES, default=list(TRACES), help='Action traces to run')
+    parser.add_argument('-s', '--seeds', type=int, default=5, help='Number of seeds of every trace')
+    parser.add_argument('--max-steps', type=int, default=10000, help='Maximum number of steps of every run')
+    parser.add_argument('--atol', type=float, default=0, help='Absolute tolerance of the float comparisons (exact by default)')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    reports = check_equivalence(load_factory(args.reference), load_factory(args.candidate), args.traces, range(args.seeds), args.max_steps, args.atol)
+    print(f"\nEQUIVALENCE\n")
+    print(f"{'Trace':{25}} {'Seed':{25}} {'Steps':{25}} {'Result':{25}}")
+    for report in reports:
+        print(f"{report['trace']:{25}} {report['seed']:<{25}} {report['steps']:<{25}} {'equivalent' if report['divergence'] is None else 'DIVERGED':{25}}")
+    diverged = [report for report in reports if report["divergence"] is not None]
+    if diverged:
+        print()
+        print(format_divergence(diverged[0]))
+        sys.exit(1)
@@ -0,0 +1,221 @@
+import numpy as np
+import random
+
+from gym import spaces
+
+from src.opengym.__main__ import make_observation_space
+from src.pygame.__main__ import Game
+from src.pygame.settings import CONSUMABLES, PICKABLE_ITEMS
+from src.utils.actions import Action
+from src.utils.geometry import segments_blocked
+
+
+MOVEMENTS = {Action.RIGHT.value: (1, 0),
+             Action.LEFT.value: (-1, 0),
+             Action.DOWN.value: (0, 1),
+             Action.UP.value: (0, -1)
+             }
+
+
+class ParallelGymGame():
+    """ PettingZoo-style parallel multi-agent environment on top of a single Game.
+
+    All the avatars act simultaneously. Observations, action masks, rewards and dones are returned as arrays stacked
+    on the first axis (one row per agent, in the order of <possible_agents>). The shared world work (clock, spawning,
+    objects and line of sight against the shared wall data) runs once per tick for all the agents. """
+
+    def __init__(self, n_agents=2):
+        self.game = Game()
+        self.n_agents = n_agents
+        self.possible_agents = [f"avatar_{i}" for i in range(n_agents)]
+        self.agents = []
+        self.single_action_space = spaces.Discrete(len(Action))
+        self.single_observation_space = make_observation_space()
+
+    def observation_space(self, agent):
+        return self.single_observation_space
+
+    def action_space(self, agent):
+        return self.single_action_space
+
+    def reset(self, seed=None):
+        if seed is not None:
+            random.seed(seed)
+        self.game.new(n_avatars=self.n_agents)
+
+        # The clock advances once per tick for all the avatars
+        self.game.deferred_clock = True
+        self.avatars = list(self.game.avatar_sprites)
+        self.agents = list(self.possible_agents)
+
+        # Tiles that can not be entered (padded so the borders of the map are blocked too). The mobs of a streamed
+        # map come and go with their chunks, so its tiles are looked up instead (see Game.is_blocked)
+        if self.game.world is None:
+            self._blocked = np.pad(self.game.obstacle_grid, 1, constant_values=True)
+            for mob in self.game.mob_sprites:
+                self._blocked[mob.row + 1, mob.col + 1] = True
+        else:
+            self._blocked = None
+
+        # Per agent state
+        self.on_object = [None] * self.n_agents
+        self.on_water_source = np.zeros(self.n_agents, dtype=bool)
+        self.objects_at_sight = np.zeros(self.n_agents, dtype=bool)
+        self.dones = np.zeros(self.n_agents, dtype=bool)
+        self.episodic_return = np.zeros(self.n_agents, dtype=np.float64)
+        self.episodic_step = 1
+
+        self._update_contacts()
+        self._update_sight()
+        self.game.camera.update(self.avatars[0])
+        return self._get_obs()
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int64).reshape(self.n_agents)
+        masks = self.valid_action_mask()
+
+        # Executes the action of every agent alive. Invalid actions fall back to standing still
+        elapsed = np.zeros(self.n_agents, dtype=np.float64)
+        for i, avatar in enumerate(self.avatars):
+            if self.dones[i]:
+                continue
+            action = actions[i] if masks[i, actions[i]] else Action.STAND_STILL.value
+            avatar.time_elapsed = 0
+            self._execute(i, avatar, action)
+            elapsed[i] = avatar.time_elapsed
+
+        # Update information on the game once per tick >>>>>>
+        self.game.advance_clock(elapsed.max())
+        self.game.stream_chunks()
+        self.game.spawn_random_objects()
+        self.game.update_environment_temperature()
+        for avatar in self.game.avatar_sprites:
+            avatar.drives.update_bmr(self.game.environment_temperature)
+        self._update_contacts()
+        for object in self.game.object_sprites:
+            object.update()
+        # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+        # Reward in terms of elapsed time and arousal values (negative impact), same as the single agent environment
+        hunger, thirst, sleepiness = self._drives('hunger', 'thirst', 'sleepiness')
+        drives_weight = elapsed * 1/3
+        drives_values = drives_weight * (hunger > 0.5) + drives_weight * (thirst > 0.5) + drives_weight * (sleepiness > 0.8)
+        rewards = np.where(self.dones, 0, elapsed - drives_values)
+        self.episodic_return += rewards
+        self.episodic_step += 1
+
+        # Update observation objects at sight
+        self._update_sight()
+        obs = self._get_obs()
+
+        # Conditions to end the episode of every agent
+        stored_energy, water = self._drives('stored_energy', 'water')
+        self.dones |= (stored_energy <= 0) | (water <= 0) | (sleepiness > 0.9)
+        for i, avatar in enumerate(self.avatars):
+            if self.dones[i] and avatar.alive():
+                avatar.kill()
+        self.agents = [agent for agent, done in zip(self.possible_agents, self.dones) if not done]
+        if self.agents:
+            self.game.camera.update(self.avatars[self.possible_agents.index(self.agents[0])])
+
+        infos = {"action_mask": self.valid_action_mask()}
+        return obs, rewards, self.dones.copy(), infos
+
+    def _execute(self, i, avatar, action):
+        if action in MOVEMENTS:
+            dx, dy = MOVEMENTS[action]
+            self._move(avatar, dx, dy)
+        elif action == Action.EAT.value:
+            avatar.eat()
+        elif action == Action.DRINK.value:
+            avatar.drink()
+        elif action == Action.PICK_UP.value:
+            # Another agent may have picked up the object earlier on this tick
+            if self.on_object[i] is not None and self.on_object[i].alive():
+                avatar.pick_up(self.on_object[i].type)
+                self.on_object[i].kill()
+            else:
+                avatar.stand_still()
+        elif action == Action.SLEEP.value:
+            avatar.sleep()
+        elif action == Action.STAND_STILL.value:
+            avatar.stand_still()
+
+    def _move(self, avatar, dx, dy):
+        # Same behaviour as Avatar.movement, checking collisions against the shared blocked grid
+        if not self._is_blocked(np.array([avatar.row + dy]), np.array([avatar.col + dx]))[0]:
+            avatar.col += dx
+            avatar.row += dy
+            avatar.update_position()
+            avatar.drives.run_action("movement")
+
+    def _is_blocked(self, rows, cols):
+        if self._blocked is None:
+            return np.array([self.game.is_blocked(col, row) for row, col in zip(rows.tolist(), cols.tolist())], dtype=bool)
+        return self._blocked[rows + 1, cols + 1]
+
+    def _update_contacts(self):
+        # Objects under every avatar, in the same order that sprite collisions would report them
+        contacts = {}
+        for object in self.game.object_sprites:
+            contacts.setdefault((object.col, object.row), []).append(object)
+        for i, avatar in enumerate(self.avatars):
+            hits = contacts.get((avatar.col, avatar.row), [])
+            self.on_object[i] = hits[-1] if hits else None
+            self.on_water_source[i] = any(hit.type == 'water-dispenser' for hit in hits)
+
+    def _update_sight(self):
+        # Line of sight from every avatar to every object and mob within the field of view
+        targets = list(self.game.object_sprites) + list(self.game.mob_sprites)
+        self.objects_at_sight[:] = False
+        if not targets:
+            return
+        avatar_centers = np.array([avatar.rect.center for avatar in self.avatars], dtype=np.float64)
+        target_centers = np.array([target.rect.center for target in targets], dtype=np.float64)
+        distances = np.linalg.norm(avatar_centers[:, None, :] - target_centers[None, :, :], axis=2)
+        pairs_avatar, pairs_target = np.nonzero((distances <= self.game.field_of_view) & ~self.dones[:, None])
+        blocked = segments_blocked(avatar_centers[pairs_avatar], target_centers[pairs_target], self.game.wall_rects)
+        self.objects_at_sight[pairs_avatar[~blocked]] = True
+
+    def _drives(self, *names):
+        return [np.array([getattr(avatar.drives, name) for avatar in self.avatars], dtype=np.float64) for name in names]
+
+    def _get_obs(self):
+        temperature, stored_energy, water, sleepiness = self._drives('perceived_temperature', 'stored_energy', 'water', 'sleepiness')
+        return {"environment_temperature": self.game._normalize_value(temperature, 20, 40).astype(np.float32)[:, None],
+                "energy_stored": self.game._normalize_value(stored_energy, 0, 4000).astype(np.float32)[:, None],
+                "water_stored": self.game._normalize_value(water, 0, 4).astype(np.float32)[:, None],
+                "sleepiness": sleepiness.astype(np.float32)[:, None],
+                "objects_at_sight": self.objects_at_sight.astype(np.int32)[:, None],
+                "objects_on_inventory": np.array([[int(bool(avatar.inventory))] for avatar in self.avatars], dtype=np.int32),
+                "on_water_source": self.on_water_source.astype(np.int32)[:, None],
+                "on_object": np.array([[int(object is not None)] for object in self.on_object], dtype=np.int32)
+                }
+
+    def valid_action_mask(self):
+        "It returns the stacked invalid action masks. True if the action is valid, False otherwise"
+        masks = np.zeros((self.n_agents, len(Action)), dtype=bool)
+        rows = np.array([avatar.row for avatar in self.avatars])
+        cols = np.array([avatar.col for avatar in self.avatars])
+        for action, (dx, dy) in MOVEMENTS.items():
+            masks[:, action] = ~self._is_blocked(rows + dy, cols + dx)
+        for i, avatar in enumerate(self.avatars):
+            masks[i, Action.EAT.value] = (avatar.drives.stored_energy < avatar.drives.basal_energy and
+                                          any(o in CONSUMABLES for o in avatar.inventory))
+            masks[i, Action.DRINK.value] = (self.on_water_source[i] and 'cup' in avatar.inventory and
+                                            avatar.drives.water < avatar.drives.basal_water)
+            masks[i, Action.PICK_UP.value] = (self.on_object[i] is not None and len(avatar.inventory) <= 4 and
+                                              self.on_object[i].type in PICKABLE_ITEMS)
+            masks[i, Action.SLEEP.value] = avatar.drives.sleepiness >= 0.2
+        masks[:, Action.STAND_STILL.value] = True
+
+        # Agents whose episode is over can only stand still
+        masks[self.dones] = False
+        masks[self.dones, Action.STAND_STILL.value] = True
+        return masks
+
+    def render(self):
+        return self.game.draw_window()
+
+    def close(self):
+        pass
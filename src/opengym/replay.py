@@ -0,0 +1,151 @@
+import argparse
+import collections
+import glob
+import json
+import os
+import shutil
+import subprocess
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Environment of every worker process of the renderer, built once and reused across recordings
+_WORKER = {}
+
+
+def make_recording(env, seed, actions, policy=None):
+    """ Minimal log of the episode just run on <env> from reset(seed=<seed>): the seed, the actions and the objects
+    spawned during the episode. The initial objects come from the seed and nothing else in the world is random, so
+    this is enough to re-simulate the episode whatever random numbers the policy consumed """
+    return {"policy": policy,
+            "seed": seed,
+            "grid_size": None if env.grid is None else env.grid.size,
+            "actions": [int(action) for action in actions],
+            "spawns": [list(spawn) for spawn in env.game.spawn_log],
+            "episodic_return": float(env.episodic_return),
+            "ticks": env.game.ticks
+            }
+
+
+def save_recording(recording, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(recording, f)
+    return path
+
+
+def load_recording(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def replay(env, recording):
+    """ Re-simulates a recorded episode on <env> with the recorded spawns instead of random ones. It yields after the
+    reset and after every step, with the env in the state of that step """
+    env.reset(seed=recording["seed"])
+    env.game.scripted_spawns = collections.deque(tuple(spawn) for spawn in recording["spawns"])
+    yield env
+    for action in recording["actions"]:
+        env.step(action)
+        yield env
+    env.game.scripted_spawns = None
+    if abs(env.episodic_return - recording["episodic_return"]) > 1e-6 or env.game.ticks != recording["ticks"]:
+        raise RuntimeError(f"The replay diverged from the recording: return {env.episodic_return} at tick {env.game.ticks}, "
+                           f"recorded {recording['episodic_return']} at tick {recording['ticks']}")
+
+
+def _init_worker():
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    from src.opengym.__main__ import GymGame
+    _WORKER['envs'] = {}
+    _WORKER['GymGame'] = GymGame
+
+
+def _get_env(grid_size):
+    if 'envs' not in _WORKER:
+        _init_worker()
+    if grid_size not in _WORKER['envs']:
+        _WORKER['envs'][grid_size] = _WORKER['GymGame'](grid_size)
+    return _WORKER['envs'][grid_size]
+
+
+def render_recording(path, output, every=1, video=False, fps=10):
+    """ Renders a recording headless, one frame every <every> steps: a PNG sequence in the <output> folder or, with
+    <video>, an MP4 file encoded by ffmpeg. It returns the number of frames rendered """
+    import pygame
+    recording = load_recording(path)
+    env = _get_env(recording["grid_size"])
+    encoder = None
+    if video:
+        if shutil.which('ffmpeg') is None:
+            raise RuntimeError("ffmpeg is required to render videos, render PNG frames instead")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        width, height = env.game.width, env.game.height
+        encoder = subprocess.Popen(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{width}x{height}",
+                                    '-r', str(fps), '-i', '-', '-pix_fmt', 'yuv420p', output], stdin=subprocess.PIPE)
+    else:
+        os.makedirs(output, exist_ok=True)
+
+    frames = 0
+    try:
+        for step, env in enumerate(replay(env, recording)):
+            if step % every and step != len(recording["actions"]):
+                continue
+            env.render()
+            if encoder is not None:
+                encoder.stdin.write(pygame.image.tostring(env.game.window, 'RGB'))
+            else:
+                pygame.image.save(env.game.window, os.path.join(output, f"{step:06d}.png"))
+            frames += 1
+    finally:
+        if encoder is not None:
+            encoder.stdin.close()
+            encoder.wait()
+    return frames
+
+
+def _render_recording(task):
+    path, output, every, video, fps = task
+    start = time.perf_counter()
+    frames = render_recording(path, output, every, video, fps)
+    return {"recording": path, "output": output, "frames": frames, "time_s": time.perf_counter() - start}
+
+
+def render_recordings(paths, output_dir, n_workers=None, every=1, video=False, fps=10):
+    """ Renders every recording across a pool of <n_workers> processes, to <output_dir>/<name> (frames) or
+    <output_dir>/<name>.mp4 (video) """
+    tasks = []
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        tasks.append((path, os.path.join(output_dir, name + '.mp4' if video else name), every, video, fps))
+    n_workers = n_workers or os.cpu_count()
+
+    # The workers are forked after loading the world assets, so they share them instead of loading a copy each
+    from src.pygame.assets import preload_world_assets
+    preload_world_assets()
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) as executor:
+        return list(executor.map(_render_recording, tasks))
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Replay renderer',
+                                     description='Re-simulates recorded episodes and renders them headless to PNG frames or videos across a pool of processes.')
+    parser.add_argument('recordings', nargs='+', help='Recordings (.json files or folders of them), e.g. written by the evaluation harness with --record')
+    parser.add_argument('-o', '--output', default='replays', help='Folder of the rendered episodes')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes (all the CPUs by default)')
+    parser.add_argument('--every', type=int, default=1, help='Renders one frame every <every> steps')
+    parser.add_argument('--video', action='store_true', help='Encodes every episode to MP4 with ffmpeg instead of writing PNG frames')
+    parser.add_argument('--fps', type=int, default=10, help='Frames per second of the videos')
+    args = parser.parse_args()
+
+    paths = []
+    for recording in args.recordings:
+        paths.extend(sorted(glob.glob(os.path.join(recording, '*.json'))) if os.path.isdir(recording) else [recording])
+    start = time.perf_counter()
+    results = render_recordings(paths, args.output, args.workers, args.every, args.video, args.fps)
+    for result in results:
+        print(f"[REPLAY INFO] {result['recording']} -> {result['output']} ({result['frames']} frames, {result['time_s']:.1f} s)")
+    print(f"[REPLAY INFO] {len(results)} episodes rendered in {time.perf_counter() - start:.1f} s")
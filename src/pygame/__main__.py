@@ -5,12 +5,18 @@ import pytweening
 import os
 import sys
 
-from random import choice, random
+from random import choice, random, randrange
 
+from src.pygame.assets import get_world_assets
+from src.pygame.chunks import ChunkedEntities
 from src.pygame.hud import draw_text_on_screen, draw_drive_on_screen, draw_text_on_rectangle, get_text_info
+from src.pygame.mapbundle import SPAWN_AVATAR, SPAWN_MOB, SPAWN_OBJECT, SPAWN_WALL
 from src.pygame.settings import *
+from src.pygame.spawning import EventCalendar
 from src.pygame.sprites import Avatar, Mob, Object, Wall, Obstacle
-from src.pygame.tilemap import Map, Camera, TiledMap, Spot
+from src.pygame.tilemap import Map, Camera, TiledMap
+from src.pygame.walls import WallMesh
+from src.utils.pathfinding import HierarchicalPathfinder, grid_lookup
 
 
 class Game():
@@ -29,39 +35,33 @@ class Game():
         # self.timer = pygame.time.get_ticks()
 
     def load_data(self):
-        # Paths
-        assets_folder = os.path.join(ROOT_PROJECT_PATH, ASSETS_DIRECTORY_NAME)
-        config_folder = os.path.join(ROOT_PROJECT_PATH, CONFIG_DIRECTORY_NAME)
+        # Immutable assets are loaded once per process and shared by all the games (see src/pygame/assets.py)
+        self.assets = get_world_assets(self.width, self.height, self.tilesize, self.field_of_view)
 
         # Charge map
-        if USE_TILED_MAP:
-            self.map = TiledMap(os.path.join(ROOT_PROJECT_PATH, os.path.join(config_folder, TILEDMAP_FILE)))
-            self.map_img = self.map.make_map()
+        self.map = self.assets.map
+        self.world = self.assets.world
+        if isinstance(self.map, TiledMap) and self.world is None:
+            self.map_img = self.assets.map_img
             self.map_rect = self.map_img.get_rect()
-        else:
-            self.map = Map(os.path.join(ROOT_PROJECT_PATH, os.path.join(config_folder, MAP_FILE)))
-        
+
         # Charge general assets
-        self.avatar_img = pygame.transform.scale(pygame.image.load(os.path.join(assets_folder, AVATAR)).convert_alpha(), (self.tilesize, self.tilesize))
-        self.mob_img = pygame.transform.scale(pygame.image.load(os.path.join(assets_folder, SPIDER)).convert_alpha(), (self.tilesize, self.tilesize))
-        self.wall_img = pygame.transform.scale(pygame.image.load(os.path.join(assets_folder, WALL)).convert_alpha(), (self.tilesize, self.tilesize))
+        self.avatar_img = self.assets.avatar_img
+        self.mob_img = self.assets.mob_img
+        self.wall_img = self.assets.wall_img
 
         # Charge object assets
-        self.object_images = {}
-        for object in OBJECT_IMAGES:
-            self.object_images[object] = pygame.transform.scale(pygame.image.load(os.path.join(assets_folder, OBJECT_IMAGES[object])).convert_alpha(), (self.tilesize, self.tilesize))
+        self.object_images = self.assets.object_images
 
         # Lighting effect
-        self.fog = pygame.Surface((self.width, self.height))
-        self.fog.fill(NIGHT_VISION)
-        self.light_mask = pygame.transform.scale(pygame.image.load(os.path.join(assets_folder, LIGHT_MASK)).convert_alpha(), (self.field_of_view * 2.35, self.field_of_view * 2.35))
+        self.fog = self.assets.fog
+        self.light_mask = self.assets.light_mask
         self.light_rect = self.light_mask.get_rect()
 
         # Dim screen effect
-        self.dim_screen = pygame.Surface(self.window.get_size()).convert_alpha()
-        self.dim_screen.fill((0, 0, 0, 180))
+        self.dim_screen = self.assets.dim_screen
 
-    def new(self):
+    def new(self, n_avatars=1):
         # Load all initial data
         self.load_data()
 
@@ -71,9 +71,9 @@ class Game():
         # Set the pause mode
         self.paused = False
 
-        # Set time
-        self.hours = 0
-        self.days = 0
+        # Set time (integer ticks of the game clock)
+        self.ticks = 0
+        self.deferred_clock = False
 
         # Set day/night cycle conditions
         self.environment_temperature = ENVIRONMENT_TEMPERATURE
@@ -89,11 +89,16 @@ class Game():
         self.avatar_sprites = pygame.sprite.Group()
         self.mob_sprites = pygame.sprite.Group()
         self.object_sprites = pygame.sprite.Group()
-        self.wall_sprites = pygame.sprite.Group()
+        self.wall_sprites = [] # Walls are static, so a plain list is enough
 
         # Set spawn coordinates
         self.spawn_coordinates = []
 
+        # Objects spawned during the episode as (ticks, col, row, name), and the recorded spawns that replace the
+        # random ones when an episode is replayed (see src/opengym/replay.py)
+        self.spawn_log = []
+        self.scripted_spawns = None
+
         if isinstance(self.map, Map):
             # This option is deprecated. Need update
             for row, line in enumerate(self.map.data):
@@ -115,37 +120,44 @@ class Game():
                         Object(self, col, row, 'fire')
                     elif tile == '=':
                         Wall(self, col, row)
+            self.obstacle_grid = np.zeros((self.map.tileheight, self.map.tilewidth), dtype=bool)
+            for wall in self.wall_sprites:
+                self.obstacle_grid[wall.row, wall.col] = True
+            self.get_wall_mesh()
+        elif self.world is not None:
+            # Streamed map: the objects and mobs are created chunk by chunk around the avatars (see
+            # src/pygame/chunks.py), and the walls stay in the bundle
+            self.graph_map = None
+            self.obstacle_grid = self.assets.obstacle_grid
+            for x, y in self.map.bundle.avatar_start.tolist()[:n_avatars]:
+                Avatar(self, int(x) // self.tilesize, int(y) // self.tilesize)
+
+            # Place additional avatars on random free tiles of the map
+            while n_avatars > len(self.avatar_sprites):
+                col, row = randrange(self.world.cols), randrange(self.world.rows)
+                if not self.world.is_blocked(col, row):
+                    Avatar(self, col, row)
+
+            self.wall_mesh = self.world.wall_mesh
+            self.entities = ChunkedEntities(self, self.world)
+            self.active_chunks = None
         elif isinstance(self.map, TiledMap):
-            # Build graph map
+            # Graph map and obstacle grid are shared world assets
             current_objects = set()
-            n_objects = 0
-            self.graph_map = []
-            total_rows = self.map.tmxdata.height
-            total_cols = self.map.tmxdata.width
-            for _ in range(total_rows):
-                self.graph_map.append([])
-            for layer in self.map.tmxdata.visible_layers:
-                for tile in layer.tiles(): # tile[0] es la x = col, tile[1] es la y = row
-                    self.graph_map[tile[1]].append(Spot(tile[1], tile[0], TILESIZE, TILESIZE, total_rows, total_cols))
-                break
-            for tile_object in self.map.tmxdata.objects:
-                if tile_object.name == 'wall':
-                    self.graph_map[int(tile_object.y / tile_object.height)][int(tile_object.x / tile_object.width)].make_obstacle()
-                if tile_object.name == 'object':
-                    n_objects += 1
-
-            # Update neighbors of the graph map (edges)
-            for row in self.graph_map:
-                for spot in row:
-                    spot.update_neighbors(self.graph_map)
+            self.graph_map = self.assets.graph_map
+            self.obstacle_grid = self.assets.obstacle_grid
+            spawns = self.map.bundle.spawns.tolist()
+            n_objects = sum(1 for spawn in spawns if spawn[0] == SPAWN_OBJECT)
 
             # Place objects on the map
-            for tile_object in self.map.tmxdata.objects:
-                if tile_object.name == 'avatar':
-                    Avatar(self, tile_object.x, tile_object.y)
-                elif tile_object.name == 'mob':
-                    Mob(self, tile_object.x, tile_object.y)
-                elif tile_object.name == 'object':
+            for kind, x, y, width, height in spawns:
+                # Spawn slots are given in pixels, the entities are placed in tiles
+                col, row = int(x) // self.tilesize, int(y) // self.tilesize
+                if kind == SPAWN_AVATAR:
+                    Avatar(self, col, row)
+                elif kind == SPAWN_MOB:
+                    Mob(self, col, row)
+                elif kind == SPAWN_OBJECT:
                     random_object = choice(RANDOM_INIT)
                     for object in self.object_sprites:
                         current_objects.add(object.type)
@@ -159,24 +171,40 @@ class Game():
                             if item not in current_objects:
                                 random_object = item
                                 break
-                    Object(self, tile_object.x, tile_object.y, random_object)
+                    Object(self, col, row, random_object)
                     if random_object in CONSUMABLES:
-                        self.spawn_coordinates.append([tile_object.x, tile_object.y])
-                elif tile_object.name == 'wall':
-                    Obstacle(self, tile_object.x, tile_object.y, tile_object.width, tile_object.height)
-
-        # Set max items
-        self.max_items = len(self.object_sprites)
-
-        # Set countdown for spawn objects
-        self.n_trials = 0
-        self.countdown = 0
+                        self.spawn_coordinates.append([col, row])
+                elif kind == SPAWN_WALL:
+                    Obstacle(self, col, row, width, height)
+
+            # Place additional avatars on random free tiles of the map
+            if n_avatars > len(self.avatar_sprites):
+                occupied_tiles = {(sprite.col, sprite.row) for sprite in self.all_sprites}
+                if self.graph_map is not None:
+                    free_tiles = [(spot.col, spot.row) for row in self.graph_map for spot in row
+                                  if not spot.is_obstacle() and (spot.col, spot.row) not in occupied_tiles]
+                else:
+                    free_tiles = [(col, row) for row, col in np.argwhere(self.obstacle_grid == 0).tolist() if (col, row) not in occupied_tiles]
+                for _ in range(n_avatars - len(self.avatar_sprites)):
+                    Avatar(self, *choice(free_tiles))
+
+            # Shared wall data (x, y, width, height) used by the line of sight tests
+            self.wall_rects = self.get_wall_mesh().as_array()
+
+        # Set max items (kept by the chunks loaded on a streamed map)
+        if self.world is None:
+            self.max_items = len(self.object_sprites)
+
+        # Schedule the spawn opportunities of common objects
+        self.calendar = EventCalendar()
+        self.calendar.schedule(SPAWN_INTERVAL * TICKS_PER_HOUR, 'spawn', period=SPAWN_INTERVAL * TICKS_PER_HOUR)
 
         # Debug for collisions mode
         self.draw_debug = False
 
         # Spawn camera
         self.camera = Camera(self.map.width, self.map.height)
+        self.stream_chunks()
 
     def events(self):
         """ Here place all general events of the game """
@@ -223,6 +251,7 @@ class Game():
 
             # Updates camera position in accordance with the entity
             self.camera.update(avatar)
+            self.stream_chunks()
 
             # Avatar hits an object
             hits = pygame.sprite.spritecollide(avatar, self.object_sprites, False)
@@ -230,56 +259,110 @@ class Game():
                 self.hit_interaction(hit)
             
             # Randomly spawn new objects at empty locations stochastically
-            self.n_trials = round(abs(self.time - self.hours), 1)
-            if self.n_trials >= 12:
-                self.n_trials = 24 - self.n_trials
-            if self.n_trials != 0:
-                rest = self.n_trials - math.floor(self.n_trials)
-            else:
-                rest = 0
-            self.countdown += rest
-            self.countdown = round(self.countdown, 1)
-            for _ in range(math.floor(self.n_trials)):
-                capacity_items = (len(self.object_sprites) - (len(UNIQUE_ITEMS) - 1)) / (self.max_items - (len(UNIQUE_ITEMS) - 1))
-                if random() < pytweening.easeInQuad(1-capacity_items):
-                    x_r, y_r = choice(self.spawn_coordinates)
-                    o_coordinates = []
-                    for o in self.object_sprites:
-                        if o.type in CONSUMABLES:
-                            o_coordinates.append([o.rect.x, o.rect.y])
-                    if (len(self.spawn_coordinates) == len(o_coordinates)):
-                        break
-                    while [int(x_r), int(y_r)] in o_coordinates:
-                        x_r, y_r = choice(self.spawn_coordinates)
-                    self.spawn_new_object(x_r, y_r, choice(COMMON_ITEMS))
-            if self.countdown >= 1:
-                for _ in range(math.floor(self.countdown)):
-                    capacity_items = (len(self.object_sprites) - (len(UNIQUE_ITEMS) - 1)) / (self.max_items - (len(UNIQUE_ITEMS) - 1))
-                    if random() < pytweening.easeInQuad(1-capacity_items):
-                        x_r, y_r = choice(self.spawn_coordinates)
-                        o_coordinates = []
-                        for o in self.object_sprites:
-                            if o.type in CONSUMABLES:
-                                o_coordinates.append([o.rect.x, o.rect.y])
-                        if (len(self.spawn_coordinates) == len(o_coordinates)):
-                            break
-                        while [int(x_r), int(y_r)] in o_coordinates:
-                            x_r, y_r = choice(self.spawn_coordinates)
-                        self.spawn_new_object(x_r, y_r, choice(COMMON_ITEMS))
-                self.countdown = 1 - math.floor(self.countdown)
-            self.n_trials = 0
+            self.spawn_random_objects()
 
             # Update day/night cycle conditions
-            if self.hours >= 22 or self.hours < 6:
-                self.environment_temperature = ENVIRONMENT_TEMPERATURE - 10
-            else:
-                self.environment_temperature = ENVIRONMENT_TEMPERATURE
+            self.update_environment_temperature()
             avatar.drives.update_bmr(self.environment_temperature)
         
         # Update objects
         for object in self.object_sprites:
             object.update()
 
+    def spawn_random_objects(self):
+        """ Runs the spawn opportunities of common objects that fell due since the last call (one per SPAWN_INTERVAL
+        of game time). Nothing is done until the next one is due, and a long action runs all of its opportunities """
+        if self.scripted_spawns is not None:
+            # Replay of a recorded episode
+            while self.scripted_spawns and self.scripted_spawns[0][0] <= self.ticks:
+                _, col, row, name = self.scripted_spawns.popleft()
+                self.spawn_new_object(col, row, name)
+            return
+        if self.ticks < self.calendar.next_tick:
+            return
+        for event, occurrences in self.calendar.pop_due(self.ticks):
+            if event == 'spawn':
+                for _ in range(occurrences):
+                    if not self.spawn_trial():
+                        break
+
+    def spawn_trial(self):
+        """ Stochastically spawns a common object at an empty location, less likely the more objects there are.
+        Returns False if every spawn location is taken """
+        if not self.spawn_coordinates:
+            return False
+        capacity_items = (len(self.object_sprites) - (len(UNIQUE_ITEMS) - 1)) / max(1, self.max_items - (len(UNIQUE_ITEMS) - 1))
+        if random() < pytweening.easeInQuad(1-capacity_items):
+            x_r, y_r = choice(self.spawn_coordinates)
+            o_coordinates = []
+            for o in self.object_sprites:
+                if o.type in CONSUMABLES:
+                    o_coordinates.append([o.col, o.row])
+            if (len(self.spawn_coordinates) == len(o_coordinates)):
+                return False
+            while [x_r, y_r] in o_coordinates:
+                x_r, y_r = choice(self.spawn_coordinates)
+            self.spawn_new_object(x_r, y_r, choice(COMMON_ITEMS))
+        return True
+
+    def update_environment_temperature(self):
+        """ Updates the environment temperature in accordance with the day/night cycle """
+        if self.hours >= 22 or self.hours < 6:
+            self.environment_temperature = ENVIRONMENT_TEMPERATURE - 10
+        else:
+            self.environment_temperature = ENVIRONMENT_TEMPERATURE
+
+    def advance_clock(self, quantity):
+        """ Advances the game time <quantity> hours """
+        self.ticks += round(quantity * TICKS_PER_HOUR)
+
+    @property
+    def hours(self):
+        """ Hour of the current day """
+        return (self.ticks % TICKS_PER_DAY) / TICKS_PER_HOUR
+
+    @property
+    def days(self):
+        return self.ticks // TICKS_PER_DAY
+
+    def stream_chunks(self):
+        """ Loads the objects and mobs of the chunks around the avatars of a streamed map, freeing those of the
+        chunks left behind, and keeps the wall data of the line of sight tests on the chunks in use """
+        if self.world is None:
+            return
+        active = self.entities.update()
+        if active != self.active_chunks:
+            self.active_chunks = active
+            self.wall_rects = self.wall_mesh.as_array(active)
+
+    def get_wall_mesh(self):
+        """ Walls merged into rectangles with their BVH (see src/pygame/walls.py), built once per process """
+        if self.assets.wall_mesh is None:
+            self.assets.wall_mesh = WallMesh(self.obstacle_grid, self.tilesize, {(wall.col, wall.row): wall.rect for wall in self.wall_sprites})
+        self.wall_mesh = self.assets.wall_mesh
+        return self.wall_mesh
+
+    def get_pathfinding(self, backend=PATHFINDING):
+        """ Wall lookup is_blocked(col, row) ('jps') or HierarchicalPathfinder ('hpa') of the map, built once per process """
+        if backend == 'hpa':
+            if self.assets.hierarchical_pathfinder is None:
+                self.assets.hierarchical_pathfinder = HierarchicalPathfinder(self.obstacle_grid, HPA_CLUSTER_SIZE)
+            return self.assets.hierarchical_pathfinder
+        if self.world is not None:
+            return self.world.is_blocked
+        if self.assets.wall_lookup is None:
+            self.assets.wall_lookup = grid_lookup(self.obstacle_grid)
+        return self.assets.wall_lookup
+
+    def is_blocked(self, col, row):
+        """ True if the tile can not be entered: outside of the map, walls or mobs """
+        if not (0 <= row < self.obstacle_grid.shape[0] and 0 <= col < self.obstacle_grid.shape[1]) or self.obstacle_grid[row, col]:
+            return True
+        for mob in self.mob_sprites:
+            if mob.col == col and mob.row == row:
+                return True
+        return False
+
     def hit_interaction(self, hit):
         self.hitted_object = hit
         if (hit.type == 'water-dispenser'):
@@ -309,9 +392,6 @@ class Game():
             # Setup fps
             self.clock.tick(self.fps)
 
-            # Setup time
-            self.time = self.hours
-
             # Events
             self.events()
 
@@ -322,29 +402,41 @@ class Game():
             # Draw the map
             self.draw_window()
 
-    def raycasting(self):
+    def raycasting(self, draw=True):
+        """ Objects and mobs at sight of the avatar. The lines of sight are drawn on the window with <draw>, the
+        headless steps skip them since every frame redraws the window from scratch """
         self.objects_on_sight = []
         self.sight_objects = {}
+        sight_cache = self.assets.sight_cache
         # Check to see if the avatar can see any objects or mobs
         def iterate_over(sprites):
             for sprite in sprites:
                 sprite_center = self.camera.apply(sprite).center
                 distance = math.sqrt((sprite_center[0]-avatar_center[0])**2 + (sprite_center[1]-avatar_center[1])**2)
                 if distance <= self.field_of_view:
-                    # Does the line <avatar> to <sprite> intersect any obstacles?
-                    line_of_sight = [avatar_center[0], avatar_center[1], sprite_center[0], sprite_center[1]]
-                    found = True
-                    for wall in self.wall_sprites:
-                    # is anyting walling the line-of-sight?
-                        intersection_points = self.line_rect_intersection_points(line_of_sight, self.camera.apply(wall))
-                        if (len(intersection_points) > 0):
-                            found = False
-                            break # seen already
+                    # Does the line <avatar> to <sprite> intersect any obstacles? (the walls never move, so the
+                    # answer only depends on the line in map pixels)
+                    offset_x, offset_y = self.camera.camera.topleft
+                    key = (avatar_center[0] - offset_x, avatar_center[1] - offset_y, sprite_center[0] - offset_x, sprite_center[1] - offset_y)
+                    found = sight_cache.get(key)
+                    if found is None:
+                        line_of_sight = [avatar_center[0], avatar_center[1], sprite_center[0], sprite_center[1]]
+                        found = True
+                        # Only the wall tiles of the merged rectangles near the line can wall it
+                        walls = self.wall_mesh.tiles_near_segment(*key)
+                        for wall in walls:
+                        # is anyting walling the line-of-sight?
+                            intersection_points = self.line_rect_intersection_points(line_of_sight, self.camera.apply_rect(wall))
+                            if (len(intersection_points) > 0):
+                                found = False
+                                break # seen already
+                        sight_cache.put(key, found)
                     if (found):
-                        pygame.draw.line(self.window, GREEN, avatar_center, sprite_center)
+                        if draw:
+                            pygame.draw.line(self.window, GREEN, avatar_center, sprite_center)
                         self.sight_objects.update({sprite: distance})
                         self.objects_on_sight.append(found)
-                    else:
+                    elif draw:
                         pygame.draw.line(self.window, RED, avatar_center, sprite_center)
 
         for avatar in self.avatar_sprites:
@@ -419,6 +511,8 @@ class Game():
         # Draw background
         if isinstance(self.map, Map):
             self.window.fill(WOOD)
+        elif self.world is not None:
+            self.world.draw_background(self.window, self.camera)
         elif isinstance(self.map, TiledMap):
             self.window.blit(self.map_img, self.camera.apply_rect(self.map_rect))
 
@@ -432,8 +526,8 @@ class Game():
                 pygame.draw.rect(self.window, CYAN, self.camera.apply_rect(sprite.rect), 1)
         if isinstance(self.map, TiledMap):
             if self.draw_debug:
-                for wall in self.wall_sprites:
-                    pygame.draw.rect(self.window, CYAN, self.camera.apply_rect(wall.rect), 1)
+                for rect in self.wall_mesh.rects:
+                    pygame.draw.rect(self.window, CYAN, self.camera.apply_rect(rect), 1)
 
         # Draw area of vision
         for avatar in self.avatar_sprites:
@@ -492,7 +586,7 @@ class Game():
 
     def _get_obs(self):
         for avatar in self.avatar_sprites:
-            return {#"avatar_position": np.array([avatar.pos.x, avatar.pos.y], dtype=np.int32),
+            return {#"avatar_position": np.array([avatar.col, avatar.row], dtype=np.int32),
                     "environment_temperature": np.array([self._normalize_value(avatar.drives.perceived_temperature, 20, 40)], dtype=np.float32),
                     "energy_stored": np.array([self._normalize_value(avatar.drives.stored_energy, 0, 4000)], dtype=np.float32),
                     "water_stored": np.array([self._normalize_value(avatar.drives.water, 0, 4)], dtype=np.float32),
@@ -507,8 +601,12 @@ class Game():
         # Min-max normalization
         return (value - min_range)/(max_range - min_range)
 
-    def spawn_new_object(self, x, y, name):
-        Object(self, x, y, name)
+    def spawn_new_object(self, col, row, name):
+        if self.world is not None:
+            self.entities.spawn(col, row, name)
+        else:
+            Object(self, col, row, name)
+        self.spawn_log.append((self.ticks, col, row, name))
 
 
 # ---------- Main algorithm -----------
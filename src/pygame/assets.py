@@ -0,0 +1,136 @@
+import numpy as np
+import os
+import pygame
+
+from src.pygame.chunks import ChunkedWorld, LRUCache
+from src.pygame.settings import *
+from src.pygame.tilemap import Map, TiledMap, Spot
+
+
+# World assets of the process, by (width, height, tilesize, field of view)
+_WORLD_ASSETS = {}
+
+# Video drivers without a shown display
+HEADLESS_DRIVERS = ('dummy', 'offscreen')
+
+
+class WorldAssets():
+    """ Immutable data of a world: map, path finding graph, obstacle grid, images and effect surfaces.
+
+    They are loaded once per process and shared by all its games, which must treat them as read-only. The fog is
+    the only exception: it is a scratch surface that every draw fills completely before using it. The background of
+    a TiledMap lives in the memory-mapped map bundle, so worker processes share it through the page cache, and the
+    rest is shared copy-on-write when the assets are loaded before forking (see preload_world_assets) """
+
+    def __init__(self, width, height, tilesize, field_of_view):
+        # Paths
+        assets_folder = os.path.join(ROOT_PROJECT_PATH, ASSETS_DIRECTORY_NAME)
+        config_folder = os.path.join(ROOT_PROJECT_PATH, CONFIG_DIRECTORY_NAME)
+
+        # Charge map
+        self.map_img = None
+        self.graph_map = None
+        self.obstacle_grid = None
+        self.world = None
+        if USE_TILED_MAP:
+            self.map = TiledMap(os.path.join(config_folder, TILEDMAP_FILE))
+            if CHUNKED_WORLD:
+                # Streamed map: background and navigation chunks are built on demand, the walls stay on disk
+                self.world = ChunkedWorld(self.map.bundle)
+                self.obstacle_grid = self.map.bundle.walls
+            else:
+                self.map_img = self.map.make_map()
+                if pygame.display.get_driver() not in HEADLESS_DRIVERS:
+                    # A shown display blits a copy in its own pixel format about twice as fast as the 24-bit
+                    # background of the bundle, which headless processes keep memory-mapped and shared
+                    self.map_img = self.map_img.convert()
+                self.build_graph_map(tilesize)
+        else:
+            self.map = Map(os.path.join(config_folder, MAP_FILE))
+
+        # Charge general assets
+        self.avatar_img = pygame.transform.scale(pygame.image.load(os.path.join(assets_folder, AVATAR)).convert_alpha(), (tilesize, tilesize))
+        self.mob_img = pygame.transform.scale(pygame.image.load(os.path.join(assets_folder, SPIDER)).convert_alpha(), (tilesize, tilesize))
+        self.wall_img = pygame.transform.scale(pygame.image.load(os.path.join(assets_folder, WALL)).convert_alpha(), (tilesize, tilesize))
+
+        # Charge object assets
+        self.object_images = {}
+        for object in OBJECT_IMAGES:
+            self.object_images[object] = pygame.transform.scale(pygame.image.load(os.path.join(assets_folder, OBJECT_IMAGES[object])).convert_alpha(), (tilesize, tilesize))
+
+        # Lighting effect
+        self.fog = pygame.Surface((width, height))
+        self.fog.fill(NIGHT_VISION)
+        self.light_mask = pygame.transform.scale(pygame.image.load(os.path.join(assets_folder, LIGHT_MASK)).convert_alpha(), (field_of_view * 2.35, field_of_view * 2.35))
+
+        # Dim screen effect
+        self.dim_screen = pygame.Surface((width, height)).convert_alpha()
+        self.dim_screen.fill((0, 0, 0, 180))
+
+        # Visibility masks of the egocentric observations, by grid size and avatar tile (they only depend on the walls),
+        # the most recently used ones (see EgocentricGrid)
+        self.visibility_cache = {}
+
+        # Line of sight results of the raycaster, by line in map pixels (they only depend on the walls), the most
+        # recently used ones
+        self.sight_cache = LRUCache(SIGHT_CACHE_SIZE, None)
+
+        # Walls merged into rectangles (built by the first game, see Game.get_wall_mesh)
+        self.wall_mesh = None
+
+        # Wall lookup and abstract graph of the path finding backends (built on first use, see Game.get_pathfinding)
+        self.wall_lookup = None
+        self.hierarchical_pathfinder = None
+
+    def build_graph_map(self, tilesize):
+        """ Path finding graph (spots of the first tile layer and their edges) and obstacle grid of a TiledMap """
+        total_rows = self.map.rows
+        total_cols = self.map.cols
+        self.graph_map = []
+        for row in range(total_rows):
+            # Spots of the tiles of the first layer
+            self.graph_map.append([Spot(row, col, tilesize, tilesize, total_rows, total_cols) for col in np.flatnonzero(self.map.bundle.gids[0, row]).tolist()])
+        self.obstacle_grid = self.map.bundle.walls.astype(bool)
+        self.obstacle_grid.flags.writeable = False
+        for row, col in zip(*np.nonzero(self.obstacle_grid)):
+            self.graph_map[row][col].make_obstacle()
+
+        # Update neighbors of the graph map (edges)
+        for row in self.graph_map:
+            for spot in row:
+                spot.update_neighbors(self.graph_map)
+
+    def memory_report(self):
+        """ Approximate size [bytes] of every shared asset """
+        def surface_bytes(surface):
+            return surface.get_pitch() * surface.get_height() if surface is not None else 0
+
+        report = {"map_img": surface_bytes(self.map_img),
+                  "images": sum(surface_bytes(image) for image in [self.avatar_img, self.mob_img, self.wall_img, *self.object_images.values()]),
+                  "effects": surface_bytes(self.fog) + surface_bytes(self.light_mask) + surface_bytes(self.dim_screen)
+                  }
+        if self.graph_map is not None:
+            n_spots = sum(len(row) for row in self.graph_map)
+            report["graph_map"] = n_spots * 600 # Approximate size of a Spot, its attribute dict and its neighbors list
+            report["obstacle_grid"] = self.obstacle_grid.nbytes
+        if self.world is not None:
+            report.update(self.world.memory_report())
+        return report
+
+
+def get_world_assets(width=WIDTH, height=HEIGHT, tilesize=TILESIZE, field_of_view=FIELD_OF_VIEW):
+    """ World assets of the process, loaded the first time. The display must be initialized (convert_alpha) """
+    key = (width, height, tilesize, field_of_view)
+    if key not in _WORLD_ASSETS:
+        _WORLD_ASSETS[key] = WorldAssets(width, height, tilesize, field_of_view)
+    return _WORLD_ASSETS[key]
+
+
+def preload_world_assets():
+    """ Loads the world assets in the current process (headless), so the worker processes forked from it share
+    them copy-on-write instead of loading their own copy """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((WIDTH, HEIGHT))
+    return get_world_assets()
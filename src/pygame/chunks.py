@@ -0,0 +1,253 @@
+import numpy as np
+import pygame
+
+from collections import OrderedDict
+from random import choice, sample
+from src.pygame.mapbundle import SPAWN_KINDS, SPAWN_MOB, SPAWN_OBJECT
+from src.pygame.settings import *
+from src.pygame.sprites import Mob, Object
+from src.pygame.walls import WallMesh
+
+
+class LRUCache():
+    """ At most <capacity> values built by <loader> from their key (or stored with put() when there is no loader),
+    evicting the least recently used one (handed to <on_evict> with its key) """
+
+    def __init__(self, capacity, loader, on_evict=None):
+        self.capacity = capacity
+        self.loader = loader
+        self.on_evict = on_evict
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.values.get(key)
+        if value is not None:
+            self.values.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        if self.loader is None:
+            return None
+        return self.put(key, self.loader(key))
+
+    def put(self, key, value):
+        self.values[key] = value
+        self.values.move_to_end(key)
+        if len(self.values) > self.capacity:
+            evicted = self.values.popitem(last=False)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(*evicted)
+        return value
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __len__(self):
+        return len(self.values)
+
+    def stats(self):
+        return {"loaded": len(self.values), "capacity": self.capacity, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class ChunkedWorld():
+    """ Streams a map bundle in square chunks of <chunk_size> tiles, so the size of a map is limited by the disk and
+    not by the memory. The bundle stays memory-mapped, and only the chunks in use are built from it: background
+    surfaces around the camera, navigation grids along the paths searched, wall meshes along the lines of sight
+    and the spawn slots of the regions queried. Each kind lives in its own LRU cache. The objects and mobs belong
+    to every game, see ChunkedEntities """
+
+    def __init__(self, bundle, chunk_size=CHUNK_SIZE, max_background_chunks=MAX_BACKGROUND_CHUNKS, max_navigation_chunks=MAX_NAVIGATION_CHUNKS,
+                 max_wall_mesh_chunks=MAX_WALL_MESH_CHUNKS):
+        self.bundle = bundle
+        self.chunk_size = chunk_size
+        self.rows = bundle.rows
+        self.cols = bundle.cols
+        self.tilewidth = bundle.tilewidth
+        self.tileheight = bundle.tileheight
+        self.chunk_rows = -(-self.rows // chunk_size)
+        self.chunk_cols = -(-self.cols // chunk_size)
+        self.backgrounds = LRUCache(max_background_chunks, self._load_background)
+        self.navigation = LRUCache(max_navigation_chunks, self._load_navigation)
+        self.wall_meshes = LRUCache(max_wall_mesh_chunks, self._load_wall_mesh)
+        self.wall_mesh = ChunkedWallMesh(self)
+
+        # Spawn slots sorted by chunk, so those of a chunk are a contiguous slice
+        spawns = np.asarray(bundle.spawns)
+        cols = (spawns[:, 1] // self.tilewidth).astype(np.int64)
+        rows = (spawns[:, 2] // self.tileheight).astype(np.int64)
+        chunk_ids = (rows // chunk_size) * self.chunk_cols + cols // chunk_size
+        order = np.argsort(chunk_ids, kind='stable')
+        self._spawn_ids = chunk_ids[order]
+        self._spawns = np.stack([spawns[order, 0].astype(np.int64), cols[order], rows[order], spawns[order, 3].astype(np.int64), spawns[order, 4].astype(np.int64)], axis=1)
+
+    def chunk_of(self, col, row):
+        return col // self.chunk_size, row // self.chunk_size
+
+    def _bounds(self, chunk):
+        cx, cy = chunk
+        col, row = cx * self.chunk_size, cy * self.chunk_size
+        return col, row, min(col + self.chunk_size, self.cols), min(row + self.chunk_size, self.rows)
+
+    def _load_background(self, chunk):
+        col0, row0, col1, row1 = self._bounds(chunk)
+        pixels = self.bundle.background[row0 * self.tileheight:row1 * self.tileheight, col0 * self.tilewidth:col1 * self.tilewidth]
+        return pygame.image.frombytes(np.ascontiguousarray(pixels).tobytes(), (pixels.shape[1], pixels.shape[0]), 'RGB')
+
+    def _load_navigation(self, chunk):
+        col0, row0, col1, row1 = self._bounds(chunk)
+        return (self.bundle.walls[row0:row1, col0:col1] != 0).tolist()
+
+    def _load_wall_mesh(self, chunk):
+        col0, row0, col1, row1 = self._bounds(chunk)
+        tile_rects = {(col, row): pygame.Rect(col * self.tilewidth, row * self.tileheight, width, height) for _, col, row, width, height in self.spawn_slots(chunk, 'wall').tolist()}
+        return WallMesh(self.bundle.walls[row0:row1, col0:col1] != 0, self.tilewidth, tile_rects, origin=(col0, row0))
+
+    def chunks_around(self, col, row, half_width, half_height):
+        """ Chunks that intersect the tiles within <half_width> columns and <half_height> rows of (<col>, <row>) """
+        cx0, cy0 = self.chunk_of(max(0, col - half_width), max(0, row - half_height))
+        cx1, cy1 = self.chunk_of(min(self.cols - 1, col + half_width), min(self.rows - 1, row + half_height))
+        return [(cx, cy) for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1)]
+
+    def is_blocked(self, col, row):
+        """ True outside of the map and on walls """
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            return True
+        grid = self.navigation.get((col // self.chunk_size, row // self.chunk_size))
+        return grid[row % self.chunk_size][col % self.chunk_size]
+
+    def spawn_slots(self, chunk, kind=None):
+        """ Spawn slots of a chunk as (kind, col, row, width, height) rows, all of them or those of a kind ('object',
+        'wall'...). The width and height are in pixels """
+        chunk_id = chunk[1] * self.chunk_cols + chunk[0]
+        start, end = np.searchsorted(self._spawn_ids, [chunk_id, chunk_id + 1])
+        slots = self._spawns[start:end]
+        return slots if kind is None else slots[slots[:, 0] == SPAWN_KINDS[kind]]
+
+    def visible_chunks(self, camera):
+        """ Chunks that intersect the screen with the offset of <camera> """
+        x, y = -camera.camera.x, -camera.camera.y
+        chunk_width, chunk_height = self.chunk_size * self.tilewidth, self.chunk_size * self.tileheight
+        cx0, cy0 = max(0, x // chunk_width), max(0, y // chunk_height)
+        cx1, cy1 = min(self.chunk_cols - 1, (x + WIDTH - 1) // chunk_width), min(self.chunk_rows - 1, (y + HEIGHT - 1) // chunk_height)
+        return [(cx, cy) for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1)]
+
+    def draw_background(self, window, camera):
+        for cx, cy in self.visible_chunks(camera):
+            rect = pygame.Rect(cx * self.chunk_size * self.tilewidth, cy * self.chunk_size * self.tileheight, 0, 0)
+            window.blit(self.backgrounds.get((cx, cy)), camera.apply_rect(rect))
+
+    def memory_report(self):
+        """ Approximate size [bytes] of the chunks loaded """
+        return {"background_chunks": sum(surface.get_pitch() * surface.get_height() for surface in self.backgrounds.values.values()),
+                "navigation_chunks": len(self.navigation) * self.chunk_size * (self.chunk_size * 8 + 64),
+                "wall_mesh_chunks": sum(len(mesh.tiles) * 400 for mesh in self.wall_meshes.values.values()) # Rects of the rectangles and tiles, BVH nodes
+                }
+
+
+class ChunkedWallMesh():
+    """ WallMesh interface over the wall meshes of the chunks of a ChunkedWorld, built on demand """
+
+    def __init__(self, world):
+        self.world = world
+
+    def tiles_near_segment(self, x1, y1, x2, y2, margin=1):
+        """ Rects of the wall tiles of the rectangles near the segment <x1, y1> to <x2, y2>, in the chunks that its
+        bounding box crosses """
+        world = self.world
+        chunk_width, chunk_height = world.chunk_size * world.tilewidth, world.chunk_size * world.tileheight
+        cx0, cx1 = max(0, int(min(x1, x2) - margin) // chunk_width), min(world.chunk_cols - 1, int(max(x1, x2) + margin) // chunk_width)
+        cy0, cy1 = max(0, int(min(y1, y2) - margin) // chunk_height), min(world.chunk_rows - 1, int(max(y1, y2) + margin) // chunk_height)
+        return [tile for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1) for tile in world.wall_meshes.get((cx, cy)).tiles_near_segment(x1, y1, x2, y2, margin)]
+
+    @property
+    def rects(self):
+        """ Rectangles of the chunks loaded """
+        return [rect for mesh in self.world.wall_meshes.values.values() for rect in mesh.rects]
+
+    def as_array(self, chunks=None):
+        """ Rectangles of the <chunks> (the chunks loaded by default) as rows of (x, y, width, height) """
+        meshes = self.world.wall_meshes.values.values() if chunks is None else [self.world.wall_meshes.get(chunk) for chunk in chunks]
+        return np.concatenate([mesh.as_array() for mesh in meshes] + [np.zeros((0, 4))])
+
+
+class ChunkedEntities():
+    """ Objects and mobs of a game on a streamed map. The sprites of the chunks around the avatars (the screen or the
+    field of view, whatever is larger) are created from their spawn slots when they are needed. Once more than
+    <max_chunks> chunks are loaded, the sprites of the least recently used one are freed and only their (kind,
+    col, row, type) records are kept, so the chunk is restored as it was left. The types of the object slots are
+    drawn the first time their chunk is loaded: one random slot of the whole map is reserved for every unique item
+    and the rest hold common items. The spawn coordinates and the maximum number of items of the game follow the
+    chunks loaded """
+
+    def __init__(self, game, world, max_chunks=MAX_ENTITY_CHUNKS):
+        self.game = game
+        self.world = world
+        self.half_width = -(-max(game.width // 2, game.field_of_view) // game.tilesize)
+        self.half_height = -(-max(game.height // 2, game.field_of_view) // game.tilesize)
+        self.records = {} # Sprites of the chunks not loaded, by chunk
+        self.generated = set() # Chunks whose spawn slots were already given a type
+        self.chunks = LRUCache(max_chunks, self._load, self._evict)
+
+        # Slots of the unique items
+        slots = world.bundle.object_slots
+        indices = sample(range(len(slots)), min(len(UNIQUE_ITEMS), len(slots)))
+        self.reserved = {(int(slots[i, 0]) // world.tilewidth, int(slots[i, 1]) // world.tileheight): item for i, item in zip(indices, UNIQUE_ITEMS)}
+        game.spawn_coordinates = []
+        game.max_items = 0
+
+    def update(self):
+        """ Loads the chunks around the avatars and returns them """
+        active = []
+        for avatar in self.game.avatar_sprites:
+            for chunk in self.world.chunks_around(avatar.col, avatar.row, self.half_width, self.half_height):
+                if chunk not in active:
+                    self.load(chunk)
+                    active.append(chunk)
+        return active
+
+    def load(self, chunk):
+        return self.chunks.get(chunk)
+
+    def spawn(self, col, row, type):
+        """ Object spawned during the episode, kept as a record if its chunk is not loaded """
+        chunk = self.world.chunk_of(col, row)
+        if chunk in self.chunks:
+            Object(self.game, col, row, type)
+        else:
+            self.records.setdefault(chunk, []).append((SPAWN_OBJECT, col, row, type))
+
+    def _load(self, chunk):
+        records = []
+        object_slots = []
+        for kind, col, row, _, _ in self.world.spawn_slots(chunk).tolist():
+            if kind == SPAWN_OBJECT:
+                object_slots.append((col, row))
+                if chunk not in self.generated:
+                    records.append((SPAWN_OBJECT, col, row, self.reserved.get((col, row)) or choice(COMMON_ITEMS)))
+            elif kind == SPAWN_MOB and chunk not in self.generated:
+                records.append((SPAWN_MOB, col, row, None))
+        self.generated.add(chunk)
+        for kind, col, row, type in records + self.records.pop(chunk, []):
+            if kind == SPAWN_OBJECT:
+                Object(self.game, col, row, type)
+            else:
+                Mob(self.game, col, row)
+        consumables = [[col, row] for col, row in object_slots if (col, row) not in self.reserved]
+        self.game.spawn_coordinates.extend(consumables)
+        self.game.max_items += len(object_slots)
+        return len(object_slots), consumables
+
+    def _evict(self, chunk, loaded):
+        records = []
+        for sprite in [*self.game.object_sprites, *self.game.mob_sprites]:
+            if self.world.chunk_of(sprite.col, sprite.row) == chunk:
+                records.append((SPAWN_OBJECT, sprite.col, sprite.row, sprite.type) if isinstance(sprite, Object) else (SPAWN_MOB, sprite.col, sprite.row, None))
+                sprite.kill()
+        self.records[chunk] = records
+        n_object_slots, consumables = loaded
+        self.game.spawn_coordinates = [coordinates for coordinates in self.game.spawn_coordinates if coordinates not in consumables]
+        self.game.max_items -= n_object_slots
@@ -1,4 +1,6 @@
+import argparse
 import math
+import numpy as np
 import pytweening
 
 from src.pygame.settings import *
@@ -284,8 +286,248 @@ class BodyDrives:
 
 
 
+# Actions of the drives by index, for the batched engine
+DRIVE_ACTIONS = tuple(ACTIONS)
+EAT, SLEEP = DRIVE_ACTIONS.index("eat"), DRIVE_ACTIONS.index("sleep")
+
+# Internal states of the batched engine, by code (ties are broken in this order, as in update_internal_state)
+INTERNAL_STATES = ('satisfied', 'hungry', 'thirsty', 'sleepy')
+SATISFIED, HUNGRY, THIRSTY, SLEEPY = range(len(INTERNAL_STATES))
+
+
+class BatchedBodyDrives():
+    """ <n> independent BodyDrives advanced together with NumPy, one array element per drive state.
+
+    Every parameter of BodyDrives (and the required_energy / required_time of every action) can be a scalar or an
+    array of <n> values, so a single instance covers a whole parameter grid. run_action follows the scalar
+    run_action step by step, so every state ends up with the same values as a BodyDrives that runs the same
+    actions. The states whose stored energy or water reach 0 are dead (the game over condition of Game.update):
+    they are frozen from then on and survival_hours keeps the time they lasted """
+
+    def __init__(self, n, environment_temperature=ENVIRONMENT_TEMPERATURE,
+                          body_temperature=BODY_TEMPERATURE,
+                          stored_energy=STORED_ENERGY,
+                          stored_water=STORED_WATER,
+                          body_area=BODY_AREA,
+                          material_thickness=MATERIAL_THICKNESS,
+                          basal_energy=BASAL_ENERGY,
+                          basal_water=BASAL_WATER,
+                          basal_metabolic_rate=BASAL_METABOLIC_RATE,
+                          actions=ACTIONS):
+        self.n = n
+        self.index = np.arange(n)
+        self.perceived_temperature = self._array(environment_temperature) # [ºC]
+        self.body_temperature = self._array(body_temperature) # [ºC]
+        self.stored_energy = self._array(stored_energy) # [kcal]
+        self.basal_energy = self._array(basal_energy) # [kcal]
+        self.body_area = self._array(body_area) # [m²]
+        self.material_thickness = self._array(material_thickness) # [m]
+        self.water = self._array(stored_water) # [l]
+        self.basal_water = self._array(basal_water) # [l]
+        self.base_metabolic_rate = self._array(basal_metabolic_rate) # [W]
+        self.update_bmr(self.perceived_temperature)
+
+        # Costs of the actions as (actions, n) arrays. The energy of eating and the time of sleeping are computed
+        self.required_energy = np.stack([self._array(actions[action]["required_energy"]) for action in DRIVE_ACTIONS])
+        self.required_time = np.stack([self._array(np.nan if actions[action]["required_time"] is None else actions[action]["required_time"]) for action in DRIVE_ACTIONS])
+
+        # Drives
+        self.hunger = np.zeros(n) # arousal
+        self.thirst = np.zeros(n) # arousal
+        self.sleepiness = np.zeros(n) # arousal
+        self.biological_clock = np.zeros(n) # [hours]
+        self.internal_state = np.full(n, SATISFIED)
+        self.resolved_state = np.ones(n, dtype=bool)
+
+        # Time lived by every state and survival time of the dead ones
+        self.hours = np.zeros(n) # [hours]
+        self.alive = np.ones(n, dtype=bool)
+        self.survival_hours = np.full(n, np.nan) # [hours]
+
+    def _array(self, value):
+        return np.broadcast_to(np.asarray(value, dtype=np.float64), (self.n,)).copy()
+
+    def _actions(self, action):
+        if isinstance(action, str):
+            action = DRIVE_ACTIONS.index(action)
+        return np.broadcast_to(np.asarray(action, dtype=np.int64), (self.n,))
+
+    def get_efficiency(self):
+        T1 = BodyDrives.celsius_to_kelvin(self.body_temperature)
+        T2 = BodyDrives.celsius_to_kelvin(self.perceived_temperature)
+        T1 = np.where((T1 == T2) | (self.perceived_temperature > self.body_temperature), T2 + 0.001, T1)
+        return 1 - (T2 / T1)
+
+    def get_heatgivenoff_rate(self):
+        """ Heat given off rate [kcal / s] through conductivity with the air """
+        perceived = BodyDrives.celsius_to_kelvin(self.perceived_temperature)
+        body = BodyDrives.celsius_to_kelvin(self.body_temperature)
+        T1 = np.maximum(perceived, body)
+        T2 = np.minimum(perceived, body)
+        T1 = np.where(self.perceived_temperature > self.body_temperature, T2, T1)
+        return (5.7e-6 * self.body_area * (T1 - T2)) / self.material_thickness
+
+    def update_energy(self, quantity, mask=None):
+        energy = np.minimum(self.stored_energy + quantity, self.basal_energy)
+        self.stored_energy = np.where(self._mask(mask), energy, self.stored_energy)
+
+    def update_water(self, quantity, mask=None):
+        water = np.minimum(self.water + quantity, self.basal_water)
+        self.water = np.where(self._mask(mask), water, self.water)
+
+    def update_bmr(self, environment_temperature):
+        self.basal_metabolic_rate = self.base_metabolic_rate + (0.01 * (25 - environment_temperature) * self.base_metabolic_rate)
+
+    def _mask(self, mask):
+        return self.alive if mask is None else self.alive & mask
+
+    def run_action(self, action, food_kcal=None, mask=None):
+        """ Runs <action> (name, index of DRIVE_ACTIONS or array of indices, one per state) on the alive states
+        selected by <mask>. <food_kcal> (scalar or array) is required when some state eats """
+        action = self._actions(action)
+        mask = self._mask(mask)
+        eat = action == EAT
+        sleep = action == SLEEP
+        if food_kcal is None and (eat & mask).any():
+            raise ValueError("food_kcal is required to run the eat action")
+
+        # Compute energy and water requirements
+        efficiency = self.get_efficiency()
+        bmr_kcalh = BodyDrives.watts_to_kcalh(self.basal_metabolic_rate)
+        required_energy = self.required_energy[action, self.index]
+        if food_kcal is not None: # For eating it is necessary to include the energy required in digestion
+            required_energy = np.where(eat, bmr_kcalh + (0.1 * np.asarray(food_kcal, dtype=np.float64)), required_energy)
+        required_time = np.where(sleep, 8 * np.round(self.sleepiness, 2), self.required_time[action, self.index])
+        action_consumption = (bmr_kcalh + BodyDrives.watts_to_kcalh(required_energy)) * required_time
+        action_heatgivenoff = action_consumption - (action_consumption * efficiency)
+        action_usefulwork = action_consumption * efficiency
+        heat_to_evaporate = action_heatgivenoff - (self.get_heatgivenoff_rate() * required_time * 3600)
+        action_water = np.where(heat_to_evaporate >= 0, heat_to_evaporate / 580, 0)
+        action_water = np.where(sleep, action_water + (required_time * 0.7 / 8), action_water) # During sleep a fixed water amount is consumed
+        self.update_water(-action_water, mask)
+        self.update_energy(-(action_heatgivenoff + action_usefulwork), mask)
+
+        # Update arousal values of the drives
+        hunger_range, _ = BodyDrives.standard_kcalh_production()
+        hunger = self.stored_energy / hunger_range
+        hunger = np.where(self.stored_energy > hunger_range, 0, 1 - (hunger - np.floor(hunger)) ** 2)
+        thirst = self.water / self.basal_water
+        thirst = 1 - (-0.5 * (np.cos(math.pi * (thirst - np.floor(thirst))) - 1))
+        biological_clock = np.where(sleep, 0, self.biological_clock + required_time)
+        sleepiness = biological_clock / 24 - np.floor(biological_clock / 24)
+        sleepiness = np.where(sleepiness == 0, 0, np.exp2(10 * (sleepiness - 1)))
+        sleepiness = np.where(sleep, 0, np.where(biological_clock >= 24, 1, sleepiness))
+        self.hunger = np.where(mask, hunger, self.hunger)
+        self.thirst = np.where(mask, thirst, self.thirst)
+        self.sleepiness = np.where(mask, sleepiness, self.sleepiness)
+        self.biological_clock = np.where(mask, biological_clock, self.biological_clock)
+        self.hours = np.where(mask, self.hours + required_time, self.hours)
+
+        # Update internal state of the avatar
+        resolved = self.resolved_state.copy()
+        resolved |= (self.internal_state == HUNGRY) & ((self.hunger < 0.5) | (self.sleepiness > 0.8) | (self.thirst > 0.8))
+        resolved |= (self.internal_state == THIRSTY) & (self.thirst < 0.2)
+        resolved |= (self.internal_state == SLEEPY) & (self.sleepiness < 0.2)
+        self.update_internal_state(mask & resolved)
+
+        # Game over condition
+        dead = mask & ((self.stored_energy <= 0) | (self.water <= 0))
+        self.survival_hours[dead] = self.hours[dead]
+        self.alive &= ~dead
+
+    def update_internal_state(self, mask):
+        # The first of the highest arousals over 0.2, as max() over the dict of update_internal_state
+        hunger = np.where(self.hunger > 0.2, self.hunger, -np.inf)
+        thirst = np.where(self.thirst > 0.2, self.thirst, -np.inf)
+        sleepiness = np.where(self.sleepiness > 0.2, self.sleepiness, -np.inf)
+        internal_state = np.where((hunger >= thirst) & (hunger >= sleepiness), HUNGRY, np.where(thirst >= sleepiness, THIRSTY, SLEEPY))
+        internal_state = np.where(np.isinf(np.maximum(np.maximum(hunger, thirst), sleepiness)), SATISFIED, internal_state)
+        self.internal_state = np.where(mask, internal_state, self.internal_state)
+        self.resolved_state = np.where(mask, internal_state == SATISFIED, self.resolved_state)
+
+
+def restless_policy(drives):
+    """ Keeps moving and only sleeps when Game.update would force it (sleepiness over 0.9) """
+    return np.where(drives.sleepiness > 0.9, SLEEP, DRIVE_ACTIONS.index("movement"))
+
+
+def homeostatic_policy(drives):
+    """ Sleeps when forced, otherwise eats or drinks when hungry or thirsty (with unlimited supplies) and moves """
+    return np.select([drives.sleepiness > 0.9, drives.hunger > 0.5, drives.thirst > 0.5],
+                     [SLEEP, EAT, DRIVE_ACTIONS.index("drink")],
+                     DRIVE_ACTIONS.index("movement"))
+
+
+SWEEP_POLICIES = {"restless": restless_policy, "homeostatic": homeostatic_policy}
+
+
+def sweep_drives(grid, policy=restless_policy, hours=72, food_kcal=CONSUMABLES['hamburguer']['kcal'], water_intake=NON_CONSUMABLES['cup']['capacity'], record_every=10, max_steps=100000):
+    """ Runs a BatchedBodyDrives over the cartesian product of the parameter values of <grid> for <hours>.
+
+    <grid> maps BodyDrives arguments ('environment_temperature', 'stored_energy', ...) or action costs
+    ('<action>.required_energy', '<action>.required_time') to the values to try. <policy> maps the drives to the
+    actions of every state (array of DRIVE_ACTIONS indices). Eating and drinking add <food_kcal> and <water_intake>
+    first, as Avatar.eat and Avatar.drink do. Returns the parameter values and survival hours (NaN for the states
+    that are alive at the end) with the grid shape, and the curves of hours, energy, water and arousals, sampled
+    every <record_every> steps, with shape (samples, *grid shape) """
+    names = list(grid)
+    mesh = np.meshgrid(*[np.asarray(grid[name], dtype=np.float64) for name in names], indexing='ij')
+    shape = mesh[0].shape if mesh else ()
+    params = {name: values.reshape(-1) for name, values in zip(names, mesh)}
+    n = int(np.prod(shape))
+
+    # Split the drives arguments from the action costs
+    kwargs = {name: values for name, values in params.items() if '.' not in name}
+    actions = {action: dict(costs) for action, costs in ACTIONS.items()}
+    for name, values in params.items():
+        if '.' in name:
+            action, cost = name.split('.')
+            actions[action][cost] = values
+    drives = BatchedBodyDrives(n, actions=actions, **kwargs)
+
+    curves = {"hours": [], "stored_energy": [], "water": [], "hunger": [], "thirst": [], "sleepiness": []}
+    step = 0
+    active = drives.alive & (drives.hours < hours)
+    while active.any() and step < max_steps:
+        if step % record_every == 0:
+            for name in curves:
+                curves[name].append(getattr(drives, name).astype(np.float32))
+        action = policy(drives)
+        drives.update_energy(food_kcal, active & (action == EAT) & (drives.stored_energy < drives.basal_energy))
+        drives.update_water(water_intake, active & (action == DRIVE_ACTIONS.index("drink")) & (drives.water < drives.basal_water))
+        drives.run_action(action, food_kcal, active)
+        step += 1
+        active = drives.alive & (drives.hours < hours)
+    for name in curves:
+        curves[name].append(getattr(drives, name).astype(np.float32))
+
+    return {"params": {name: values.reshape(shape) for name, values in params.items()},
+            "survival_hours": drives.survival_hours.reshape(shape),
+            "curves": {name: np.stack(values).reshape(-1, *shape) for name, values in curves.items()},
+            "steps": step
+            }
+
+
+
 
 if __name__ == "__main__":
 
-    body = BodyDrives(ENVIRONMENT_TEMPERATURE)
-    body.print_general_information()
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Body drives',
+                                     description='Prints the energy balance of the body drives, or sweeps their parameters.')
+    parser.add_argument('-s', '--sweep', nargs='+', metavar='PARAM=V1,V2,...', default=None, help='Parameter values to sweep, e.g. environment_temperature=10,20,30 movement.required_energy=80,115')
+    parser.add_argument('-p', '--policy', choices=list(SWEEP_POLICIES), default='restless', help='Policy of the sweep')
+    parser.add_argument('--hours', type=float, default=72, help='Time horizon of the sweep [hours]')
+    args = parser.parse_args()
+
+    if args.sweep is None:
+        body = BodyDrives(ENVIRONMENT_TEMPERATURE)
+        body.print_general_information()
+    else:
+        grid = {name: [float(value) for value in values.split(',')] for name, values in (param.split('=') for param in args.sweep)}
+        result = sweep_drives(grid, SWEEP_POLICIES[args.policy], args.hours)
+        print(f"\nSWEEP ({args.policy} policy, {args.hours} hours, {result['steps']} steps)\n")
+        print("".join(f"{name:{30}}" for name in grid) + f"{'Survival [hours]':{20}}")
+        for index in np.ndindex(result["survival_hours"].shape):
+            survival = result["survival_hours"][index]
+            print("".join(f"{result['params'][name][index]:<{30}g}" for name in grid) + (f"{survival:<{20}.2f}" if not np.isnan(survival) else f"{'> ' + str(args.hours):{20}}"))
@@ -0,0 +1,207 @@
+import argparse
+import hashlib
+import json
+import numpy as np
+import os
+import pygame
+import struct
+import time
+
+from xml.etree import ElementTree
+
+from src.pygame.settings import *
+
+
+# Layout of a bundle: MAGIC | header length (uint32) | JSON header | sections, every one aligned to ALIGNMENT bytes
+MAGIC = b'AIMAPBN1'
+VERSION = 1
+ALIGNMENT = 64
+EXTENSION = '.aimap'
+
+# Kinds of the spawn slots, stored in the same order as in the object layers of the TMX file
+SPAWN_WALL = 0
+SPAWN_OBJECT = 1
+SPAWN_AVATAR = 2
+SPAWN_MOB = 3
+SPAWN_KINDS = {'wall': SPAWN_WALL, 'object': SPAWN_OBJECT, 'avatar': SPAWN_AVATAR, 'mob': SPAWN_MOB}
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def bundle_path(tmx_path):
+    """ Location of the compiled bundle of a TMX file inside the cache folder. The name carries a hash of the
+    absolute path, so TMX files with the same name in different folders get their own bundle """
+    name = os.path.splitext(os.path.basename(tmx_path))[0]
+    digest = hashlib.sha1(os.path.abspath(tmx_path).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(ROOT_PROJECT_PATH, CACHE_DIRECTORY_NAME, MAPS_CACHE_DIRECTORY_NAME, f"{name}-{digest}{EXTENSION}")
+
+
+def _surface_loader(dependencies):
+    """ pytmx image loader that does not convert the tile images, so no display is required """
+    from pytmx.util_pygame import handle_transformation
+
+    def loader(filename, colorkey, **kwargs):
+        dependencies.append(os.path.abspath(filename))
+        image = pygame.image.load(filename)
+        if colorkey:
+            colorkey = pygame.Color(f"#{colorkey}")
+
+        def load_image(rect=None, flags=None):
+            tile = image.subsurface(rect) if rect else image.copy()
+            if flags:
+                tile = handle_transformation(tile, flags)
+            if colorkey:
+                tile = tile.copy()
+                tile.set_colorkey(colorkey)
+            return tile
+        return load_image
+
+    return loader
+
+
+def compile_map(tmx_path, output_path=None):
+    """ Compiles a TMX file into a binary bundle with the tile gid grid, the wall bitmap, the spawn slots (walls,
+    objects, avatars and mobs) and the pre-rendered background. It returns the path of the bundle """
+    import pytmx
+
+    output_path = output_path or bundle_path(tmx_path)
+    dependencies = [os.path.abspath(tmx_path)]
+    for tileset in ElementTree.parse(tmx_path).getroot().iter('tileset'):
+        if tileset.get('source'):
+            dependencies.append(os.path.abspath(os.path.join(os.path.dirname(tmx_path), tileset.get('source'))))
+    tmxdata = pytmx.TiledMap(tmx_path, image_loader=_surface_loader(dependencies), pixelalpha=True)
+    rows, cols = tmxdata.height, tmxdata.width
+
+    # Tile gid grid of every visible tile layer (gids as written in the TMX file)
+    tile_layers = [layer for layer in tmxdata.visible_layers if isinstance(layer, pytmx.TiledTileLayer)]
+    gids = np.zeros((len(tile_layers), rows, cols), dtype=np.uint32)
+    for i, layer in enumerate(tile_layers):
+        for x, y, gid in layer:
+            gids[i, y, x] = tmxdata.tiledgidmap.get(gid, 0)
+
+    # Spawn slots (kind, x, y, width, height) in pixels and wall bitmap in tiles
+    spawns = []
+    walls = np.zeros((rows, cols), dtype=np.uint8)
+    for tile_object in tmxdata.objects:
+        if tile_object.name not in SPAWN_KINDS:
+            continue
+        spawns.append((SPAWN_KINDS[tile_object.name], tile_object.x, tile_object.y, tile_object.width, tile_object.height))
+        if tile_object.name == 'wall':
+            walls[int(tile_object.y / tile_object.height), int(tile_object.x / tile_object.width)] = 1
+    spawns = np.array(spawns, dtype=np.float64).reshape(-1, 5)
+
+    # Pre-rendered background
+    surface = pygame.Surface((cols * tmxdata.tilewidth, rows * tmxdata.tileheight))
+    for layer in tile_layers:
+        for x, y, gid in layer:
+            tile = tmxdata.get_tile_image_by_gid(gid)
+            if tile:
+                surface.blit(tile, (x * tmxdata.tilewidth, y * tmxdata.tileheight))
+    background = np.frombuffer(pygame.image.tobytes(surface, 'RGB'), dtype=np.uint8).reshape(surface.get_height(), surface.get_width(), 3)
+
+    # Sections and header
+    sections = {"gids": gids, "walls": walls, "spawns": spawns, "background": background}
+    offset = 0
+    layout = {}
+    for name, array in sections.items():
+        layout[name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({"version": VERSION,
+                         "source": os.path.abspath(tmx_path),
+                         "dependencies": dependencies,
+                         "rows": rows,
+                         "cols": cols,
+                         "tilewidth": tmxdata.tilewidth,
+                         "tileheight": tmxdata.tileheight,
+                         "layers": [layer.name for layer in tile_layers],
+                         "sections": layout
+                         }).encode('utf-8')
+    data_start = _align(len(MAGIC) + 4 + len(header))
+
+    # Write to a temporary file first, so readers never map a half written bundle
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    temporary_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header)) + header)
+        for name, array in sections.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(temporary_path, output_path)
+    return output_path
+
+
+class MapBundle():
+    """ Read-only view of a compiled map. The sections are numpy arrays backed by a memory map of the bundle """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self.data[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a compiled map bundle")
+        header_length = struct.unpack('<I', bytes(self.data[len(MAGIC):len(MAGIC) + 4]))[0]
+        self.header = json.loads(bytes(self.data[len(MAGIC) + 4:len(MAGIC) + 4 + header_length]))
+        data_start = _align(len(MAGIC) + 4 + header_length)
+        for name, section in self.header["sections"].items():
+            dtype = np.dtype(section["dtype"])
+            start = data_start + section["offset"]
+            nbytes = int(np.prod(section["shape"])) * dtype.itemsize
+            setattr(self, name, self.data[start:start + nbytes].view(dtype).reshape(section["shape"]))
+        self.rows = self.header["rows"]
+        self.cols = self.header["cols"]
+        self.tilewidth = self.header["tilewidth"]
+        self.tileheight = self.header["tileheight"]
+
+    def is_stale(self, tmx_path=None):
+        """ Whether the bundle was built by another version, from another TMX file than <tmx_path> or before the
+        last change of its sources """
+        if self.header["version"] != VERSION:
+            return True
+        if tmx_path is not None and self.header["source"] != os.path.abspath(tmx_path):
+            return True
+        built = os.path.getmtime(self.path)
+        return any(not os.path.exists(path) or os.path.getmtime(path) > built for path in self.header["dependencies"])
+
+    @property
+    def avatar_start(self):
+        return self.spawns[self.spawns[:, 0] == SPAWN_AVATAR, 1:3]
+
+    @property
+    def object_slots(self):
+        return self.spawns[self.spawns[:, 0] == SPAWN_OBJECT, 1:3]
+
+    def background_surface(self):
+        """ Background as a pygame surface sharing the memory of the bundle """
+        height, width, _ = self.background.shape
+        return pygame.image.frombuffer(self.background, (width, height), 'RGB')
+
+
+def load_map_bundle(tmx_path):
+    """ Maps the compiled bundle of a TMX file, compiling it first when it is missing, older than its sources or
+    built from another file """
+    path = bundle_path(tmx_path)
+    if os.path.exists(path):
+        try:
+            bundle = MapBundle(path)
+            if not bundle.is_stale(tmx_path):
+                return bundle
+        except (ValueError, KeyError):
+            pass
+    return MapBundle(compile_map(tmx_path, path))
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Map compiler',
+                                     description='Compiles Tiled maps (TMX) into binary bundles that are memory-mapped at runtime.')
+    parser.add_argument('maps', nargs='*', default=[os.path.join(ROOT_PROJECT_PATH, CONFIG_DIRECTORY_NAME, TILEDMAP_FILE)], help='TMX files to compile')
+    parser.add_argument('-o', '--output', default=None, help='Path of the bundle (only with a single map)')
+    args = parser.parse_args()
+
+    for tmx_path in args.maps:
+        start = time.perf_counter()
+        path = compile_map(tmx_path, args.output if len(args.maps) == 1 else None)
+        print(f"[MAP INFO] {tmx_path} -> {path} ({os.path.getsize(path) / 1024:.0f} KiB) in {time.perf_counter() - start:.2f} s")
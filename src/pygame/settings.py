@@ -40,6 +40,10 @@ FOOD = 'hamburguer.png'
 WALL = 'bricks_wall.png'
 LIGHT_MASK = 'light_350_med.png'
 
+# 2.4. Cache (compiled maps)
+CACHE_DIRECTORY_NAME = '.cache'
+MAPS_CACHE_DIRECTORY_NAME = 'maps'
+
 
 # =========================
 # SECTION 3. GAME SETTINGS
@@ -55,9 +59,22 @@ MAP_FILE = 'map.txt' # Txt file map
 USE_TILED_MAP = True
 TILEDMAP_FILE = 'custom_map_one.tmx' # Map generated by Tiled software
 FIELD_OF_VIEW = TILESIZE * 10
+CHUNKED_WORLD = False # Streams the map in chunks instead of loading it whole (maps larger than the memory)
+CHUNK_SIZE = 16 # [tiles] Side of the chunks of a streamed map
+MAX_BACKGROUND_CHUNKS = 16 # Background surfaces of a streamed map kept in memory (about 3 MB each)
+MAX_NAVIGATION_CHUNKS = 1024 # Navigation grids of a streamed map kept in memory
+MAX_WALL_MESH_CHUNKS = 256 # Wall meshes of a streamed map kept in memory
+MAX_ENTITY_CHUNKS = 64 # Chunks of a streamed map whose objects and mobs are kept as sprites, per game
+SIGHT_CACHE_SIZE = 4096 # Line of sight results of the raycaster kept in memory
+VISIBILITY_CACHE_SIZE = 4096 # Visibility masks of the egocentric observations kept in memory, per grid size
+PATHFINDING = 'a_star' # Path finding of the controlled policy: 'a_star', 'jps' (jump point search) or 'hpa' (hierarchical A*)
+HPA_CLUSTER_SIZE = 16 # [tiles] Side of the clusters of the hierarchical path finding
 
 # 3.2. Environment settings
 ENVIRONMENT_TEMPERATURE = 30 # [ºC]
+TICKS_PER_HOUR = 100 # Resolution of the game clock (the times of the actions are multiples of 0.01 hours)
+TICKS_PER_DAY = 24 * TICKS_PER_HOUR
+SPAWN_INTERVAL = 1 # [hours] Game time between two spawn opportunities of common objects
 
 # 3.3. Avatar settings
 BODY_TEMPERATURE = 37 # [ºC]
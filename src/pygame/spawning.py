@@ -0,0 +1,32 @@
+import heapq
+import itertools
+import math
+
+
+class EventCalendar():
+    """ Priority queue of the game events by the tick they are due. Periodic events are rescheduled when they are
+    popped, so the game only does work for an event at the ticks it falls due """
+
+    def __init__(self):
+        self.events = []
+        self.counter = itertools.count() # Events due at the same tick are popped in scheduling order
+
+    def schedule(self, tick, event, period=None):
+        heapq.heappush(self.events, (tick, next(self.counter), event, period))
+
+    @property
+    def next_tick(self):
+        return self.events[0][0] if self.events else math.inf
+
+    def pop_due(self, tick):
+        """ Events due at or before <tick>, in order, as (event, occurrences). A periodic event that fell due several
+        times since the last call (e.g. during a long sleep) is returned once with all its occurrences """
+        due = []
+        while self.events and self.events[0][0] <= tick:
+            due_tick, _, event, period = heapq.heappop(self.events)
+            occurrences = 1
+            if period is not None:
+                occurrences = (tick - due_tick) // period + 1
+                self.schedule(due_tick + occurrences * period, event, period)
+            due.append((event, occurrences))
+        return due
@@ -3,16 +3,18 @@ import pytweening
 
 from collections import deque
 from src.pygame.drives import BodyDrives
-from src.pygame.tilemap import Map, TiledMap
 from src.pygame.settings import *
 
 
-vec = pygame.math.Vector2
+def place_rect(entity):
+    """ Rendering adapter: places the pixel rect of an entity on its tile. The simulation only uses tiles """
+    entity.rect.x = entity.col * entity.game.tilesize
+    entity.rect.y = entity.row * entity.game.tilesize
 
 
 class Avatar(pygame.sprite.Sprite):
-    def __init__(self, game, x_init_pos, y_init_pos, create_mask=False):
-        # x and y position are given in terms of tiles, not pixels
+    def __init__(self, game, col, row, create_mask=False):
+        # col and row position are given in terms of tiles, not pixels
         self.groups = game.all_sprites, game.avatar_sprites
         pygame.sprite.Sprite.__init__(self, self.groups)
         self.game = game
@@ -20,55 +22,28 @@ class Avatar(pygame.sprite.Sprite):
         self.rect  = self.image.get_rect()
         if create_mask:
             self.mask = pygame.mask.from_surface(self.image)
-        self.pos = vec(x_init_pos, y_init_pos)
-        if isinstance(self.game.map, Map):
-            self.rect.x = self.pos.x * self.game.tilesize
-            self.rect.y = self.pos.y * self.game.tilesize
-        elif isinstance(self.game.map, TiledMap):
-            self.rect.x = self.pos.x
-            self.rect.y = self.pos.y
+        self.col = col
+        self.row = row
+        self.update_position()
         self.drives = BodyDrives(self.game.environment_temperature, self)
         self.inventory = deque()
         self.memory = dict()
+        self.time_elapsed = 0 # [hours]
 
     def update_position(self):
-        if isinstance(self.game.map, Map):
-            self.rect.x = self.pos.x * self.game.tilesize
-            self.rect.y = self.pos.y * self.game.tilesize
-        elif isinstance(self.game.map, TiledMap):
-            self.rect.x = self.pos.x
-            self.rect.y = self.pos.y
+        place_rect(self)
 
     def movement(self, dx=0, dy=0):
         # dx and dy is the variation in the next move in tiles
         if not self.analyze_collisions(dx, dy):
-            if isinstance(self.game.map, Map):
-                self.pos.x += dx
-                self.pos.y += dy
-            elif isinstance(self.game.map, TiledMap):
-                self.pos.x += dx * self.game.tilesize
-                self.pos.y += dy * self.game.tilesize
+            self.col += dx
+            self.row += dy
             self.update_position()
             self.drives.run_action("movement")
 
     def analyze_collisions(self, dx=0, dy=0):
         # dx and dy is the variation in the next move in tiles
-        if isinstance(self.game.map, Map):
-            for mob in self.game.mob_sprites:
-                if mob.pos.x == self.pos.x + dx and mob.pos.y == self.pos.y + dy:
-                    return True
-            for wall in self.game.wall_sprites:
-                if wall.pos.x == self.pos.x + dx and wall.pos.y == self.pos.y + dy:
-                    return True
-            return False
-        elif isinstance(self.game.map, TiledMap):
-            for mob in self.game.mob_sprites:
-                if mob.pos.x == self.pos.x + (dx * self.game.tilesize) and mob.pos.y == self.pos.y + (dy * self.game.tilesize):
-                    return True
-            for wall in self.game.wall_sprites:
-                if wall.pos.x == self.pos.x + (dx * self.game.tilesize) and wall.pos.y == self.pos.y + (dy * self.game.tilesize):
-                    return True
-            return False
+        return self.game.is_blocked(self.col + dx, self.row + dy)
 
     def add_food_intake(self, quantity):
         self.drives.update_energy(quantity)
@@ -77,11 +52,10 @@ class Avatar(pygame.sprite.Sprite):
         self.drives.update_water(quantity)
 
     def update_game_time(self, quantity):
-        if self.game.hours + quantity < 24:
-            self.game.hours += quantity
-        else:
-            self.game.days += 1
-            self.game.hours = (self.game.hours + quantity) - 24
+        # With a deferred clock the game advances the time once per tick for all the avatars
+        self.time_elapsed += quantity
+        if not self.game.deferred_clock:
+            self.game.advance_clock(quantity)
 
     def add_object_inventory(self, object):
         self.inventory.append(object)
@@ -128,8 +102,8 @@ class Avatar(pygame.sprite.Sprite):
 
 
 class Mob(pygame.sprite.Sprite):
-    def __init__(self, game, x_init_pos, y_init_pos, create_mask=False):
-        # x and y position are given in terms of tiles, not pixels
+    def __init__(self, game, col, row, create_mask=False):
+        # col and row position are given in terms of tiles, not pixels
         self.groups = game.all_sprites, game.mob_sprites
         pygame.sprite.Sprite.__init__(self, self.groups)
         self.game = game
@@ -137,21 +111,12 @@ class Mob(pygame.sprite.Sprite):
         self.rect  = self.image.get_rect()
         if create_mask:
             self.mask = pygame.mask.from_surface(self.image)
-        self.pos = vec(x_init_pos, y_init_pos)
-        if isinstance(self.game.map, Map):
-            self.rect.x = self.pos.x * self.game.tilesize
-            self.rect.y = self.pos.y * self.game.tilesize
-        elif isinstance(self.game.map, TiledMap):
-            self.rect.x = self.pos.x
-            self.rect.y = self.pos.y
+        self.col = col
+        self.row = row
+        self.update_position()
 
     def update_position(self):
-        if isinstance(self.game.map, Map):
-            self.rect.x = self.pos.x * self.game.tilesize
-            self.rect.y = self.pos.y * self.game.tilesize
-        elif isinstance(self.game.map, TiledMap):
-            self.rect.x = self.pos.x
-            self.rect.y = self.pos.y
+        place_rect(self)
 
     def get_rect_center(self):
         return self.rect.center
@@ -164,7 +129,8 @@ class Mob(pygame.sprite.Sprite):
 
 
 class Object(pygame.sprite.Sprite):
-    def __init__(self, game, x_init_pos, y_init_pos, type, create_mask=False):
+    def __init__(self, game, col, row, type, create_mask=False):
+        # col and row position are given in terms of tiles, not pixels
         self.groups = game.all_sprites, game.object_sprites
         pygame.sprite.Sprite.__init__(self, self.groups)
         self.game = game
@@ -173,13 +139,9 @@ class Object(pygame.sprite.Sprite):
         self.type = type
         if create_mask:
             self.mask = pygame.mask.from_surface(self.image)
-        self.pos = vec(x_init_pos, y_init_pos)
-        if isinstance(self.game.map, Map): # x and y position are given in terms of tiles, not pixels
-            self.rect.x = self.pos.x * self.game.tilesize 
-            self.rect.y = self.pos.y * self.game.tilesize 
-        elif isinstance(self.game.map, TiledMap): # x and y position are given in terms of pixels
-            self.rect.x = self.pos.x
-            self.rect.y = self.pos.y
+        self.col = col
+        self.row = row
+        self.update_position()
         self.tweening = pytweening.easeInOutSine
         self.step = 0
         self.direction = 1
@@ -187,16 +149,16 @@ class Object(pygame.sprite.Sprite):
     def distance_to_avatar(self, radius):
         for avatar in self.game.avatar_sprites:
             self.target = avatar
-            target_dist = self.target.pos - self.pos
-            if target_dist.length_squared() <= (radius**2)/6: # Done this way to boost performance
+            target_dist_squared = ((avatar.col - self.col)**2 + (avatar.row - self.row)**2) * self.game.tilesize**2 # [pixels^2]
+            if target_dist_squared <= (radius**2)/6: # Done this way to boost performance
                 if self.type == 'fire':
                     avatar.drives.perceived_temperature = self.game.environment_temperature + 8
                     avatar.drives.update_bmr(avatar.drives.perceived_temperature)
-            elif target_dist.length_squared() <= (radius**2)/3:
+            elif target_dist_squared <= (radius**2)/3:
                 if self.type == 'fire':
                     avatar.drives.perceived_temperature = self.game.environment_temperature + 4
                     avatar.drives.update_bmr(avatar.drives.perceived_temperature)
-            elif target_dist.length_squared() <= radius**2:
+            elif target_dist_squared <= radius**2:
                 if self.type == 'fire':
                     avatar.drives.perceived_temperature = self.game.environment_temperature + 2
                     avatar.drives.update_bmr(avatar.drives.perceived_temperature)
@@ -206,23 +168,17 @@ class Object(pygame.sprite.Sprite):
                     avatar.drives.update_bmr(avatar.drives.perceived_temperature)
 
     def update_position(self):
-        if isinstance(self.game.map, Map):
-            self.rect.x = self.pos.x * self.game.tilesize
-            self.rect.y = self.pos.y * self.game.tilesize
-        elif isinstance(self.game.map, TiledMap):
-            self.rect.x = self.pos.x
-            self.rect.y = self.pos.y
+        place_rect(self)
 
     def update(self):
         # Generates the bobbing motion animation
         if ENABLE_ANIMATION:
-            if isinstance(self.game.map, TiledMap):
-                offset = BOB_RANGE * (self.tweening(self.step / BOB_RANGE) - 0.5)
-                self.rect.centery = self.pos.y + offset * self.direction
-                self.step += BOB_SPEED
-                if self.step > BOB_RANGE:
-                    self.step = 0
-                    self.direction *= -1
+            offset = BOB_RANGE * (self.tweening(self.step / BOB_RANGE) - 0.5)
+            self.rect.centery = self.row * self.game.tilesize + offset * self.direction
+            self.step += BOB_SPEED
+            if self.step > BOB_RANGE:
+                self.step = 0
+                self.direction *= -1
         
         # Update distances
         if self.type in NON_CONSUMABLES and 'activation_radius' in NON_CONSUMABLES[self.type]:
@@ -239,31 +195,32 @@ class Object(pygame.sprite.Sprite):
 
 
 class Wall(pygame.sprite.Sprite):
-    def __init__(self, game, x_init_pos, y_init_pos):
-        # x and y position are given in terms of tiles, not pixels 
-        self.groups = game.all_sprites, game.wall_sprites
+    def __init__(self, game, col, row):
+        # col and row position are given in terms of tiles, not pixels
+        self.groups = game.all_sprites
         pygame.sprite.Sprite.__init__(self, self.groups)
+        game.wall_sprites.append(self)
         self.game = game
         self.image = self.game.wall_img
         self.rect  = self.image.get_rect()
-        self.pos = vec(x_init_pos, y_init_pos)
-        self.rect.x = self.pos.x * self.game.tilesize
-        self.rect.y = self.pos.y * self.game.tilesize
+        self.col = col
+        self.row = row
+        place_rect(self)
 
     def get_rect( self ):
         return self.rect
 
 
-class Obstacle(pygame.sprite.Sprite):
-    """ This class is to be used only with TiledMaps and Object Layers"""
-    def __init__(self, game, x_init_pos, y_init_pos, width, height): 
-        self.groups = game.wall_sprites
-        pygame.sprite.Sprite.__init__(self, self.groups)
-        self.game = game
-        self.pos = vec(x_init_pos, y_init_pos)
-        self.rect  = pygame.Rect(self.pos.x, self.pos.y, width, height)
-        self.rect.x = self.pos.x
-        self.rect.y = self.pos.y
+class Obstacle():
+    """ This class is to be used only with TiledMaps and Object Layers. Obstacles are not drawn, so they are
+    plain records instead of sprites """
+    __slots__ = ('col', 'row', 'rect')
+
+    def __init__(self, game, col, row, width, height):
+        game.wall_sprites.append(self)
+        self.col = col
+        self.row = row
+        self.rect = pygame.Rect(col * game.tilesize, row * game.tilesize, width, height)
 
     def get_rect( self ):
         return self.rect
@@ -1,6 +1,6 @@
 import pygame
-import pytmx
 
+from src.pygame.mapbundle import load_map_bundle
 from src.pygame.settings import *
 
 
@@ -18,23 +18,15 @@ class Map:
 
 class TiledMap:
     def __init__(self, filename):
-        self.tmxdata = pytmx.load_pygame(filename, pixelalpha=True)
-        self.width = self.tmxdata.width * self.tmxdata.tilewidth # (how many tiles across the map) * (how many pixels each tile)
-        self.height = self.tmxdata.height * self.tmxdata.tileheight
-    
-    def render(self, surface):
-        ti = self.tmxdata.get_tile_image_by_gid # find the image that goes with a certain tile
-        for layer in self.tmxdata.visible_layers:
-            if isinstance(layer, pytmx.TiledTileLayer):
-                for x, y, gid in layer:
-                    tile = ti(gid)
-                    if tile:
-                        surface.blit(tile, (x * self.tmxdata.tilewidth, y * self.tmxdata.tileheight))
-    
+        # The TMX file is compiled once into a binary bundle that is memory-mapped (see src/pygame/mapbundle.py)
+        self.bundle = load_map_bundle(filename)
+        self.rows = self.bundle.rows
+        self.cols = self.bundle.cols
+        self.width = self.cols * self.bundle.tilewidth # (how many tiles across the map) * (how many pixels each tile)
+        self.height = self.rows * self.bundle.tileheight
+
     def make_map(self):
-        temp_surface = pygame.Surface((self.width, self.height))
-        self.render(temp_surface)
-        return temp_surface
+        return self.bundle.background_surface()
 
 
 class Spot:
@@ -0,0 +1,110 @@
+import numpy as np
+import pygame
+
+
+def merge_wall_tiles(grid):
+    """ Greedy meshing of a wall bitmap (rows, cols) into axis-aligned rectangles of tiles (col, row, width,
+    height). Scanning row by row, every wall tile not covered yet starts a rectangle that grows to the right as
+    far as possible and then downwards while the whole span is made of uncovered walls """
+    grid = np.asarray(grid, dtype=bool)
+    covered = np.zeros_like(grid)
+    rows, cols = grid.shape
+    rectangles = []
+    for row in range(rows):
+        for col in range(cols):
+            if not grid[row, col] or covered[row, col]:
+                continue
+            width = 1
+            while col + width < cols and grid[row, col + width] and not covered[row, col + width]:
+                width += 1
+            height = 1
+            while row + height < rows and grid[row + height, col:col + width].all() and not covered[row + height, col:col + width].any():
+                height += 1
+            covered[row:row + height, col:col + width] = True
+            rectangles.append((col, row, width, height))
+    return rectangles
+
+
+class WallBVH():
+    """ Bounding volume hierarchy over the wall rectangles (pygame Rects). Nodes split their rectangles in two
+    halves along the longest axis of their bounds, down to leaves of at most <leaf_size> rectangles """
+
+    def __init__(self, rects, leaf_size=4):
+        self.rects = list(rects)
+        self.leaf_size = leaf_size
+        self.nodes = [] # (bounds, left child, right child, rect indices of a leaf)
+        if self.rects:
+            self._build(list(range(len(self.rects))))
+
+    def _build(self, indices):
+        bounds = self.rects[indices[0]].unionall([self.rects[i] for i in indices[1:]])
+        node = len(self.nodes)
+        self.nodes.append(None)
+        if len(indices) <= self.leaf_size:
+            self.nodes[node] = (bounds, None, None, indices)
+            return node
+        if bounds.width >= bounds.height:
+            indices.sort(key=lambda i: self.rects[i].centerx)
+        else:
+            indices.sort(key=lambda i: self.rects[i].centery)
+        half = len(indices) // 2
+        left = self._build(indices[:half])
+        right = self._build(indices[half:])
+        self.nodes[node] = (bounds, left, right, None)
+        return node
+
+    @staticmethod
+    def _segment_touches(x1, y1, x2, y2, box, margin):
+        """ Conservative segment against box test (slab method, boundaries included, box grown by <margin>) """
+        t_enter, t_exit = 0.0, 1.0
+        for origin, direction, low, high in ((x1, x2 - x1, box.left - margin, box.right + margin), (y1, y2 - y1, box.top - margin, box.bottom + margin)):
+            if direction == 0:
+                if origin < low or origin > high:
+                    return False
+                continue
+            t1, t2 = (low - origin) / direction, (high - origin) / direction
+            if t1 > t2:
+                t1, t2 = t2, t1
+            t_enter, t_exit = max(t_enter, t1), min(t_exit, t2)
+            if t_enter > t_exit:
+                return False
+        return True
+
+    def query_segment(self, x1, y1, x2, y2, margin=1):
+        """ Indices of the rectangles that the segment <x1, y1> to <x2, y2> touches or passes within <margin> pixels
+        of, candidates for an exact test """
+        candidates = []
+        stack = [0] if self.nodes else []
+        while stack:
+            bounds, left, right, indices = self.nodes[stack.pop()]
+            if not self._segment_touches(x1, y1, x2, y2, bounds, margin):
+                continue
+            if indices is not None:
+                candidates.extend(i for i in indices if self._segment_touches(x1, y1, x2, y2, self.rects[i], margin))
+            else:
+                stack.append(right)
+                stack.append(left)
+        return candidates
+
+
+class WallMesh():
+    """ Walls of a map merged into maximal rectangles (see merge_wall_tiles) and their BVH, in pixels. The rects of
+    the wall tiles inside every rectangle are kept (<tile_rects> by (col, row), one tile by default), so exact tests
+    against the tiles only run on the few rectangles that the BVH returns. The <grid> of a chunk of the map starts
+    at the tile <origin> (col, row) """
+
+    def __init__(self, grid, tilesize, tile_rects=None, origin=(0, 0)):
+        tile_rects = tile_rects or {}
+        self.tiles = [(col + origin[0], row + origin[1], width, height) for col, row, width, height in merge_wall_tiles(grid)]
+        self.rects = [pygame.Rect(col * tilesize, row * tilesize, width * tilesize, height * tilesize) for col, row, width, height in self.tiles]
+        self.members = [[tile_rects.get((c, r)) or pygame.Rect(c * tilesize, r * tilesize, tilesize, tilesize)
+                         for r in range(row, row + height) for c in range(col, col + width)] for col, row, width, height in self.tiles]
+        self.bvh = WallBVH(self.rects)
+
+    def tiles_near_segment(self, x1, y1, x2, y2, margin=1):
+        """ Rects of the wall tiles of the rectangles near the segment <x1, y1> to <x2, y2> """
+        return [tile for i in self.bvh.query_segment(x1, y1, x2, y2, margin) for tile in self.members[i]]
+
+    def as_array(self):
+        """ Rectangles as rows of (x, y, width, height) """
+        return np.array([tuple(rect) for rect in self.rects], dtype=np.float64).reshape(-1, 4)
@@ -0,0 +1,21 @@
+import importlib
+
+
+# Registry of the available algorithms as <module>:<class>. Algorithms are only imported when selected, so running
+# the random or the controlled policies does not pay for the import of the deep learning frameworks
+ALGORITHMS = {'random': 'src.rl_algorithms.random:RandomAlgorithm',
+              'controlled': 'src.rl_algorithms.controlled:ControlledAlgorithm',
+              'ppo': 'src.rl_algorithms.ppo:PPOAlgorithm',
+              'ppo-numpy': 'src.rl_algorithms.numpy_policy:NumpyPPOAlgorithm'
+              }
+
+
+def register_algorithm(name, path):
+    ALGORITHMS[name] = path
+
+
+def get_algorithm(name):
+    if name not in ALGORITHMS:
+        raise KeyError(f"Unknown algorithm < {name} >. Available algorithms: {list(ALGORITHMS)}")
+    module_name, class_name = ALGORITHMS[name].split(':')
+    return getattr(importlib.import_module(module_name), class_name)
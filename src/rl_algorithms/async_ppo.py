@@ -0,0 +1,262 @@
+import multiprocessing
+import numpy as np
+import os
+import queue
+import time
+import torch
+
+from collections import deque
+from sb3_contrib.ppo_mask import MaskablePPO
+from stable_baselines3.common.utils import configure_logger, safe_mean
+from src.rl_algorithms.checkpoints import snapshot_model
+from src.rl_algorithms.numpy_policy import NumpyPolicy, policy_arrays
+
+
+class SharedWeights():
+    """ Actor weights of the learner (see policy_arrays) in shared memory, with the version of the policy that
+    wrote them. The learner publishes every new version and the actors copy it when they start a segment """
+
+    def __init__(self, meta, weights):
+        self.meta = meta
+        self.layout = []
+        offset = 0
+        for key, value in weights.items():
+            self.layout.append((key, value.shape, offset, offset + value.size))
+            offset += value.size
+        self.buffer = multiprocessing.RawArray('f', offset)
+        self.version = multiprocessing.Value('q', -1)
+
+    def publish(self, weights):
+        flat = np.frombuffer(self.buffer, dtype=np.float32)
+        with self.version.get_lock():
+            for key, _, start, end in self.layout:
+                flat[start:end] = weights[key].reshape(-1)
+            self.version.value += 1
+        return self.version.value
+
+    def read(self):
+        """ Latest version and a private copy of its policy """
+        flat = np.frombuffer(self.buffer, dtype=np.float32)
+        with self.version.get_lock():
+            version = self.version.value
+            weights = {key: flat[start:end].reshape(shape).copy() for key, shape, start, end in self.layout}
+        return version, NumpyPolicy(meta=self.meta, weights=weights)
+
+
+def _put(segments, segment, stop):
+    # Blocks while the queue is full (the learner is behind), but leaves when the run stops
+    while not stop.is_set():
+        try:
+            segments.put(segment, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def run_actor(env_factory, n_envs, segment_length, shared, segments, stop, seed, max_staleness, dropped):
+    """ Actor process: steps <n_envs> envs with a snapshot of the policy and pushes one segment of <segment_length>
+    steps per env to the <segments> queue. A segment is collected with a single version of the policy, and it is
+    dropped instead of pushed if the learner has moved on more than <max_staleness> versions meanwhile """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    segments.cancel_join_thread()
+    envs = [env_factory() for _ in range(n_envs)]
+    generator = np.random.default_rng(seed)
+    observations = [env.reset(seed=seed + i) for i, env in enumerate(envs)]
+    episode_starts = np.ones(n_envs, dtype=bool)
+    returns, lengths = np.zeros(n_envs), np.zeros(n_envs, dtype=np.int64)
+    version = None
+    while not stop.is_set():
+        if version != shared.version.value:
+            version, policy = shared.read()
+        steps = [{"obs": [], "action": [], "mask": [], "log_prob": [], "reward": [], "episode_start": [], "episodes": []} for _ in envs]
+        for _ in range(segment_length):
+            batch = {key: np.stack([obs[key] for obs in observations]) for key in observations[0]}
+            masks = np.array([env.valid_action_mask() for env in envs], dtype=bool)
+            log_probs = policy.log_probs(batch, masks)
+            actions = (log_probs + generator.gumbel(size=log_probs.shape)).argmax(axis=1) # Sample of the masked policy
+            for i, env in enumerate(envs):
+                steps[i]["obs"].append(observations[i])
+                steps[i]["action"].append(actions[i])
+                steps[i]["mask"].append(masks[i])
+                steps[i]["log_prob"].append(log_probs[i, actions[i]])
+                steps[i]["episode_start"].append(episode_starts[i])
+                observations[i], reward, done, _ = env.step(int(actions[i]))
+                steps[i]["reward"].append(reward)
+                returns[i] += reward
+                lengths[i] += 1
+                episode_starts[i] = done
+                if done:
+                    steps[i]["episodes"].append({"r": float(returns[i]), "l": int(lengths[i])})
+                    returns[i], lengths[i] = 0, 0
+                    observations[i] = env.reset()
+
+        if shared.version.value - version > max_staleness:
+            with dropped.get_lock():
+                dropped.value += n_envs
+            continue
+        for i in range(n_envs):
+            segment = {key: np.array(steps[i][key]) for key in ("action", "mask", "episode_start")}
+            segment.update(obs={key: np.stack([obs[key] for obs in steps[i]["obs"]]) for key in observations[i]},
+                           reward=np.array(steps[i]["reward"], dtype=np.float32), log_prob=np.array(steps[i]["log_prob"], dtype=np.float32),
+                           version=version, episodes=steps[i]["episodes"], last_obs=observations[i], last_episode_start=bool(episode_starts[i]))
+            _put(segments, segment, stop)
+
+
+def build_learner_model(policy, observation_space, action_space, n_segments, segment_length, **kwargs):
+    """ MaskablePPO without an env: its rollout buffer holds <n_segments> segments of <segment_length> steps, the
+    batch of every update. The actors step the envs """
+    model = MaskablePPO(policy=policy, env=None, n_steps=segment_length, _init_setup_model=False, **kwargs)
+    model.observation_space = observation_space
+    model.action_space = action_space
+    model.n_envs = n_segments
+    model._setup_model()
+    return model
+
+
+class AsyncActorLearner():
+    """ Asynchronous PPO: <n_actors> actor processes keep stepping their envs with a recent snapshot of the policy
+    (NumPy, see NumpyPolicy) and push trajectory segments to a bounded queue, while the learner fills the rollout
+    buffer of the model with the first <n_segments> segments and updates it. Neither side waits for the other:
+    the actors do not stop during the updates and the learner does not wait for the slowest env.
+
+    The staleness of the segments (versions of the policy between the one that collected them and the one that
+    learns from them) is bounded: the queue holds at most <queue_size> segments, so the actors block when the
+    learner is behind, and segments older than <max_staleness> versions are dropped. The probabilities of the
+    behaviour policy travel with the segments, so the PPO ratio corrects the rest of the lag """
+
+    def __init__(self, env_factory, n_actors=2, envs_per_actor=4, segment_length=128, n_segments=16, max_staleness=2, queue_size=None, seed=0, actor_timeout=1.0):
+        self.env_factory = env_factory
+        self.n_actors = n_actors
+        self.envs_per_actor = envs_per_actor
+        self.segment_length = segment_length
+        self.n_segments = n_segments
+        self.max_staleness = max_staleness
+        self.queue_size = queue_size or 2 * n_segments
+        self.seed = seed
+        self.actor_timeout = actor_timeout # Seconds between two checks of the actors while the queue is empty
+        self.stats = {"updates": 0, "learner_dropped": 0, "actor_dropped": 0, "wait_time_s": 0, "update_time_s": 0, "staleness": []}
+
+    def _collect(self, segments, version, actors):
+        """ The next <n_segments> segments at most <max_staleness> versions old. It raises if the queue stays empty
+        because <actors> died """
+        batch = []
+        start = time.perf_counter()
+        while len(batch) < self.n_segments:
+            try:
+                segment = segments.get(timeout=self.actor_timeout)
+            except queue.Empty:
+                # The actors only leave when the run stops, any exit code means that they died
+                dead = [actor for actor in actors if actor.exitcode is not None]
+                if dead:
+                    raise RuntimeError(f"{len(dead)} of {len(actors)} actor processes died (exit codes {[actor.exitcode for actor in dead]})")
+                continue
+            if version - segment["version"] > self.max_staleness:
+                self.stats["learner_dropped"] += 1
+                continue
+            batch.append(segment)
+        self.stats["wait_time_s"] += time.perf_counter() - start
+        return batch
+
+    def _fill_buffer(self, model, batch):
+        """ Rollout buffer of the model from the segments, one per column, with the values of the current model """
+        buffer = model.rollout_buffer
+        buffer.reset()
+        obs = {key: np.stack([segment["obs"][key] for segment in batch], axis=1) for key in batch[0]["obs"]} # (steps, segments, ...)
+        last_obs = {key: np.stack([segment["last_obs"][key] for segment in batch]) for key in batch[0]["last_obs"]}
+        with torch.no_grad():
+            flat_obs = {key: value.reshape(-1, *value.shape[2:]) for key, value in obs.items()}
+            values = model.policy.predict_values(model.policy.obs_to_tensor(flat_obs)[0]).reshape(self.segment_length, len(batch))
+            last_values = model.policy.predict_values(model.policy.obs_to_tensor(last_obs)[0])
+        for step in range(self.segment_length):
+            column = lambda key: np.array([segment[key][step] for segment in batch])
+            buffer.add({key: value[step] for key, value in obs.items()}, column("action"), column("reward"), column("episode_start"),
+                       values[step], torch.as_tensor(column("log_prob")), action_masks=column("mask"))
+        buffer.compute_returns_and_advantage(last_values=last_values, dones=np.array([segment["last_episode_start"] for segment in batch]))
+
+    def learn(self, model, total_timesteps, checkpoint_writer=None, save_freq=None, log_interval=1):
+        """ Trains <model> (see build_learner_model) for <total_timesteps> env steps. Checkpoints are handed to the
+        <checkpoint_writer> every <save_freq> steps. It returns a summary of the throughput and the staleness """
+        meta, weights = policy_arrays(model)
+        shared = SharedWeights(meta, weights)
+        version = shared.publish(weights)
+        segments = multiprocessing.Queue(maxsize=self.queue_size)
+        stop = multiprocessing.Event()
+        dropped = multiprocessing.Value('q', 0)
+        actors = [multiprocessing.Process(target=run_actor, daemon=True,
+                                          args=(self.env_factory, self.envs_per_actor, self.segment_length, shared, segments, stop,
+                                                self.seed + actor * self.envs_per_actor, self.max_staleness, dropped))
+                  for actor in range(self.n_actors)]
+
+        model.ep_info_buffer = deque(maxlen=100)
+        model.num_timesteps = 0
+        last_saved = 0
+        start = time.perf_counter()
+        for actor in actors:
+            actor.start()
+        try:
+            while model.num_timesteps < total_timesteps:
+                batch = self._collect(segments, version, actors)
+                update_start = time.perf_counter()
+                self._fill_buffer(model, batch)
+                for segment in batch:
+                    model.ep_info_buffer.extend(segment["episodes"])
+                    self.stats["staleness"].append(version - segment["version"])
+                model.num_timesteps += self.segment_length * len(batch)
+                model._update_current_progress_remaining(model.num_timesteps, total_timesteps)
+                model.train()
+                version = shared.publish(policy_arrays(model)[1])
+                self.stats["updates"] += 1
+                self.stats["update_time_s"] += time.perf_counter() - update_start
+
+                if checkpoint_writer is not None and save_freq and model.num_timesteps - last_saved >= save_freq:
+                    checkpoint_writer.submit(snapshot_model(model), model.num_timesteps, float(safe_mean([episode["r"] for episode in model.ep_info_buffer])) if model.ep_info_buffer else None)
+                    last_saved = model.num_timesteps
+                if self.stats["updates"] % log_interval == 0:
+                    self._record(model, time.perf_counter() - start, dropped.value)
+        finally:
+            stop.set()
+            for actor in actors:
+                while actor.is_alive():
+                    try:
+                        segments.get(timeout=0.1)
+                    except queue.Empty:
+                        actor.join(timeout=0.1)
+            self.stats["actor_dropped"] = dropped.value
+        if checkpoint_writer is not None and last_saved != model.num_timesteps:
+            checkpoint_writer.submit(snapshot_model(model), model.num_timesteps, float(safe_mean([episode["r"] for episode in model.ep_info_buffer])) if model.ep_info_buffer else None)
+        return self.summary(model.num_timesteps, time.perf_counter() - start)
+
+    def _record(self, model, elapsed, actor_dropped):
+        if model.ep_info_buffer:
+            model.logger.record("rollout/ep_rew_mean", safe_mean([episode["r"] for episode in model.ep_info_buffer]))
+            model.logger.record("rollout/ep_len_mean", safe_mean([episode["l"] for episode in model.ep_info_buffer]))
+        model.logger.record("async/env_steps_per_sec", model.num_timesteps / max(elapsed, 1e-9))
+        model.logger.record("async/staleness_mean", float(np.mean(self.stats["staleness"][-self.n_segments:])))
+        model.logger.record("async/staleness_max", max(self.stats["staleness"][-self.n_segments:]))
+        model.logger.record("async/learner_wait_time_s", self.stats["wait_time_s"])
+        model.logger.record("async/update_time_s", self.stats["update_time_s"])
+        model.logger.record("async/dropped_segments", self.stats["learner_dropped"] + actor_dropped)
+        model.logger.dump(model.num_timesteps)
+
+    def summary(self, timesteps, elapsed):
+        return {"timesteps": timesteps,
+                "time_s": elapsed,
+                "env_steps_per_sec": timesteps / max(elapsed, 1e-9),
+                "updates": self.stats["updates"],
+                "learner_busy": self.stats["update_time_s"] / max(elapsed, 1e-9),
+                "staleness_mean": float(np.mean(self.stats["staleness"])) if self.stats["staleness"] else 0.0,
+                "staleness_max": max(self.stats["staleness"], default=0),
+                "dropped_segments": self.stats["learner_dropped"] + self.stats["actor_dropped"]
+                }
+
+
+def train_async(env_factory, model, total_timesteps, tb_log_name, checkpoint_writer=None, save_freq=None, **kwargs):
+    """ Trains <model> with an AsyncActorLearner (<kwargs>), logged as <tb_log_name> under its tensorboard_log """
+    model.set_logger(configure_logger(model.verbose, model.tensorboard_log, tb_log_name))
+    trainer = AsyncActorLearner(env_factory, **kwargs)
+    summary = trainer.learn(model, total_timesteps, checkpoint_writer, save_freq)
+    if model.verbose > 0:
+        print(f"\n[TRAINING INFO] Env steps/sec (async): {summary['env_steps_per_sec']:.1f}")
+        print(f"[TRAINING INFO] Learner busy: {100 * summary['learner_busy']:.1f}% of the run, {summary['updates']} updates")
+        print(f"[TRAINING INFO] Staleness: {summary['staleness_mean']:.2f} mean, {summary['staleness_max']} max, {summary['dropped_segments']} segments dropped")
+    return summary
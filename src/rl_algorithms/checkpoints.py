@@ -0,0 +1,177 @@
+import copy
+import datetime
+import json
+import numpy as np
+import os
+import queue
+import threading
+
+from collections import deque
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.save_util import recursive_getattr, save_to_zip_file
+
+
+INDEX_FOLDER = 'index' # One index per run, so runs sharing the save path never overwrite each other's
+
+def snapshot_model(model):
+    """ In-memory copy of everything <model>.save() would write. It mirrors BaseAlgorithm.save, but the parameters
+    and the torch variables are copied, so the snapshot can be serialized while the training goes on """
+    data = model.__dict__.copy()
+    exclude = set(model._excluded_save_params())
+    state_dicts_names, torch_variable_names = model._get_torch_save_params()
+    for torch_variable in state_dicts_names + torch_variable_names:
+        exclude.add(torch_variable.split(".")[0])
+    for name in exclude:
+        data.pop(name, None)
+
+    # Containers that the training loop mutates in place
+    for name, value in data.items():
+        if isinstance(value, (list, dict, deque, np.ndarray)):
+            data[name] = copy.copy(value)
+
+    pytorch_variables = {name: copy.deepcopy(recursive_getattr(model, name)) for name in torch_variable_names}
+    params = copy.deepcopy(model.get_parameters())
+    return data, params, pytorch_variables
+
+
+def read_index(save_path):
+    """ Index of the checkpoints kept under <save_path> by all the runs, sorted by time, with the latest and the best
+    one, or None if there is none """
+    folder = os.path.join(save_path, INDEX_FOLDER)
+    checkpoints = []
+    for file in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+        if file.endswith('.json'):
+            with open(os.path.join(folder, file)) as f:
+                checkpoints.extend(json.load(f)["checkpoints"])
+    if not checkpoints:
+        return None
+    checkpoints.sort(key=lambda checkpoint: checkpoint["timestamp"])
+    evaluated = [checkpoint for checkpoint in checkpoints if checkpoint["eval_return"] is not None]
+    return {"latest": checkpoints[-1], "best": max(evaluated, key=lambda x: x["eval_return"]) if evaluated else None, "checkpoints": checkpoints}
+
+
+def _write_index(path, index):
+    # Replace the index atomically, so a reader never sees a half written file
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+class CheckpointWriter():
+    """ Serializes model snapshots to zip files from a background thread and applies the retention policy to the
+    checkpoints of the run: the last <keep_last> ones plus the best one by evaluation return are kept, the rest are
+    deleted. Each run keeps its own index under <save_path>/index, so runs sharing the save path (with or without
+    W&B) never delete nor forget each other's checkpoints. With <upload>, every checkpoint written is also saved to
+    the W&B run (the run must be initialized) """
+
+    _STOP = object()
+
+    def __init__(self, save_path, name_prefix, keep_last=3, upload=False):
+        self.save_path = save_path
+        self.name_prefix = name_prefix
+        self.keep_last = keep_last
+        self.upload = upload
+        os.makedirs(os.path.join(save_path, INDEX_FOLDER), exist_ok=True)
+        self.index_path = os.path.join(save_path, INDEX_FOLDER, f"{name_prefix}.json")
+        self.index = {"run": name_prefix, "wandb": upload, "latest": None, "best": None, "checkpoints": []}
+        if os.path.exists(self.index_path):
+            # A run resumed under the same name
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        self.jobs = queue.Queue()
+        self.errors = []
+        self.thread = threading.Thread(target=self._run, name="CheckpointWriter", daemon=True)
+        self.thread.start()
+
+    def submit(self, snapshot, steps, eval_return=None):
+        self.jobs.put((snapshot, steps, eval_return))
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is CheckpointWriter._STOP:
+                break
+            try:
+                self._write(*job)
+            except Exception as exception:
+                self.errors.append(exception)
+
+    def _write(self, snapshot, steps, eval_return):
+        data, params, pytorch_variables = snapshot
+        file = f"{self.name_prefix}_{steps}_steps.zip"
+        save_to_zip_file(os.path.join(self.save_path, file), data=data, params=params, pytorch_variables=pytorch_variables)
+
+        if self.upload:
+            import wandb
+            wandb.save(os.path.join(self.save_path, file), base_path=self.save_path, policy="now")
+
+        entry = {"file": file, "run": self.name_prefix, "wandb": self.upload, "steps": steps, "eval_return": eval_return,
+                 "timestamp": datetime.datetime.now().isoformat(timespec='milliseconds')}
+        checkpoints = [checkpoint for checkpoint in self.index["checkpoints"] if checkpoint["file"] != file] + [entry]
+        self.index["latest"] = entry
+        if eval_return is not None and (self.index["best"] is None or eval_return > self.index["best"]["eval_return"]):
+            self.index["best"] = entry
+
+        # Retention policy
+        kept = checkpoints[-self.keep_last:]
+        if self.index["best"] is not None and self.index["best"] not in kept:
+            kept.insert(0, self.index["best"])
+        for checkpoint in checkpoints:
+            if checkpoint not in kept and os.path.exists(os.path.join(self.save_path, checkpoint["file"])):
+                os.remove(os.path.join(self.save_path, checkpoint["file"]))
+        self.index["checkpoints"] = kept
+        _write_index(self.index_path, self.index)
+
+    def close(self):
+        """ Waits until all the pending checkpoints are written """
+        self.jobs.put(CheckpointWriter._STOP)
+        self.thread.join()
+
+
+class BackgroundCheckpointCallback(BaseCallback):
+    """ Takes a snapshot of the model every <save_freq> calls and hands it to a CheckpointWriter, so the training
+    thread only pays for the in-memory copy. The evaluation return of a checkpoint is the mean return of the last
+    finished training episodes (Monitor), or of <n_eval_episodes> episodes on <eval_env> when it is given """
+
+    def __init__(self, save_freq, save_path, name_prefix, keep_last=3, eval_env=None, n_eval_episodes=10, upload=False, verbose=0):
+        super().__init__(verbose)
+        self.upload = upload
+        self.save_freq = save_freq
+        self.save_path = save_path
+        self.name_prefix = name_prefix
+        self.keep_last = keep_last
+        self.eval_env = eval_env
+        self.n_eval_episodes = n_eval_episodes
+        self.writer = None
+        self.last_saved = None
+
+    def _init_callback(self):
+        os.makedirs(self.save_path, exist_ok=True)
+        self.writer = CheckpointWriter(self.save_path, self.name_prefix, self.keep_last, self.upload)
+
+    def _on_step(self):
+        if self.n_calls % self.save_freq == 0:
+            self._checkpoint()
+        return True
+
+    def _on_training_end(self):
+        if self.last_saved != self.num_timesteps:
+            self._checkpoint()
+        self.writer.close()
+        for exception in self.writer.errors:
+            print(f"[TRAINING INFO] Checkpoint could not be written: {exception!r}")
+
+    def _checkpoint(self):
+        self.writer.submit(snapshot_model(self.model), self.num_timesteps, self._eval_return())
+        self.last_saved = self.num_timesteps
+        if self.verbose > 1:
+            print(f"[TRAINING INFO] Checkpoint queued at {self.num_timesteps} steps")
+
+    def _eval_return(self):
+        if self.eval_env is not None:
+            from sb3_contrib.common.maskable.evaluation import evaluate_policy
+            mean_return, _ = evaluate_policy(self.model, self.eval_env, n_eval_episodes=self.n_eval_episodes)
+            return float(mean_return)
+        if self.model.ep_info_buffer:
+            return float(np.mean([episode["r"] for episode in self.model.ep_info_buffer]))
+        return None
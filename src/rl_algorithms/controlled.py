@@ -2,26 +2,57 @@ import time
 
 
 from random import choice, random
-from src.pygame.settings import CONSUMABLES, HARMFUL_ITEMS, PICKABLE_ITEMS, TILESIZE
+from src.pygame.settings import CONSUMABLES, HARMFUL_ITEMS, PATHFINDING, PICKABLE_ITEMS
 from src.utils.actions import Action
-from src.utils.pathfinding import a_star_algorithm
+from src.utils.logger import StepLogger
+from src.utils.pathfinding import a_star_algorithm, grid_a_star, grid_nearest_target_path, jump_point_search, nearest_target_path
 
 
 class ControlledAlgorithm():
 
-    def __init__(self, environment):
+    def __init__(self, environment, logger=None):
         self.policy = 'Controlled policy'
         self.env = environment
+        self.logger = logger if logger is not None else StepLogger()
         self.state = self.env.reset()
+        self.last_action = None
     
+    def reset(self, seed=None):
+        self.state = self.env.reset(seed=seed)
+        self.last_action = None
+        return self.state
+
     def add_memento_to_memory(self, avatar, memento):
         avatar.add_to_memory(memento)
 
     def store_event(self, avatar, event):
         for object, _ in self.env.game.sight_objects.items():
             if object.type == event and event not in avatar.memory:
-                self.add_memento_to_memory(avatar, {event: (int(object.pos.x / TILESIZE), int(object.pos.y / TILESIZE))})
-                print(f"[Memory track] Stored event < '{event}': {(int(object.pos.x / TILESIZE), int(object.pos.y / TILESIZE))} >")
+                self.add_memento_to_memory(avatar, {event: (object.col, object.row)})
+                self.logger.message("[Memory track] Stored event < '{}': {} >", event, (object.col, object.row))
+
+    def plan_path(self, avatar, col, row):
+        """ Shortest sequence of movements from the avatar to the tile (<col>, <row>), with the PATHFINDING backend """
+        if PATHFINDING == 'jps':
+            return jump_point_search(self.env.game.get_pathfinding('jps'), (avatar.row, avatar.col), (row, col))
+        if PATHFINDING == 'hpa':
+            return self.env.game.get_pathfinding('hpa').find_path((avatar.row, avatar.col), (row, col))
+        if self.env.game.graph_map is None:
+            # Streamed map (no graph of the whole map)
+            return grid_a_star(self.env.game.world.is_blocked, (avatar.row, avatar.col), (row, col))
+        start = self.env.game.graph_map[avatar.row][avatar.col]
+        end = self.env.game.graph_map[row][col]
+        return a_star_algorithm(self.env.game.graph_map, start, end)
+
+    def plan_path_to_nearest(self, avatar, sprites):
+        """ Shortest sequence of movements from the avatar to the nearest reachable of the <sprites> (one search
+        for all of them), or None if none is reachable """
+        if self.env.game.graph_map is None:
+            result = grid_nearest_target_path(self.env.game.world.is_blocked, (avatar.row, avatar.col), [(sprite.row, sprite.col) for sprite in sprites])
+        else:
+            graph_map = self.env.game.graph_map
+            result = nearest_target_path(graph_map[avatar.row][avatar.col], [graph_map[sprite.row][sprite.col] for sprite in sprites])
+        return None if result is None else result[1]
 
     def find_and_move_towards_closest_object(self, avatar, focus_on=None):
         if focus_on is None:
@@ -36,16 +67,14 @@ class ControlledAlgorithm():
                 if s.type == focus_on:
                     new_sight_objects[s] = d
 
-        # If objects at sight, go to the closest one
+        # If objects at sight, go to the nearest reachable one
         if new_sight_objects:
-            nearest_sprite = min(new_sight_objects, key=new_sight_objects.get)
-            start = self.env.game.graph_map[int(avatar.pos.y / TILESIZE)][int(avatar.pos.x / TILESIZE)]
-            end = self.env.game.graph_map[int(nearest_sprite.pos.y / TILESIZE)][int(nearest_sprite.pos.x / TILESIZE)]
-            sequence_actions = a_star_algorithm(self.env.game.graph_map, start, end)
+            sequence_actions = self.plan_path_to_nearest(avatar, new_sight_objects)
             if sequence_actions:
+                self.logger.message("[Nearest object path actions] {}", sequence_actions)
                 action = sequence_actions.popleft()
             else:
-                print("A* algorithm did not find an optimal path. Random movement executed")
+                self.logger.message("No object at sight is reachable. Random movement executed")
                 action = choice([action for action in self.env._valid_actions if action in [Action.LEFT.value, Action.RIGHT.value, Action.UP.value, Action.DOWN.value]])
         
         # If not objects at sight, then move in a continuous direction until find a wall or an object is seen
@@ -92,20 +121,12 @@ class ControlledAlgorithm():
         return action
 
     def hungry_behavior(self, avatar):
-        if avatar.inventory:
-            for object in avatar.inventory:
-                if object in CONSUMABLES:
-                    action = Action.EAT.value
-                else:
-                    if bool(self.env.game.hitted_object) and (self.env.game.hitted_object.type in PICKABLE_ITEMS):
-                        action = Action.PICK_UP.value
-                    else:
-                        action = self.find_and_move_towards_closest_object(avatar)
+        if any(object in CONSUMABLES for object in avatar.inventory):
+            action = Action.EAT.value
+        elif bool(self.env.game.hitted_object) and (self.env.game.hitted_object.type in PICKABLE_ITEMS) and len(avatar.inventory) <= 4:
+            action = Action.PICK_UP.value
         else:
-            if bool(self.env.game.hitted_object) and (self.env.game.hitted_object.type in PICKABLE_ITEMS):
-                action = Action.PICK_UP.value
-            else:
-                action = self.find_and_move_towards_closest_object(avatar)
+            action = self.find_and_move_towards_closest_object(avatar)
         return action
 
     def thirsty_behavior(self, avatar):
@@ -114,15 +135,14 @@ class ControlledAlgorithm():
                 action = Action.DRINK.value
             else:
                 if 'water-dispenser' in avatar.memory:
-                    print("I remember a water-dispenser!")
+                    self.logger.message("I remember a water-dispenser!")
                     water_source_x, water_source_y = avatar.memory['water-dispenser']
-                    start = self.env.game.graph_map[int(avatar.pos.y / TILESIZE)][int(avatar.pos.x / TILESIZE)]
-                    end = self.env.game.graph_map[water_source_y][water_source_x]
-                    sequence_actions = a_star_algorithm(self.env.game.graph_map, start, end)
+                    sequence_actions = self.plan_path(avatar, water_source_x, water_source_y)
                     if sequence_actions:
+                        self.logger.message("[A* Optimal path actions] {}", sequence_actions)
                         action = sequence_actions.popleft()
                     else:
-                        print("A* algorithm did not find an optimal path. Random movement executed")
+                        self.logger.message("A* algorithm did not find an optimal path. Random movement executed")
                         action = choice([action for action in self.env._valid_actions if action in [Action.LEFT.value, Action.RIGHT.value, Action.UP.value, Action.DOWN.value]])
                 else:
                     action = self.find_and_move_towards_closest_object(avatar, focus_on='water-dispenser')
@@ -140,48 +160,48 @@ class ControlledAlgorithm():
         action = Action.SLEEP.value
         return action
 
+    def select_action(self, obs):
+        # Get valid actions space
+        self.env.get_valid_actions()
+        return self.select_valid_action()
+
+    def select_valid_action(self):
+        """ Action of the rules, given the valid actions of the env (env._valid_actions) """
+        # Rules to perform actions
+        for avatar in self.env.game.avatar_sprites:
+            # Set events to store in memory
+            self.store_event(avatar, 'water-dispenser')
+
+            # Set rules according to internal drives
+            if avatar.drives.internal_state == 'satisfied':
+                action = self.satisfied_behavior(avatar)
+            elif avatar.drives.internal_state == 'hungry':
+                action = self.hungry_behavior(avatar)
+            elif avatar.drives.internal_state == 'thirsty':
+                action = self.thirsty_behavior(avatar)
+            elif avatar.drives.internal_state == 'sleepy':
+                action = self.sleepy_behavior(avatar)
+
+        # Check action
+        assert action in self.env._valid_actions, f"Action not in valid space of actions < {self.env.get_action_meanings(action)} >"
+
+        # Assign last action
+        self.last_action = action
+        return action
+
 
     def run(self):
         # Set initial conditions
         self.last_action = None
         
         while True:
-            print()
-            print('>'*50)
-            print(f'[Episodic Step] {self.env.episodic_step}')
-            print(f"[State S_t-1] {self.env.state}")
-
-            # Get valid actions space
-            self.env.get_valid_actions()
-            print(f"[Action space A_t] {[self.env.get_action_meanings(action) for action in self.env._valid_actions]}")
-
             # Rules to perform actions
-            for avatar in self.env.game.avatar_sprites:
-                # Set events to store in memory
-                self.store_event(avatar, 'water-dispenser')
-
-                # Set rules according to internal drives
-                if avatar.drives.internal_state == 'satisfied':
-                    action = self.satisfied_behavior(avatar)
-                elif avatar.drives.internal_state == 'hungry':
-                    action = self.hungry_behavior(avatar)
-                elif avatar.drives.internal_state == 'thirsty':
-                    action = self.thirsty_behavior(avatar)
-                elif avatar.drives.internal_state == 'sleepy':
-                    action = self.sleepy_behavior(avatar)
-
-            # Check action
-            assert action in self.env._valid_actions, f"Action not in valid space of actions < {self.env.get_action_meanings(action)} >"
-            print(f"[Action A_t] {self.env.get_action_meanings(action)}")
+            state_pre, episodic_step = self.env.state, self.env.episodic_step
+            action = self.select_action(state_pre)
 
             # Run action
             state, reward, done, info = self.env.step(action)
-            print(f"[State S_t] {state}")
-            print(f"[Step reward R_t] {reward:.2f}")
-            print(f"[Episodic return G_t so far] {self.env.episodic_return:.2f}")
-            
-            # Assign last action
-            self.last_action = action
+            self.logger.step(episodic_step, state_pre, action, state, reward, self.env.episodic_return, self.env._valid_actions)
             
             # Render the game (slow the process in order not to see a crazy fast video)
             self.env.render()
@@ -189,13 +209,7 @@ class ControlledAlgorithm():
             
             # Check end of the episode conditions
             if done == True:
-                print('<'*50)
-                print(f'\nSUMMARY\n')
-                data = [("Policy", "Total elapsed time", "Episodic return G_t"), (self.policy, f'{self.env.game.days} days, {self.env.game.hours:.2f} hours', f'{self.env.episodic_return:.2f}')]
-                for x, y, sum in data:
-                    print(f"{x:{25}} {y:{25}} {sum:{25}}")
+                self.logger.episode(self.policy, self.env.game.days, self.env.game.hours, self.env.episodic_return, self.env.episodic_step)
                 break
-
-            print('<'*50)
         
         self.env.close()
@@ -0,0 +1,202 @@
+import argparse
+import glob
+import numpy as np
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from src.rl_algorithms.controlled import ControlledAlgorithm
+from src.utils.actions import Action
+from src.utils.logger import LogLevel, StepLogger
+
+
+DEFAULT_DEMONSTRATIONS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'demonstrations')
+
+MOVEMENTS = {Action.RIGHT.value: (1, 0),
+             Action.LEFT.value: (-1, 0),
+             Action.DOWN.value: (0, 1),
+             Action.UP.value: (0, -1)
+             }
+
+
+class DemonstrationPolicy(ControlledAlgorithm):
+    """ Headless ControlledAlgorithm for demonstrations. It takes the action mask already computed for the record
+    instead of recomputing the valid actions, and it keeps following its path while the target is the same (for the
+    nearest object, while no other object at sight can be nearer) and the avatar is where the path expected it,
+    instead of searching again from every tile of the way. The rest of a shortest path is still a shortest path, so
+    only ties between paths of the same length can differ from the original policy """
+
+    def __init__(self, environment):
+        super().__init__(environment, logger=StepLogger(LogLevel.SILENT))
+        self.plan = None # (target, expected position, remaining path)
+
+    def reset(self, seed=None):
+        self.plan = None
+        return super().reset(seed=seed)
+
+    def plan_path(self, avatar, col, row):
+        target = (col, row)
+        if self.plan is not None and self.plan[0] == target and self.plan[1] == (avatar.col, avatar.row) and self.plan[2]:
+            path = self.plan[2]
+        else:
+            path = super().plan_path(avatar, col, row)
+        self._remember(avatar, target, path)
+        return path
+
+    def plan_path_to_nearest(self, avatar, sprites):
+        # The path is kept while its target is at sight and no other object can be nearer: the Manhattan distance
+        # is a lower bound of the length of a path
+        targets = {(sprite.col, sprite.row) for sprite in sprites}
+        if self.plan is not None and self.plan[0] in targets and self.plan[1] == (avatar.col, avatar.row) and self.plan[2]:
+            path = self.plan[2]
+            if all(abs(col - avatar.col) + abs(row - avatar.row) >= len(path) for col, row in targets - {self.plan[0]}):
+                self._remember(avatar, self.plan[0], path)
+                return path
+        path = super().plan_path_to_nearest(avatar, sprites)
+        target = (avatar.col, avatar.row)
+        for action in path or []:
+            target = (target[0] + MOVEMENTS[action][0], target[1] + MOVEMENTS[action][1])
+        self._remember(avatar, target, path)
+        return path
+
+    def _remember(self, avatar, target, path):
+        if path and path[0] in MOVEMENTS:
+            dx, dy = MOVEMENTS[path[0]]
+            self.plan = (target, (avatar.col + dx, avatar.row + dy), path)
+        else:
+            self.plan = None
+
+    def act(self, mask):
+        self.env._valid_actions = np.flatnonzero(mask).tolist()
+        return self.select_valid_action()
+
+
+class ShardWriter():
+    """ Streams (obs, mask, action) records to disk as .npz shards of <shard_size> records: obs_<key> arrays, the
+    action masks, the actions, and the flags of the first step of every episode. Each shard is written to a
+    temporary file and renamed, so readers never see a partial one """
+
+    def __init__(self, directory, prefix='shard', shard_size=50000):
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.n_shards = 0
+        self.n_records = 0
+        self.buffers = None
+        self.size = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _allocate(self, obs, mask):
+        self.buffers = {f"obs_{key}": np.empty((self.shard_size, *np.shape(value)), dtype=np.asarray(value).dtype) for key, value in obs.items()}
+        self.buffers["mask"] = np.empty((self.shard_size, len(mask)), dtype=bool)
+        self.buffers["action"] = np.empty(self.shard_size, dtype=np.int8)
+        self.buffers["episode_start"] = np.empty(self.shard_size, dtype=bool)
+
+    def append(self, obs, mask, action, episode_start):
+        if self.buffers is None:
+            self._allocate(obs, mask)
+        for key, value in obs.items():
+            self.buffers[f"obs_{key}"][self.size] = value
+        self.buffers["mask"][self.size] = mask
+        self.buffers["action"][self.size] = action
+        self.buffers["episode_start"][self.size] = episode_start
+        self.size += 1
+        if self.size == self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self.size:
+            return
+        path = os.path.join(self.directory, f"{self.prefix}_{self.n_shards:05d}.npz")
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, **{key: buffer[:self.size] for key, buffer in self.buffers.items()})
+        os.replace(path + '.tmp', path)
+        self.n_shards += 1
+        self.n_records += self.size
+        self.size = 0
+
+    def close(self):
+        self.flush()
+
+
+def load_demonstrations(directory):
+    """ All the shards of a folder concatenated: a dict of obs arrays, and the masks, actions and episode starts """
+    shards = [np.load(path) for path in sorted(glob.glob(os.path.join(directory, '*.npz')))]
+    data = {key: np.concatenate([shard[key] for shard in shards]) for key in shards[0].files}
+    obs = {key[len("obs_"):]: value for key, value in data.items() if key.startswith("obs_")}
+    return obs, data["mask"], data["action"], data["episode_start"]
+
+
+def generate(output, n_steps, n_envs=8, seeds=None, shard_size=50000, prefix='shard', max_episode_steps=100000):
+    """ Runs <n_envs> headless envs round-robin with the demonstration policy until <n_steps> records are written
+    to <output>. The episodes use the <seeds> in order (consecutive seeds from 0 by default) """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from src.opengym.__main__ import GymGame
+    seeds = iter(seeds if seeds is not None else range(2**31))
+    writer = ShardWriter(output, prefix, shard_size)
+    envs = [GymGame() for _ in range(n_envs)]
+    policies = [DemonstrationPolicy(env) for env in envs]
+    observations = [policy.reset(seed=next(seeds)) for policy in policies]
+    episode_starts = [True] * n_envs
+    episodes = 0
+    start = time.perf_counter()
+    while writer.n_records + writer.size < n_steps:
+        for i, (env, policy) in enumerate(zip(envs, policies)):
+            mask = np.asarray(env.valid_action_mask(), dtype=bool)
+            action = policy.act(mask)
+            writer.append(observations[i], mask, action, episode_starts[i])
+            observations[i], _, done, _ = env.step(action)
+            episode_starts[i] = False
+            if done or env.episodic_step > max_episode_steps:
+                episodes += 1
+                observations[i] = policy.reset(seed=next(seeds))
+                episode_starts[i] = True
+            if writer.n_records + writer.size >= n_steps:
+                break
+    writer.close()
+    elapsed = time.perf_counter() - start
+    return {"output": output, "records": writer.n_records, "shards": writer.n_shards, "episodes": episodes,
+            "time_s": elapsed, "steps_per_sec": writer.n_records / max(elapsed, 1e-9)}
+
+
+def _generate(task):
+    output, n_steps, n_envs, worker, n_workers, first_seed, shard_size = task
+    seeds = range(first_seed + worker, 2**31, n_workers)
+    return generate(output, n_steps, n_envs, seeds, shard_size, prefix=f"worker{worker:03d}")
+
+
+def generate_demonstrations(output=DEFAULT_DEMONSTRATIONS_PATH, n_steps=100000, n_workers=None, n_envs=8, first_seed=0, shard_size=50000):
+    """ Splits <n_steps> records across a pool of <n_workers> processes, each one with its own envs and seeds, that
+    stream their shards to <output> """
+    n_workers = n_workers or os.cpu_count()
+    steps = [n_steps // n_workers + (worker < n_steps % n_workers) for worker in range(n_workers)]
+    tasks = [(output, steps[worker], n_envs, worker, n_workers, first_seed, shard_size) for worker in range(n_workers) if steps[worker]]
+
+    # The workers are forked after loading the world assets, so they share them instead of loading a copy each
+    from src.pygame.assets import preload_world_assets
+    preload_world_assets()
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(_generate, tasks))
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Demonstration generator',
+                                     description='Runs the controlled policy headless across many envs and processes and streams (obs, mask, action) demonstrations to disk.')
+    parser.add_argument('-n', '--steps', type=int, default=100000, help='Number of records to generate')
+    parser.add_argument('-o', '--output', default=DEFAULT_DEMONSTRATIONS_PATH, help='Folder of the shards')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes (all the CPUs by default)')
+    parser.add_argument('-e', '--envs', type=int, default=8, help='Number of envs of every worker')
+    parser.add_argument('--first-seed', type=int, default=0, help='Seed of the first episode')
+    parser.add_argument('--shard-size', type=int, default=50000, help='Number of records of every shard')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = generate_demonstrations(args.output, args.steps, args.workers, args.envs, args.first_seed, args.shard_size)
+    elapsed = time.perf_counter() - start
+    records = sum(result["records"] for result in results)
+    for i, result in enumerate(results):
+        print(f"[DEMONSTRATIONS INFO] Worker {i}: {result['records']} records, {result['episodes']} episodes, {result['steps_per_sec']:.0f} steps/s")
+    print(f"[DEMONSTRATIONS INFO] {records} records in {sum(result['shards'] for result in results)} shards written to {args.output} "
+          f"in {elapsed:.1f} s ({records / elapsed:.0f} steps/s)")
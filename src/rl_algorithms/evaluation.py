@@ -0,0 +1,137 @@
+import argparse
+import json
+import math
+import numpy as np
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from src.rl_algorithms import ALGORITHMS, get_algorithm
+from src.utils.actions import Action
+from src.utils.logger import LogLevel, StepLogger
+
+
+# Environment and policies of every worker process, built once and reused across episodes
+_WORKER = {}
+
+
+def _init_worker():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from src.opengym.__main__ import GymGame
+    _WORKER['env'] = GymGame()
+    _WORKER['policies'] = {}
+
+
+def run_episode(policy_name, seed, max_steps=100000, record_dir=None):
+    """ Runs one headless episode (no render, no pacing, no console output) of a registered policy.
+    It returns the episodic return, the survival time and the histogram of the actions taken. With <record_dir>, the
+    episode is also written there as a recording that src/opengym/replay.py renders offline """
+    if 'env' not in _WORKER:
+        _init_worker()
+    env = _WORKER['env']
+    if policy_name not in _WORKER['policies']:
+        _WORKER['policies'][policy_name] = get_algorithm(policy_name)(env, logger=StepLogger(LogLevel.SILENT))
+    policy = _WORKER['policies'][policy_name]
+
+    obs = policy.reset(seed=seed)
+    action_histogram = [0] * len(Action)
+    actions = []
+    done = False
+    steps = 0
+    while not done and steps < max_steps:
+        action = policy.select_action(obs)
+        obs, reward, done, info = env.step(action)
+        action_histogram[action] += 1
+        actions.append(action)
+        steps += 1
+    if record_dir is not None:
+        from src.opengym.replay import make_recording, save_recording
+        save_recording(make_recording(env, seed, actions, policy_name), os.path.join(record_dir, f"{policy_name}_{seed}.json"))
+    return {"policy": policy_name,
+            "seed": seed,
+            "episodic_return": float(env.episodic_return),
+            "days": env.game.days,
+            "hours": float(env.game.hours),
+            "survival_hours": float(env.game.days * 24 + env.game.hours),
+            "steps": steps,
+            "truncated": not done,
+            "action_histogram": action_histogram
+            }
+
+
+def _run_episode(task):
+    return run_episode(*task)
+
+
+def evaluate(policies, n_seeds=100, n_workers=None, first_seed=0, max_steps=100000, record_dir=None):
+    """ Runs every policy over <n_seeds> seeded episodes spread across a pool of <n_workers> processes """
+    tasks = [(policy, seed, max_steps, record_dir) for policy in policies for seed in range(first_seed, first_seed + n_seeds)]
+    n_workers = n_workers or os.cpu_count()
+
+    # The workers are forked after loading the world assets, so they share them instead of loading a copy each
+    from src.pygame.assets import preload_world_assets
+    preload_world_assets()
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) as executor:
+        return list(executor.map(_run_episode, tasks, chunksize=max(1, len(tasks) // (n_workers * 4))))
+
+
+def mean_confidence_interval(values, z=1.96):
+    """ Mean and half width of its 95% confidence interval (normal approximation) """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return float(values.mean()), 0.0
+    return float(values.mean()), float(z * values.std(ddof=1) / math.sqrt(len(values)))
+
+
+def aggregate(results):
+    """ Aggregates the episodes of every policy into mean and confidence interval statistics """
+    report = {}
+    for policy in dict.fromkeys(result["policy"] for result in results):
+        episodes = [result for result in results if result["policy"] == policy]
+        histogram = np.sum([episode["action_histogram"] for episode in episodes], axis=0)
+        report[policy] = {"episodes": len(episodes),
+                          "episodic_return": mean_confidence_interval([episode["episodic_return"] for episode in episodes]),
+                          "survival_hours": mean_confidence_interval([episode["survival_hours"] for episode in episodes]),
+                          "steps": mean_confidence_interval([episode["steps"] for episode in episodes]),
+                          "truncated": sum(episode["truncated"] for episode in episodes),
+                          "action_frequencies": {action.name: float(histogram[action.value] / max(1, histogram.sum())) for action in Action}
+                          }
+    return report
+
+
+def print_report(report):
+    print(f'\nSUMMARY\n')
+    print(f"{'Policy':{25}} {'Episodes':{10}} {'Episodic return G_t':{25}} {'Survival time':{30}} {'Steps':{20}}")
+    for policy, stats in report.items():
+        return_mean, return_ci = stats["episodic_return"]
+        survival_mean, survival_ci = stats["survival_hours"]
+        steps_mean, steps_ci = stats["steps"]
+        survival = f"{int(survival_mean // 24)} days, {survival_mean % 24:.2f} hours ± {survival_ci:.2f} h"
+        print(f"{policy:{25}} {stats['episodes']:<{10}} {f'{return_mean:.2f} ± {return_ci:.2f}':{25}} {survival:{30}} {f'{steps_mean:.0f} ± {steps_ci:.0f}':{20}}")
+    print(f'\nACTIONS\n')
+    print(f"{'Policy':{25}} " + " ".join(f"{action.name:{12}}" for action in Action))
+    for policy, stats in report.items():
+        print(f"{policy:{25}} " + " ".join(f"{stats['action_frequencies'][action.name]:<{12}.3f}" for action in Action))
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Policy evaluation harness',
+                                     description='Runs registered policies over many seeds in parallel and reports aggregate statistics.')
+    parser.add_argument('policies', nargs='+', choices=list(ALGORITHMS), help='Registered policies to evaluate')
+    parser.add_argument('-n', '--seeds', type=int, default=100, help='Number of seeded episodes per policy')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes (all the CPUs by default)')
+    parser.add_argument('--first-seed', type=int, default=0, help='Seed of the first episode')
+    parser.add_argument('--max-steps', type=int, default=100000, help='Maximum number of steps per episode')
+    parser.add_argument('-o', '--output', default=None, help='JSON file to store the results of every episode')
+    parser.add_argument('--record', default=None, help='Folder to write the recording of every episode, to render them later with src.opengym.replay')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = evaluate(args.policies, args.seeds, args.workers, args.first_seed, args.max_steps, args.record)
+    print_report(aggregate(results))
+    print(f"\n[EVALUATION INFO] {len(results)} episodes in {time.perf_counter() - start:.1f} s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"results": results, "report": aggregate(results)}, f, indent=2)
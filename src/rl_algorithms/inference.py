@@ -0,0 +1,254 @@
+import argparse
+import numpy as np
+import os
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+
+class InferenceMetrics():
+    """ Keeps track of the size of the batches and the time every request waits in the queue """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batch_sizes = []
+        self.queue_times = [] # [s]
+        self.inference_times = [] # [s]
+
+    def record(self, batch_size, queue_times, inference_time):
+        with self.lock:
+            self.batch_sizes.append(batch_size)
+            self.queue_times.extend(queue_times)
+            self.inference_times.append(inference_time)
+
+    def summary(self):
+        with self.lock:
+            batch_sizes = np.array(self.batch_sizes, dtype=np.float64)
+            queue_times = np.array(self.queue_times, dtype=np.float64) * 1000
+            inference_times = np.array(self.inference_times, dtype=np.float64) * 1000
+        if not len(batch_sizes):
+            return {"batches": 0, "requests": 0}
+        return {"batches": len(batch_sizes),
+                "requests": int(batch_sizes.sum()),
+                "mean_batch_size": float(batch_sizes.mean()),
+                "max_batch_size": int(batch_sizes.max()),
+                "queue_time_ms_p50": float(np.percentile(queue_times, 50)),
+                "queue_time_ms_p95": float(np.percentile(queue_times, 95)),
+                "queue_time_ms_max": float(queue_times.max()),
+                "inference_time_ms_mean": float(inference_times.mean())
+                }
+
+    def report(self):
+        for key, value in self.summary().items():
+            print(f"[INFERENCE INFO] {key}: {value:.3f}" if isinstance(value, float) else f"[INFERENCE INFO] {key}: {value}")
+
+
+class _Request():
+    __slots__ = ('obs', 'action_mask', 'future', 'enqueued')
+
+    def __init__(self, obs, action_mask):
+        self.obs = obs
+        self.action_mask = action_mask
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class BatchedPolicyServer():
+    """ In-process inference service. It collects observation-mask pairs coming from many workers (threads) and runs
+    them through the model as one masked forward pass.
+
+    A batch is dispatched as soon as it holds <max_batch_size> requests or the oldest request has waited
+    <max_latency> seconds, whatever happens first. <model> is any object with the MaskablePPO predict interface. """
+
+    def __init__(self, model, max_batch_size=64, max_latency=0.005, deterministic=True):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.deterministic = deterministic
+        self.metrics = InferenceMetrics()
+        self.requests = queue.Queue()
+        self.running = False
+        self.lock = threading.Lock() # Orders the requests submitted against the stop of the server
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, name="BatchedPolicyServer", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        # Requests that the thread did not serve fail instead of waiting forever
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            request.future.set_exception(RuntimeError("The policy server was stopped"))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def submit(self, obs, action_mask):
+        """ Queues a single observation and its action mask. It returns a future with the action """
+        request = _Request(obs, action_mask)
+        with self.lock:
+            if not self.running:
+                raise RuntimeError("The policy server is not running")
+            self.requests.put(request)
+        return request.future
+
+    def predict(self, obs, action_mask):
+        return self.submit(obs, action_mask).result()
+
+    def _serve(self):
+        while self.running:
+            try:
+                batch = [self.requests.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+
+            # Wait for more requests until the batch is full or the deadline of the oldest request expires
+            deadline = batch[0].enqueued + self.max_latency
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        start = time.perf_counter()
+        try:
+            if isinstance(batch[0].obs, dict):
+                obs = {key: np.stack([np.asarray(request.obs[key]) for request in batch]) for key in batch[0].obs}
+            else:
+                obs = np.stack([np.asarray(request.obs) for request in batch])
+            action_masks = np.stack([np.asarray(request.action_mask, dtype=bool) for request in batch])
+            actions, _ = self.model.predict(obs, action_masks=action_masks, deterministic=self.deterministic)
+        except Exception as exception:
+            for request in batch:
+                request.future.set_exception(exception)
+            return
+        end = time.perf_counter()
+        self.metrics.record(len(batch), [start - request.enqueued for request in batch], end - start)
+        for request, action in zip(batch, np.asarray(actions).reshape(len(batch))):
+            request.future.set_result(int(action))
+
+
+class PolicySocketServer():
+    """ Exposes a BatchedPolicyServer to other processes through a Unix socket. Every connection is served on its
+    own thread, so the requests of all the connected workers end up batched together """
+
+    def __init__(self, server, address):
+        self.server = server
+        self.address = address
+        self.listener = None
+        self.connections = []
+
+    def listen(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        self.listener = Listener(self.address, family='AF_UNIX')
+        print(f"[INFERENCE INFO] Serving policy on {self.address}")
+
+    def serve_forever(self):
+        if self.listener is None:
+            self.listen()
+        try:
+            while True:
+                connection = self.listener.accept()
+                self.connections.append(connection)
+                threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+        except (KeyboardInterrupt, OSError):
+            pass
+        finally:
+            self.close()
+
+    def _handle(self, connection):
+        try:
+            while True:
+                obs, action_mask = connection.recv()
+                try:
+                    reply = ("action", self.server.predict(obs, action_mask))
+                except Exception as exception:
+                    # The client raises the error of the model, and the connection keeps serving it
+                    reply = ("error", exception)
+                try:
+                    connection.send(reply)
+                except (EOFError, OSError):
+                    raise
+                except Exception:
+                    # The error could not be pickled (nothing was sent)
+                    connection.send(("error", RuntimeError(repr(reply[1]))))
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+
+class PolicyClient():
+    """ Worker side of the PolicySocketServer. It follows the predict interface used by the policy loops """
+
+    def __init__(self, address):
+        self.connection = Client(address, family='AF_UNIX')
+
+    def predict(self, obs, action_mask):
+        self.connection.send((obs, action_mask))
+        kind, value = self.connection.recv()
+        if kind == "error":
+            raise value
+        return value
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='Batched policy inference server',
+                                     description='Serves the most recent MaskablePPO model to many workers through a Unix socket.')
+    parser.add_argument('-s', '--socket', default='/tmp/ai-driven-avatar-policy.sock', help='Path of the Unix socket')
+    parser.add_argument('-b', '--max-batch-size', type=int, default=64, help='Maximum number of requests per forward pass')
+    parser.add_argument('-l', '--max-latency', type=float, default=0.005, help='Maximum time [s] a request waits for its batch')
+    parser.add_argument('--no-wandb', action='store_true', help='Loads the model saved by the checkpoint callback instead of W&B')
+    parser.add_argument('--numpy', nargs='?', const='', default=None, metavar='POLICY.npz', help='Serves a policy exported to NumPy (nn_models/policy.npz by default) without torch')
+    args = parser.parse_args()
+
+    if args.numpy is not None:
+        from src.rl_algorithms.numpy_policy import DEFAULT_POLICY_PATH, NumpyPolicy
+        model = NumpyPolicy(args.numpy or DEFAULT_POLICY_PATH)
+    else:
+        from src.rl_algorithms.ppo import load_latest_model
+        model = load_latest_model(use_wandb=not args.no_wandb)
+
+    server = BatchedPolicyServer(model,
+                                 max_batch_size=args.max_batch_size,
+                                 max_latency=args.max_latency
+                                 )
+    with server:
+        PolicySocketServer(server, args.socket).serve_forever()
+    server.metrics.report()
@@ -0,0 +1,248 @@
+import argparse
+import json
+import numpy as np
+import os
+import time
+
+from src.utils.logger import StepLogger
+
+
+DEFAULT_POLICY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'nn_models', 'policy.npz')
+
+ACTIVATIONS = {"Tanh": np.tanh,
+               "ReLU": lambda x: np.maximum(x, 0),
+               "Identity": lambda x: x
+               }
+
+
+def export_policy(model, path=DEFAULT_POLICY_PATH):
+    """ Writes the actor of a MaskablePPO <model> to a .npz file (see policy_arrays) """
+    meta, weights = policy_arrays(model)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez(path, meta=np.array(json.dumps(meta)), **weights)
+    return path
+
+
+def policy_arrays(model):
+    """ Actor of a MaskablePPO <model> as a description and NumPy arrays: the observation preprocessing of its
+    features extractor (keys in the order they are concatenated, flattened boxes and one-hot discrete spaces) and
+    the linear layers and activations of the policy network up to the action logits """
+    import torch
+    from gym import spaces as gym_spaces
+    try:
+        from gymnasium import spaces as gymnasium_spaces
+    except ImportError:
+        gymnasium_spaces = gym_spaces
+
+    def is_space(space, name):
+        return isinstance(space, (getattr(gym_spaces, name), getattr(gymnasium_spaces, name)))
+
+    policy = model.policy
+    extractor = getattr(policy, 'pi_features_extractor', policy.features_extractor)
+
+    # Observation preprocessing (CombinedExtractor for dict observations, FlattenExtractor otherwise)
+    if hasattr(extractor, 'extractors'):
+        inputs = [(key, model.observation_space.spaces[key], module) for key, module in extractor.extractors.items()]
+    else:
+        inputs = [(None, model.observation_space, extractor)]
+    observation = []
+    for key, space, module in inputs:
+        if not isinstance(module, torch.nn.Flatten) and type(module).__name__ != 'FlattenExtractor':
+            raise ValueError(f"Only flattened observations can be exported, < {key} > uses {type(module).__name__}")
+        if is_space(space, 'Box'):
+            observation.append({"key": key, "kind": "box", "shape": list(space.shape)})
+        elif is_space(space, 'Discrete'):
+            observation.append({"key": key, "kind": "discrete", "n": int(space.n)})
+        else:
+            raise ValueError(f"Observation space {space} of < {key} > can not be exported")
+
+    # Policy network: shared layers (older versions), policy layers and action logits
+    modules = list(getattr(policy.mlp_extractor, 'shared_net', [])) + list(policy.mlp_extractor.policy_net) + [policy.action_net]
+    program = []
+    weights = {}
+    for module in modules:
+        if isinstance(module, torch.nn.Linear):
+            weights[f"weight_{len(weights) // 2}"] = module.weight.detach().cpu().numpy().T.astype(np.float32)
+            weights[f"bias_{len(weights) // 2}"] = module.bias.detach().cpu().numpy().astype(np.float32)
+            program.append("Linear")
+        elif type(module).__name__ in ACTIVATIONS:
+            program.append(type(module).__name__)
+        else:
+            raise ValueError(f"Layer {type(module).__name__} of the policy network can not be exported")
+
+    return {"observation": observation, "program": program, "n_actions": int(model.action_space.n)}, weights
+
+
+class NumpyPolicy():
+    """ Masked PPO actor exported by export_policy (or given as the <meta> and <weights> of policy_arrays), run with
+    NumPy only. It follows the predict interface of MaskablePPO, so it can replace the model in the evaluation loops
+    and the inference server, and it takes single observations or batches (dicts of arrays stacked on the first
+    axis) """
+
+    def __init__(self, path=DEFAULT_POLICY_PATH, meta=None, weights=None):
+        if meta is None:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                weights = {key: data[key] for key in data.files if key != "meta"}
+        self.observation = meta["observation"]
+        self.n_actions = meta["n_actions"]
+        self.layers = []
+        n_linear = 0
+        for step in meta["program"]:
+            if step == "Linear":
+                self.layers.append((weights[f"weight_{n_linear}"], weights[f"bias_{n_linear}"]))
+                n_linear += 1
+            else:
+                self.layers.append(ACTIVATIONS[step])
+
+    def _is_batch(self, obs):
+        first = self.observation[0]
+        value = np.asarray(obs[first["key"]] if first["key"] is not None else obs)
+        return value.ndim > (len(first["shape"]) if first["kind"] == "box" else 0)
+
+    def preprocess(self, obs):
+        """ Features of a batch of observations, as the features extractor of the model computes them """
+        features = []
+        for input in self.observation:
+            value = np.asarray(obs[input["key"]] if input["key"] is not None else obs)
+            if input["kind"] == "box":
+                features.append(value.reshape(len(value), -1).astype(np.float32))
+            else:
+                features.append(np.eye(input["n"], dtype=np.float32)[value.reshape(-1).astype(np.int64)])
+        return np.concatenate(features, axis=1)
+
+    def logits(self, obs):
+        """ Unmasked action logits of a batch of observations """
+        x = self.preprocess(obs)
+        for layer in self.layers:
+            if isinstance(layer, tuple):
+                x = x @ layer[0] + layer[1]
+            else:
+                x = layer(x)
+        return x
+
+    def log_probs(self, obs, action_masks=None):
+        logits = self.logits(obs)
+        if action_masks is not None:
+            logits = np.where(np.asarray(action_masks, dtype=bool).reshape(logits.shape), logits, -np.inf)
+        logits = logits - logits.max(axis=1, keepdims=True)
+        return logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=False, action_masks=None, rng=None):
+        """ Masked argmax (<deterministic>) or sampled actions, as MaskablePPO.predict """
+        batch = self._is_batch(observation)
+        if not batch:
+            if isinstance(observation, dict):
+                observation = {key: np.asarray(value)[None] for key, value in observation.items()}
+            else:
+                observation = np.asarray(observation)[None]
+            action_masks = None if action_masks is None else np.asarray(action_masks)[None]
+        log_probs = self.log_probs(observation, action_masks)
+        if deterministic:
+            actions = log_probs.argmax(axis=1)
+        else:
+            rng = rng if rng is not None else np.random.default_rng()
+            cumulative = np.exp(log_probs).cumsum(axis=1)
+            samples = rng.random((len(cumulative), 1)) * cumulative[:, -1:]
+            actions = np.minimum((cumulative < samples).sum(axis=1), self.n_actions - 1)
+        return (actions if batch else actions[0]), None
+
+
+def verify_export(model, policy, observations, action_masks, atol=1e-4):
+    """ Compares the exported <policy> with the torch <model> on a batch of observations: maximum error of the log
+    probabilities and agreement of the masked argmax actions """
+    import torch
+    with torch.no_grad():
+        obs_tensor, _ = model.policy.obs_to_tensor(observations)
+        torch_log_probs = model.policy.get_distribution(obs_tensor).distribution.logits.cpu().numpy()
+    torch_actions, _ = model.predict(observations, action_masks=action_masks, deterministic=True)
+    numpy_actions, _ = policy.predict(observations, action_masks=action_masks, deterministic=True)
+    error = float(np.abs(policy.log_probs(observations) - torch_log_probs).max())
+    return {"observations": len(torch_log_probs),
+            "max_log_prob_error": error,
+            "action_agreement": float((np.asarray(torch_actions) == numpy_actions).mean()),
+            "equivalent": error <= atol and bool((np.asarray(torch_actions) == numpy_actions).all())
+            }
+
+
+def collect_observations(n_steps=1000, seed=0):
+    """ Observations and action masks of random policy episodes of the GymGame, stacked as a batch """
+    from src.opengym.__main__ import GymGame
+    env = GymGame()
+    generator = np.random.default_rng(seed)
+    observations, action_masks = [], []
+    obs, done = env.reset(seed=seed), False
+    while len(observations) < n_steps:
+        if done:
+            obs = env.reset()
+        mask = np.asarray(env.valid_action_mask(), dtype=bool)
+        observations.append(obs)
+        action_masks.append(mask)
+        obs, _, done, _ = env.step(int(generator.choice(np.flatnonzero(mask))))
+    return {key: np.stack([obs[key] for obs in observations]) for key in observations[0]}, np.stack(action_masks)
+
+
+class NumpyPPOAlgorithm():
+    """ PPO policy exported to NumPy (see export_policy), without torch or stable-baselines3 """
+
+    def __init__(self, environment, logger=None, path=DEFAULT_POLICY_PATH):
+        self.policy = 'PPO Masked Policy (NumPy)'
+        self.env = environment
+        self.logger = logger if logger is not None else StepLogger()
+        self.path = path
+        self.model = None
+        self.state = self.env.reset()
+
+    def reset(self, seed=None):
+        self.state = self.env.reset(seed=seed)
+        return self.state
+
+    def select_action(self, obs):
+        # Load the exported policy the first time
+        if self.model is None:
+            self.model = NumpyPolicy(self.path)
+        action, _ = self.model.predict(obs, action_masks=self.env.valid_action_mask())
+        return int(action)
+
+    def run(self):
+        obs = self.env.reset()
+        while True:
+            obs_pre, episodic_step = obs, self.env.episodic_step
+            action = self.select_action(obs)
+
+            # Run action
+            obs, reward, done, info = self.env.step(action)
+            self.logger.step(episodic_step, obs_pre, action, obs, reward, self.env.episodic_return)
+
+            # Render the game
+            self.env.render()
+            time.sleep(0.1)
+
+            # Check end conditions
+            if done == True:
+                self.logger.episode(self.policy, self.env.game.days, self.env.game.hours, self.env.episodic_return, self.env.episodic_step)
+                break
+
+        self.env.close()
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='NumPy policy export',
+                                     description='Exports the most recent masked PPO model to a NumPy-only policy and verifies it against the torch model.')
+    parser.add_argument('-o', '--output', default=DEFAULT_POLICY_PATH, help='Path of the exported policy (.npz)')
+    parser.add_argument('--best', action='store_true', help='Exports the best checkpoint instead of the latest one')
+    parser.add_argument('--no-wandb', action='store_true', help='The models were saved without W&B')
+    parser.add_argument('--verify-steps', type=int, default=1000, help='Observations of random episodes used to verify the export (0 to skip)')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from src.rl_algorithms.ppo import load_latest_model
+    model = load_latest_model(use_wandb=not args.no_wandb, best=args.best)
+    path = export_policy(model, args.output)
+    print(f"[EXPORT INFO] Policy written to {path} ({os.path.getsize(path) / 1024:.1f} KB)")
+    if args.verify_steps:
+        observations, action_masks = collect_observations(args.verify_steps)
+        for key, value in verify_export(model, NumpyPolicy(path), observations, action_masks).items():
+            print(f"[EXPORT INFO] {key}: {value}")
@@ -2,18 +2,19 @@ import datetime
 import numpy as np
 import os
 import pathlib
-import tensorflow as tf
 import time
-import wandb
+import torch
 
 from gym import Env
 from stable_baselines3.common.env_util import make_vec_env
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
 from sb3_contrib.common.maskable.policies import MaskableMultiInputActorCriticPolicy
 from stable_baselines3.common.monitor import Monitor
 from sb3_contrib.common.wrappers import ActionMasker
 from sb3_contrib.ppo_mask import MaskablePPO
-from stable_baselines3.common.callbacks import CheckpointCallback
-from wandb.integration.sb3 import WandbCallback
+from src.rl_algorithms.checkpoints import BackgroundCheckpointCallback, read_index
+from src.rl_algorithms.telemetry import MemoryProfileCallback, StepTimer, ThroughputTelemetryCallback
+from src.utils.logger import StepLogger
 
 
 def n_cpus():
@@ -21,7 +22,8 @@ def n_cpus():
 
 
 def gpu_detected():
-    return bool(tf.config.list_physical_devices(device_type='GPU'))
+    # torch is already loaded by stable-baselines3, so the device detection does not import any other framework
+    return torch.cuda.is_available()
 
 
 class CustomPolicy(MaskableMultiInputActorCriticPolicy):
@@ -34,7 +36,8 @@ class CustomPolicy(MaskableMultiInputActorCriticPolicy):
 class Defaults():
 
     TOTAL_TIMESTEPS = 10000
-    SAVE_FREQ = 10000
+    SAVE_FREQ = 10000 # Steps of every env between two checkpoints
+    KEEP_LAST_CHECKPOINTS = 3
     SAVE_GRAD_FREQ = 100
     EVAL_FREQ = 10000
     EVAL_EPISODES = 10
@@ -42,27 +45,83 @@ class Defaults():
     VERBOSITY = 2
     LOGS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'logs/ppo')
     SAVE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'nn_models')
+    SWEEPS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'sweeps')
     NAME_PREFIX = "_PPO_ActorCriticPolicy"
     POLICY = CustomPolicy
     DEVICE = "cuda" if gpu_detected() else "cpu"
     NUM_THREADS = n_cpus()
+    SUBPROC_ENVS = False # Step the vectorized environments in their own processes
+    HYPERPARAMETERS = {} # Keyword arguments of MaskablePPO (learning_rate, n_steps, batch_size, gamma, ...)
+    MEMORY_PROFILE_EVERY = None # Episodes between two memory profiling reports (None disables the profiling)
+    ASYNC_ACTORS = max(1, n_cpus() - 1) # Actor processes of the asynchronous training (the learner takes one core)
+    ASYNC_ENVS_PER_ACTOR = 4
+    ASYNC_SEGMENT_LENGTH = 128 # Steps of every trajectory segment pushed by the actors
+    ASYNC_SEGMENTS_PER_UPDATE = 16 # Segments of every PPO update (2048 steps, as the n_steps of the synchronous PPO)
+    ASYNC_MAX_STALENESS = 2 # Policy versions a segment can lag behind the learner before it is dropped
+
+
+def load_latest_model(use_wandb=True, best=False):
+    """ Loads the most recent (or the best) model saved under Defaults.SAVE_PATH """
+    # Checkpoints written by the background checkpoint callback are found through their index, among those of the
+    # runs trained with (or without) W&B
+    index = read_index(Defaults.SAVE_PATH)
+    checkpoints = [checkpoint for checkpoint in (index["checkpoints"] if index is not None else []) if checkpoint.get("wandb", False) == use_wandb]
+    if checkpoints:
+        evaluated = [checkpoint for checkpoint in checkpoints if checkpoint["eval_return"] is not None]
+        checkpoint = max(evaluated, key=lambda x: x["eval_return"]) if best and evaluated else checkpoints[-1]
+        return MaskablePPO.load(os.path.join(Defaults.SAVE_PATH, checkpoint["file"]), device=Defaults.DEVICE)
+
+    # Models saved by previous versions (W&B run folders or <prefix>_<steps>_steps.zip files, out of the index)
+    indexed = {checkpoint["file"] for checkpoint in (index["checkpoints"] if index is not None else [])}
+    models = []
+    for file in os.listdir(Defaults.SAVE_PATH):
+        try:
+            if use_wandb and os.path.exists(os.path.join(Defaults.SAVE_PATH, file, "model.zip")):
+                models.append((datetime.datetime.strptime(file.split(Defaults.NAME_PREFIX)[0], "%Y-%m-%d_%H:%M:%S").timestamp(), os.path.join(file, "model.zip")))
+            elif not use_wandb and file.endswith('_steps.zip') and file not in indexed:
+                models.append((int(file.split('_steps')[0].split('_')[-1]), file))
+        except ValueError:
+            continue
+    if not models:
+        raise FileNotFoundError(f"No model trained {'with' if use_wandb else 'without'} W&B under {Defaults.SAVE_PATH}")
+    return MaskablePPO.load(os.path.join(Defaults.SAVE_PATH, max(models)[1]), device=Defaults.DEVICE)
 
 
 class PPOAlgorithm():
 
-    def __init__(self, environment, use_vecenv=False, use_wandb=True):
+    def __init__(self, environment, use_vecenv=False, use_wandb=True, logger=None, use_async=False):
         self.env = environment
+        self.logger = logger if logger is not None else StepLogger()
         self.use_vecenv = use_vecenv
+        self.use_async = use_async
         self.use_wandb = use_wandb
-        if not self.use_vecenv:
+        self.model = None
+        self.telemetry = None
+        if not self.use_vecenv and not self.use_async:
             self.state = self.env.reset()
 
+    def reset(self, seed=None):
+        self.state = self.env.reset(seed=seed)
+        return self.state
+
+    def select_action(self, obs):
+        # Load the most recent model the first time
+        if self.model is None:
+            self.model = load_latest_model(self.use_wandb)
+
+        # Perform prediction
+        action_masks = self.env.valid_action_mask()
+        action, _states = self.model.predict(obs, action_masks=action_masks)
+        return int(action)
+
     def train(self):
         # Print information about the training
         print(f"\n[TRAINING INFO]Total timesteps to perform: {Defaults.TOTAL_TIMESTEPS}\n[TRAINING INFO]Device: {Defaults.DEVICE}")
 
         # Save tags
-        if self.use_vecenv:
+        if self.use_async:
+            tag = "_Async"
+        elif self.use_vecenv:
             tag = "_Vectorized"
         else:
             tag = "_Vanilla"
@@ -76,6 +135,10 @@ class PPOAlgorithm():
         pathlib.Path(Defaults.SAVE_PATH).mkdir(exist_ok=True)
 
         if self.use_wandb:
+            # W&B is only imported when it is going to be used
+            import wandb
+            from wandb.integration.sb3 import WandbCallback
+
             # W&B log metrics interface
             wandb_run = wandb.init(project="ai-driven-avatar",
                                    entity="academic-david",
@@ -86,22 +149,36 @@ class PPOAlgorithm():
                                    anonymous="allow",
                                    )
 
-            # W&B log callback
-            callback = WandbCallback(verbose=Defaults.VERBOSITY,
-                                     model_save_path=Defaults.SAVE_PATH + "/" + f"{wandb_run.name}",
-                                     model_save_freq=Defaults.SAVE_FREQ,
-                                     gradient_save_freq=Defaults.SAVE_GRAD_FREQ
-                                     )
+            # W&B log callback (the models are saved, and uploaded to W&B, by the checkpoint callback)
+            callbacks = [WandbCallback(verbose=Defaults.VERBOSITY,
+                                       gradient_save_freq=Defaults.SAVE_GRAD_FREQ
+                                       )]
         else:
-            # Checkpoint callback every N steps
-            #TODO Replace with EvalCallback
-            callback = CheckpointCallback(save_freq=Defaults.SAVE_FREQ,
-                                          save_path=Defaults.SAVE_PATH,
-                                          name_prefix=timestamp + Defaults.NAME_PREFIX + tag
-                                         )
-
-        # Callbacks
-        callbacks = [callback]
+            callbacks = []
+
+        # Asynchronous actor-learner training (<environment> is the env factory of the actors)
+        if self.use_async:
+            self.train_async(timestamp + Defaults.NAME_PREFIX + tag)
+            if self.use_wandb:
+                wandb.finish()
+            return
+
+        # Checkpoint callback every N steps, written in the background
+        callbacks.append(BackgroundCheckpointCallback(save_freq=Defaults.SAVE_FREQ,
+                                                      save_path=Defaults.SAVE_PATH,
+                                                      name_prefix=timestamp + Defaults.NAME_PREFIX + tag,
+                                                      keep_last=Defaults.KEEP_LAST_CHECKPOINTS,
+                                                      upload=self.use_wandb,
+                                                      verbose=Defaults.VERBOSITY
+                                                      ))
+
+        # Throughput telemetry, always recorded on the TensorBoard logs
+        self.telemetry = ThroughputTelemetryCallback(verbose=Defaults.VERBOSITY)
+        callbacks.append(self.telemetry)
+
+        # Memory growth profiling, only when enabled
+        if Defaults.MEMORY_PROFILE_EVERY:
+            callbacks.append(MemoryProfileCallback(every=Defaults.MEMORY_PROFILE_EVERY, verbose=Defaults.VERBOSITY))
 
         # Wrap environment to allow action masking
         # # Ref: https://github.com/Stable-Baselines-Team/stable-baselines3-contrib/pull/25
@@ -109,17 +186,18 @@ class PPOAlgorithm():
             return env.valid_action_mask()
 
         def get_wrapper(env: Env) -> Env:
-            return ActionMasker(env, mask_fn)
+            return StepTimer(ActionMasker(env, mask_fn))
 
         # Vectorize environment
         if self.use_vecenv:
             self.env = make_vec_env(self.env,
                                     n_envs=Defaults.NUM_THREADS,
                                     seed=Defaults.SEED,
-                                    wrapper_class=get_wrapper
+                                    wrapper_class=get_wrapper,
+                                    vec_env_cls=SubprocVecEnv if Defaults.SUBPROC_ENVS else DummyVecEnv
                                     )
         else:
-            self.env = ActionMasker(self.env, mask_fn)
+            self.env = get_wrapper(Monitor(self.env))
 
         # Build the model
         model = MaskablePPO(policy=Defaults.POLICY,
@@ -127,10 +205,12 @@ class PPOAlgorithm():
                             tensorboard_log=Defaults.LOGS_PATH,
                             verbose=Defaults.VERBOSITY,
                             seed=Defaults.SEED,
-                            device=Defaults.DEVICE
+                            device=Defaults.DEVICE,
+                            **Defaults.HYPERPARAMETERS
                             )
 
         # Train the model
+        self.model = model
         model.learn(total_timesteps=Defaults.TOTAL_TIMESTEPS,
                     callback=callbacks,
                     tb_log_name=timestamp + Defaults.NAME_PREFIX + tag
@@ -140,35 +220,60 @@ class PPOAlgorithm():
             # End logging session
             wandb.finish()
 
+    def train_async(self, name):
+        from src.pygame.assets import preload_world_assets
+        from src.rl_algorithms.async_ppo import build_learner_model, train_async
+        from src.rl_algorithms.checkpoints import CheckpointWriter
+
+        # The actors are forked after loading the world assets, so they share them instead of loading a copy each
+        preload_world_assets()
+        if 'n_steps' in Defaults.HYPERPARAMETERS:
+            print(f"[TRAINING INFO] n_steps={Defaults.HYPERPARAMETERS['n_steps']} is ignored by the asynchronous training, "
+                  f"every update takes {Defaults.ASYNC_SEGMENTS_PER_UPDATE} segments of {Defaults.ASYNC_SEGMENT_LENGTH} steps")
+        env = self.env()
+        model = build_learner_model(Defaults.POLICY, env.observation_space, env.action_space,
+                                    n_segments=Defaults.ASYNC_SEGMENTS_PER_UPDATE,
+                                    segment_length=Defaults.ASYNC_SEGMENT_LENGTH,
+                                    tensorboard_log=Defaults.LOGS_PATH,
+                                    verbose=Defaults.VERBOSITY,
+                                    seed=Defaults.SEED,
+                                    device=Defaults.DEVICE,
+                                    **{key: value for key, value in Defaults.HYPERPARAMETERS.items() if key != 'n_steps'}
+                                    )
+        env.close()
+        self.model = model
+        writer = CheckpointWriter(Defaults.SAVE_PATH, name, Defaults.KEEP_LAST_CHECKPOINTS, upload=self.use_wandb)
+        try:
+            return train_async(self.env, model, Defaults.TOTAL_TIMESTEPS, name,
+                               checkpoint_writer=writer,
+                               # SAVE_FREQ counts the steps of every env, as the vec-env calls of the checkpoint callback
+                               save_freq=Defaults.SAVE_FREQ * Defaults.ASYNC_ACTORS * Defaults.ASYNC_ENVS_PER_ACTOR,
+                               n_actors=Defaults.ASYNC_ACTORS,
+                               envs_per_actor=Defaults.ASYNC_ENVS_PER_ACTOR,
+                               segment_length=Defaults.ASYNC_SEGMENT_LENGTH,
+                               n_segments=Defaults.ASYNC_SEGMENTS_PER_UPDATE,
+                               max_staleness=Defaults.ASYNC_MAX_STALENESS,
+                               seed=Defaults.SEED
+                               )
+        finally:
+            writer.close()
+            for exception in writer.errors:
+                print(f"[TRAINING INFO] Checkpoint could not be written: {exception!r}")
+
     def evaluation(self):
         # Load the most recent model
-        if self.use_wandb:
-            models = [{'file': x, 'timestamp': str(x.split(Defaults.NAME_PREFIX)[0].split(Defaults.NAME_PREFIX)[0])} for x in os.listdir(Defaults.SAVE_PATH)]
-            latest_model = sorted(models, reverse=True, key=lambda x: datetime.datetime.strptime(x["timestamp"], "%Y-%m-%d_%H:%M:%S"))[0]['file']
-            model = MaskablePPO.load(os.path.join(Defaults.SAVE_PATH, latest_model + "/model.zip"), device=Defaults.DEVICE)
-        else:
-            models = [{'file': x, 'steps': int(x.split('_steps')[0].split('_')[-1])} for x in os.listdir(Defaults.SAVE_PATH)]
-            latest_model = sorted(models, key=lambda x: -x['steps'])[0]['file']
-            model = MaskablePPO.load(os.path.join(Defaults.SAVE_PATH, latest_model), device=Defaults.DEVICE)
+        self.model = load_latest_model(self.use_wandb)
 
         # Evaluate the model
         obs = self.env.reset()
         while True:
-            print()
-            print('>'*50)
-            print(f'[Episodic Step] {self.env.episodic_step}')
-            print(f"[State S_t-1] {self.env.state}")
-
             # Perform prediction
-            action_masks = self.env.valid_action_mask()
-            action, _states = model.predict(obs, action_masks=action_masks)
-            print(f"[Action A_t] {self.env.get_action_meanings(action)}")
+            obs_pre, episodic_step = obs, self.env.episodic_step
+            action = self.select_action(obs)
 
             # Run action
             obs, reward, done, info = self.env.step(action)
-            print(f"[State S_t] {obs}")
-            print(f"[Step reward R_t] {reward:.2f}")
-            print(f"[Episodic return G_t so far] {self.env.episodic_return:.2f}")
+            self.logger.step(episodic_step, obs_pre, action, obs, reward, self.env.episodic_return)
 
             # Render the game
             self.env.render()
@@ -176,13 +281,7 @@ class PPOAlgorithm():
 
             # Check end conditions
             if done == True:
-                print('<'*50)
-                print(f'\nSUMMARY\n')
-                data = [("Policy", "Total elapsed time", "Episodic return G_t"), ('PPO Masked Policy', f'{self.env.game.days} days, {self.env.game.hours:.2f} hours', f'{self.env.episodic_return:.2f}')]
-                for x, y, sum in data:
-                    print(f"{x:{25}} {y:{25}} {sum:{25}}")
+                self.logger.episode('PPO Masked Policy', self.env.game.days, self.env.game.hours, self.env.episodic_return, self.env.episodic_step)
                 break
-            
-            print('<'*50)
 
         self.env.close()
@@ -0,0 +1,209 @@
+import argparse
+import datetime
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+# Libraries that size their thread pools from environment variables read at import time
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS')
+RESULT_FILE = 'result.json'
+RESULTS_FILE = 'results.jsonl'
+
+
+def available_cores():
+    """ Cores the current process may run on """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+def partition_cores(cores, cores_per_run):
+    """ Disjoint core sets of <cores_per_run> cores, one per concurrent run """
+    return [cores[i:i + cores_per_run] for i in range(0, len(cores) - cores_per_run + 1, cores_per_run)]
+
+
+def expand_grid(hyperparameters, seeds):
+    """ One run configuration per combination of the hyperparameter values and seed """
+    names = list(hyperparameters)
+    runs = []
+    for values in itertools.product(*[hyperparameters[name] for name in names]):
+        for seed in seeds:
+            config = dict(zip(names, values))
+            run_id = '_'.join([f"{name}={value}" for name, value in config.items()] + [f"seed={seed}"])
+            runs.append({"run_id": run_id, "hyperparameters": config, "seed": seed})
+    return runs
+
+
+def parse_value(value):
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value
+
+
+class SweepRunner():
+    """ Runs several MaskablePPO trainings side by side within the CPU budget of the machine.
+
+    Every run is a worker process pinned to its own set of <cores_per_run> cores, with the torch and BLAS thread
+    pools capped to <torch_threads> and <n_envs> environments (stepped in their own processes, which inherit the
+    pinning). Each run writes its config, models, TensorBoard logs, output and result under
+    <store>/<sweep>/runs/<run_id>, and the results of all the runs are appended to <store>/<sweep>/results.jsonl.
+    Runs whose result already exists are skipped, so an interrupted sweep can be resumed """
+
+    def __init__(self, name, runs, total_timesteps, cores_per_run=4, n_envs=None, torch_threads=None, cores=None, store=None, use_wandb=False):
+        self.name = name
+        self.runs = runs
+        self.total_timesteps = total_timesteps
+        self.cores_per_run = cores_per_run
+        self.n_envs = n_envs or cores_per_run
+        self.torch_threads = torch_threads or cores_per_run
+        self.slots = partition_cores(cores if cores is not None else available_cores(), cores_per_run)
+        if not self.slots:
+            raise ValueError(f"Not enough cores for a run of {cores_per_run} cores")
+        if store is None:
+            from src.rl_algorithms.ppo import Defaults
+            store = Defaults.SWEEPS_PATH
+        self.path = os.path.join(store, name)
+        self.use_wandb = use_wandb
+
+    def run_path(self, run):
+        return os.path.join(self.path, 'runs', run["run_id"])
+
+    def run(self, poll_interval=1.0):
+        """ Runs all the pending runs and returns the results of all of them """
+        pending = [run for run in self.runs if not os.path.exists(os.path.join(self.run_path(run), RESULT_FILE))]
+        print(f"[SWEEP INFO] {len(pending)} of {len(self.runs)} runs pending, {len(self.slots)} at a time on {self.cores_per_run} cores each")
+        free_slots = list(self.slots)
+        running = []
+        while pending or running:
+            while pending and free_slots:
+                run, cores = pending.pop(0), free_slots.pop(0)
+                running.append((run, cores, self._launch(run, cores)))
+            time.sleep(poll_interval)
+            for item in list(running):
+                run, cores, process = item
+                if process.poll() is not None:
+                    running.remove(item)
+                    free_slots.append(cores)
+                    self._collect(run, process.returncode)
+        return self.results()
+
+    def _launch(self, run, cores):
+        path = self.run_path(run)
+        os.makedirs(path, exist_ok=True)
+        config = {**run, "total_timesteps": self.total_timesteps, "n_envs": self.n_envs, "torch_threads": self.torch_threads, "cores": cores, "use_wandb": self.use_wandb}
+        with open(os.path.join(path, 'config.json'), 'w') as f:
+            json.dump(config, f, indent=2)
+
+        # The thread caps have to be in the environment before numpy and torch are imported
+        env = dict(os.environ, **{variable: str(self.torch_threads) for variable in THREAD_VARIABLES})
+        env.setdefault('SDL_VIDEODRIVER', 'dummy')
+        print(f"[SWEEP INFO] Run {run['run_id']} started on cores {cores}")
+        with open(os.path.join(path, 'output.log'), 'w') as output:
+            return subprocess.Popen([sys.executable, '-m', 'src.rl_algorithms.sweep', '--worker', path], env=env, stdout=output, stderr=subprocess.STDOUT)
+
+    def _collect(self, run, returncode):
+        path = os.path.join(self.run_path(run), RESULT_FILE)
+        if returncode == 0 and os.path.exists(path):
+            with open(path) as f:
+                result = json.load(f)
+        else:
+            result = {**run, "status": "failed", "returncode": returncode}
+        with open(os.path.join(self.path, RESULTS_FILE), 'a') as f:
+            f.write(json.dumps(result) + '\n')
+        print(f"[SWEEP INFO] Run {run['run_id']} {result['status']}")
+
+    def results(self):
+        results = []
+        for run in self.runs:
+            path = os.path.join(self.run_path(run), RESULT_FILE)
+            if os.path.exists(path):
+                with open(path) as f:
+                    results.append(json.load(f))
+        return results
+
+
+def run_worker(path):
+    """ Trains one run of a sweep with the configuration written in <path> """
+    with open(os.path.join(path, 'config.json')) as f:
+        config = json.load(f)
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, config["cores"])
+
+    import torch
+    torch.set_num_threads(config["torch_threads"])
+    from src.opengym.__main__ import GymGame
+    from src.rl_algorithms.checkpoints import read_index
+    from src.rl_algorithms.ppo import Defaults, PPOAlgorithm
+
+    # The run configuration replaces the defaults of this process
+    Defaults.TOTAL_TIMESTEPS = config["total_timesteps"]
+    Defaults.SAVE_FREQ = max(1, config["total_timesteps"] // config["n_envs"])
+    Defaults.SEED = config["seed"]
+    Defaults.NUM_THREADS = config["n_envs"]
+    Defaults.SUBPROC_ENVS = config["n_envs"] > 1
+    Defaults.HYPERPARAMETERS = config["hyperparameters"]
+    Defaults.SAVE_PATH = os.path.join(path, 'models')
+    Defaults.LOGS_PATH = os.path.join(path, 'logs')
+
+    start = time.perf_counter()
+    if config["n_envs"] > 1:
+        algorithm = PPOAlgorithm(GymGame, use_vecenv=True, use_wandb=config["use_wandb"])
+    else:
+        algorithm = PPOAlgorithm(GymGame(), use_wandb=config["use_wandb"])
+    algorithm.train()
+    wall_time = time.perf_counter() - start
+
+    totals = algorithm.telemetry.totals
+    index = read_index(Defaults.SAVE_PATH) or {}
+    result = {"run_id": config["run_id"],
+              "hyperparameters": config["hyperparameters"],
+              "seed": config["seed"],
+              "status": "done",
+              "finished": datetime.datetime.now().isoformat(timespec='seconds'),
+              "total_timesteps": algorithm.model.num_timesteps,
+              "wall_time_s": wall_time,
+              "env_steps_per_sec": totals["env_steps"] / max(totals["rollout_time_s"], 1e-9),
+              "train_time_s": totals["train_time_s"],
+              "rollout_time_s": totals["rollout_time_s"],
+              "latest_eval_return": (index.get("latest") or {}).get("eval_return"),
+              "best_eval_return": (index.get("best") or {}).get("eval_return"),
+              "best_checkpoint": (index.get("best") or {}).get("file")
+              }
+    with open(os.path.join(path, RESULT_FILE + '.tmp'), 'w') as f:
+        json.dump(result, f, indent=2)
+    os.replace(os.path.join(path, RESULT_FILE + '.tmp'), os.path.join(path, RESULT_FILE))
+
+
+if __name__ == "__main__":
+
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(prog='PPO sweep',
+                                     description='Runs MaskablePPO trainings over a grid of hyperparameters and seeds, side by side within a CPU budget.')
+    parser.add_argument('-n', '--name', default=datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S"), help='Name of the sweep in the results store')
+    parser.add_argument('-p', '--param', nargs='+', metavar='NAME=V1,V2,...', default=[], help='MaskablePPO keyword arguments to sweep, e.g. learning_rate=3e-4,1e-4 n_steps=1024,2048')
+    parser.add_argument('-s', '--seeds', nargs='+', type=int, default=[42], help='Seeds of every configuration')
+    parser.add_argument('-t', '--timesteps', type=int, default=10000, help='Total timesteps of every run')
+    parser.add_argument('-c', '--cores-per-run', type=int, default=4, help='Cores pinned to every run')
+    parser.add_argument('--n-envs', type=int, default=None, help='Environments of every run (cores per run by default)')
+    parser.add_argument('--torch-threads', type=int, default=None, help='Torch and BLAS threads of every run (cores per run by default)')
+    parser.add_argument('--store', default=None, help='Folder of the results store (Defaults.SWEEPS_PATH by default)')
+    parser.add_argument('--wandb', action='store_true', help='Logs every run on W&B')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        run_worker(args.worker)
+    else:
+        hyperparameters = {name: [parse_value(value) for value in values.split(',')] for name, values in (param.split('=') for param in args.param)}
+        runner = SweepRunner(args.name, expand_grid(hyperparameters, args.seeds), args.timesteps, args.cores_per_run, args.n_envs, args.torch_threads, store=args.store, use_wandb=args.wandb)
+        results = runner.run()
+        print(f"\nSWEEP {args.name}\n")
+        print(f"{'Run':{50}} {'Env steps/sec':{15}} {'Best eval return':{20}} {'Wall time [s]':{15}}")
+        for result in results:
+            best = f"{result['best_eval_return']:.2f}" if result['best_eval_return'] is not None else '-'
+            print(f"{result['run_id']:{50}} {result['env_steps_per_sec']:<{15}.1f} {best:{20}} {result['wall_time_s']:<{15}.1f}")
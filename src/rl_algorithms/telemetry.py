@@ -0,0 +1,140 @@
+import numpy as np
+import time
+
+from gym import Wrapper
+from stable_baselines3.common.callbacks import BaseCallback
+from src.utils.memory import MemoryProfiler
+
+
+class StepTimer(Wrapper):
+    """ Measures the time of every env step and of the action mask computations. It wraps the ActionMasker, so the
+    timings travel with the info dict of every step and also work with vectorized environments in subprocesses """
+
+    def __init__(self, env):
+        super().__init__(env)
+        self.mask_time = 0 # [s] Spent computing masks since the last step
+
+    def action_masks(self):
+        start = time.perf_counter()
+        masks = self.env.action_masks()
+        self.mask_time += time.perf_counter() - start
+        return masks
+
+    def step(self, action):
+        start = time.perf_counter()
+        obs, reward, done, info = self.env.step(action)
+        info["telemetry"] = {"step_time": time.perf_counter() - start, "mask_time": self.mask_time}
+        self.mask_time = 0
+        return obs, reward, done, info
+
+
+class ThroughputTelemetryCallback(BaseCallback):
+    """ Records where the wall time of a training run goes, once per rollout:
+
+    - telemetry/env_steps_per_sec: env steps collected per second of rollout (all the envs)
+    - telemetry/rollout_time_s and telemetry/train_time_s: time in collect_rollouts and in the gradient update
+    - telemetry/env_step_time_s and telemetry/mask_time_s: time inside env.step and computing action masks
+    - telemetry/rollout_overhead_time_s: rest of the rollout (policy forward pass and rollout buffer handling)
+    - telemetry/step_latency_ms_p50, p95, p99 and max: latency of the individual env steps
+
+    The values go to the logger of the model, so they end up in the TensorBoard run under Defaults.LOGS_PATH.
+    The envs have to be wrapped with StepTimer. """
+
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self.rollout_start = None
+        self.rollout_end = None
+        self.step_times = []
+        self.mask_time = 0 # [s]
+        self.totals = {"rollout_time_s": 0, "train_time_s": 0, "env_step_time_s": 0, "mask_time_s": 0, "env_steps": 0}
+
+    def _on_rollout_start(self):
+        self.rollout_start = time.perf_counter()
+        if self.rollout_end is not None:
+            self._record_train_time(self.rollout_start - self.rollout_end)
+        self.step_times = []
+        self.mask_time = 0
+
+    def _on_step(self):
+        for info in self.locals.get("infos", []):
+            telemetry = info.get("telemetry")
+            if telemetry is not None:
+                self.step_times.append(telemetry["step_time"])
+                self.mask_time += telemetry["mask_time"]
+        return True
+
+    def _on_rollout_end(self):
+        self.rollout_end = time.perf_counter()
+        rollout_time = self.rollout_end - self.rollout_start
+        step_times = np.array(self.step_times, dtype=np.float64)
+        env_step_time = float(step_times.sum())
+
+        self.logger.record("telemetry/env_steps_per_sec", len(step_times) / rollout_time if rollout_time > 0 else 0)
+        self.logger.record("telemetry/rollout_time_s", rollout_time)
+        self.logger.record("telemetry/env_step_time_s", env_step_time)
+        self.logger.record("telemetry/mask_time_s", self.mask_time)
+        self.logger.record("telemetry/rollout_overhead_time_s", max(0, rollout_time - env_step_time - self.mask_time))
+        if len(step_times):
+            for percentile in (50, 95, 99):
+                self.logger.record(f"telemetry/step_latency_ms_p{percentile}", float(np.percentile(step_times, percentile)) * 1000)
+            self.logger.record("telemetry/step_latency_ms_max", float(step_times.max()) * 1000)
+
+        self.totals["rollout_time_s"] += rollout_time
+        self.totals["env_step_time_s"] += env_step_time
+        self.totals["mask_time_s"] += self.mask_time
+        self.totals["env_steps"] += len(step_times)
+
+    def _on_training_end(self):
+        # The last gradient update runs after the last rollout
+        if self.rollout_end is not None:
+            self._record_train_time(time.perf_counter() - self.rollout_end)
+            self.logger.dump(self.num_timesteps)
+        if self.verbose > 0:
+            self.report()
+
+    def _record_train_time(self, train_time):
+        self.logger.record("telemetry/train_time_s", train_time)
+        self.totals["train_time_s"] += train_time
+
+    def report(self):
+        total_time = self.totals["rollout_time_s"] + self.totals["train_time_s"]
+        print(f"\n[TRAINING INFO] Env steps/sec (rollout): {self.totals['env_steps'] / max(self.totals['rollout_time_s'], 1e-9):.1f}")
+        for key in ("rollout_time_s", "train_time_s", "env_step_time_s", "mask_time_s"):
+            print(f"[TRAINING INFO] {key}: {self.totals[key]:.2f} ({100 * self.totals[key] / max(total_time, 1e-9):.1f}% of the run)")
+
+
+class MemoryProfileCallback(BaseCallback):
+    """ Opt-in memory profiling of a training run (see MemoryProfiler). The episodes finished by any env drive the
+    profiler, and every report goes to the logger of the model:
+
+    - memory/traced_mb and memory/rss_mb: traced Python memory and resident set size of the training process
+    - memory/traced_growth_kb_per_episode and memory/rss_growth_kb_per_episode: growth since the baseline
+    - memory/<subsystem>_growth_kb: growth of the allocations of every subsystem since the baseline
+
+    Only the allocations of the training process are traced, so the envs should not run in subprocesses """
+
+    def __init__(self, every=10, top=10, warmup=2, verbose=0):
+        super().__init__(verbose)
+        self.profiler = MemoryProfiler(every=every, top=top, warmup=warmup, console=verbose > 0)
+
+    def _on_training_start(self):
+        self.profiler.start()
+
+    def _on_step(self):
+        for done in self.locals.get("dones", []):
+            if done:
+                report = self.profiler.episode_end()
+                if report is not None:
+                    self._record(report)
+        return True
+
+    def _record(self, report):
+        self.logger.record("memory/traced_mb", report["traced_mb"])
+        self.logger.record("memory/rss_mb", report["rss_mb"])
+        self.logger.record("memory/traced_growth_kb_per_episode", report["traced_growth_mb_per_episode"] * 1024)
+        self.logger.record("memory/rss_growth_kb_per_episode", report["rss_growth_mb_per_episode"] * 1024)
+        for name, growth in report["subsystems_growth_mb"].items():
+            self.logger.record(f"memory/{name}_growth_kb", growth * 1024)
+
+    def _on_training_end(self):
+        self.profiler.stop()
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+def segments_blocked(starts: np.ndarray, ends: np.ndarray, rects: np.ndarray) -> np.ndarray:
+    """ Vectorized line of sight test. It returns, for every segment <start> to <end>, True if the segment crosses
+    the interior of any of the rectangles given as rows of (x, y, width, height) """
+    return segments_crossing(starts, ends, rects).any(axis=1)
+
+
+def segments_crossing(starts: np.ndarray, ends: np.ndarray, rects: np.ndarray) -> np.ndarray:
+    """ It returns a (segments, rects) matrix, True where the segment <start> to <end> crosses the interior of the
+    rectangle given as a row of (x, y, width, height).
+
+    Slab method: each rectangle is the intersection of one slab per axis, and the segment is blocked when the
+    parametric intervals inside both slabs overlap within [0, 1]. Segments that only graze an edge or a corner
+    are not blocked. """
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+    if len(starts) == 0 or len(rects) == 0:
+        return np.zeros((len(starts), len(rects)), dtype=bool)
+
+    direction = (ends - starts)[:, None, :] # (segments, 1, axis)
+    origin = starts[:, None, :]
+    low = rects[None, :, :2] # (1, rects, axis)
+    high = low + rects[None, :, 2:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (low - origin) / direction
+        t2 = (high - origin) / direction
+    t_min = np.minimum(t1, t2)
+    t_max = np.maximum(t1, t2)
+
+    # Segments parallel to an axis are either always or never inside the slab of that axis
+    parallel = direction == 0
+    inside = (origin > low) & (origin < high)
+    t_min = np.where(parallel, np.where(inside, -np.inf, np.inf), t_min)
+    t_max = np.where(parallel, np.where(inside, np.inf, -np.inf), t_max)
+
+    t_enter = np.maximum(t_min.max(axis=2), 0)
+    t_exit = np.minimum(t_max.min(axis=2), 1)
+    return t_enter < t_exit
@@ -0,0 +1,142 @@
+import json
+import numpy as np
+import queue
+import threading
+import time
+
+from enum import Enum, IntEnum
+from src.utils.actions import Action
+
+
+class LogLevel(IntEnum):
+    SILENT = 0 # Nothing is logged
+    SUMMARY = 1 # Only the summary of every episode
+    STEP = 2 # A compact record of every sampled step
+    VERBOSE = 3 # The full console output of the policy loops (observations included)
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, Enum):
+        return value.name
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class JsonlWriter():
+    """ Writes records as JSON lines from a background thread. The records are queued as they are, so their
+    serialization and the writes to disk are done in batches outside of the simulation loop """
+
+    _STOP = object()
+
+    def __init__(self, path, max_batch_size=1000):
+        self.file = open(path, 'a')
+        self.max_batch_size = max_batch_size
+        self.records = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="JsonlWriter", daemon=True)
+        self.thread.start()
+
+    def write(self, record):
+        self.records.put(record)
+
+    def _run(self):
+        running = True
+        while running:
+            batch = [self.records.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            if JsonlWriter._STOP in batch:
+                running = False
+                batch = [record for record in batch if record is not JsonlWriter._STOP]
+            self.file.write(''.join(json.dumps(record, default=_to_json) + '\n' for record in batch))
+            self.file.flush()
+
+    def close(self):
+        self.records.put(JsonlWriter._STOP)
+        self.thread.join()
+        self.file.close()
+
+
+class StepLogger():
+    """ Logging sink of the policy loops.
+
+    Steps are only formatted when the level is STEP or higher and the step is sampled (every <every> steps).
+    The VERBOSE level keeps the original console output of the loops. When <path> is given, the sampled steps, the
+    messages and the episode summaries are also written as JSON lines by a background JsonlWriter. """
+
+    def __init__(self, level=LogLevel.SUMMARY, every=1, path=None, console=True):
+        self.level = LogLevel(level)
+        self.every = max(1, every)
+        self.console = console
+        self.writer = JsonlWriter(path) if path is not None else None
+
+    def is_enabled(self, level):
+        return self.level >= level
+
+    def message(self, text, *args, level=LogLevel.VERBOSE):
+        """ Logs <text>, formatted with <args> (str.format) only when the level is enabled """
+        if self.level < level or (not self.console and self.writer is None):
+            return
+        if args:
+            text = text.format(*args)
+        if self.console:
+            print(text)
+        if self.writer is not None:
+            self.writer.write({"type": "message", "time": time.time(), "text": text})
+
+    def step(self, episodic_step, state_pre, action, state, reward, episodic_return, valid_actions=None):
+        if self.level < LogLevel.STEP or episodic_step % self.every:
+            return
+        if self.console:
+            if self.level >= LogLevel.VERBOSE:
+                print()
+                print('>'*50)
+                print(f'[Episodic Step] {episodic_step}')
+                print(f"[State S_t-1] {state_pre}")
+                if valid_actions is not None:
+                    print(f"[Action space A_t] {[Action(valid_action) for valid_action in valid_actions]}")
+                print(f"[Action A_t] {Action(action)}")
+                print(f"[State S_t] {state}")
+                print(f"[Step reward R_t] {reward:.2f}")
+                print(f"[Episodic return G_t so far] {episodic_return:.2f}")
+                print('<'*50)
+            else:
+                print(f"[Episodic Step] {episodic_step} [Action A_t] {Action(action).name} [Step reward R_t] {reward:.2f} [Episodic return G_t so far] {episodic_return:.2f}")
+        if self.writer is not None:
+            self.writer.write({"type": "step",
+                               "time": time.time(),
+                               "episodic_step": episodic_step,
+                               "action": Action(action),
+                               "valid_actions": valid_actions,
+                               "reward": reward,
+                               "episodic_return": episodic_return,
+                               "state": state
+                               })
+
+    def episode(self, policy, days, hours, episodic_return, episodic_step):
+        if self.level < LogLevel.SUMMARY:
+            return
+        if self.console:
+            print(f'\nSUMMARY\n')
+            data = [("Policy", "Total elapsed time", "Episodic return G_t"), (policy, f'{days} days, {hours:.2f} hours', f'{episodic_return:.2f}')]
+            for x, y, sum in data:
+                print(f"{x:{25}} {y:{25}} {sum:{25}}")
+        if self.writer is not None:
+            self.writer.write({"type": "episode",
+                               "time": time.time(),
+                               "policy": policy,
+                               "days": days,
+                               "hours": hours,
+                               "episodic_return": episodic_return,
+                               "episodic_steps": episodic_step
+                               })
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
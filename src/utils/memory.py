@@ -0,0 +1,137 @@
+import gc
+import numpy as np
+import os
+import resource
+import tracemalloc
+
+
+# Subsystem of an allocation site, by the first fragment found in the path of its file
+SUBSYSTEMS = (('src/pygame/drives', 'drives'),
+              ('src/utils/pathfinding', 'pathfinding'),
+              ('src/pygame/tilemap', 'map'),
+              ('src/pygame/mapbundle', 'map'),
+              ('src/pygame/assets', 'map'),
+              ('src/pygame/sprites', 'sprites'),
+              ('src/pygame', 'game'),
+              ('src/opengym', 'env'),
+              ('src/rl_algorithms', 'algorithms'),
+              ('src/utils', 'utils'),
+              ('site-packages/pygame', 'pygame'),
+              ('site-packages/torch', 'torch'),
+              ('stable_baselines3', 'sb3'),
+              ('sb3_contrib', 'sb3'),
+              ('site-packages/numpy', 'numpy'),
+              )
+
+
+def current_rss_mb():
+    """ Resident set size of the process [MB] (peak RSS where /proc is not available) """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def subsystem(filename):
+    filename = filename.replace(os.sep, '/')
+    for fragment, name in SUBSYSTEMS:
+        if fragment in filename:
+            return name
+    return 'other'
+
+
+def growth_per_episode(values):
+    """ Slope of the least squares line through one measurement per episode """
+    if len(values) < 2:
+        return 0.0
+    return float(np.polyfit(np.arange(len(values)), np.asarray(values, dtype=np.float64), 1)[0])
+
+
+class MemoryProfiler():
+    """ Opt-in memory profiling of long runs with tracemalloc.
+
+    episode_end() must be called at the end of every episode. After <warmup> episodes (caches and lazily loaded
+    assets filled) it takes the baseline snapshot, and from then on it measures the traced memory and the RSS after
+    every episode and compares a new snapshot with the baseline every <every> episodes: the <top> allocation sites
+    that grew the most and the growth of every subsystem. A run whose episodes release what they allocate keeps
+    its traced memory flat around the baseline """
+
+    def __init__(self, every=10, top=10, warmup=2, frames=1, console=True):
+        self.every = every
+        self.top = top
+        self.warmup = warmup
+        self.frames = frames
+        self.console = console
+        self.episodes = 0
+        self.baseline = None
+        self.traced_mb = [] # After every episode since the baseline
+        self.rss_mb = []
+        self.reports = []
+        self.started = False # Whether the tracing was started by this profiler
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.started = True
+        return self
+
+    def stop(self):
+        # Tracing started by someone else is left running
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+
+    def _snapshot(self):
+        gc.collect()
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                          tracemalloc.Filter(False, __file__),
+                                                          tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")])
+
+    def episode_end(self):
+        self.episodes += 1
+        if self.episodes < self.warmup:
+            return None
+        if self.baseline is None:
+            self.baseline = self._snapshot()
+        else:
+            gc.collect()
+        self.traced_mb.append(tracemalloc.get_traced_memory()[0] / 1024**2)
+        self.rss_mb.append(current_rss_mb())
+        if (self.episodes - self.warmup) % self.every == 0 and self.episodes > self.warmup:
+            return self.report()
+        return None
+
+    def report(self):
+        """ Growth since the baseline by allocation site and by subsystem, None before the baseline is taken """
+        if self.baseline is None:
+            return None
+        differences = self._snapshot().compare_to(self.baseline, 'lineno')
+        by_subsystem = {}
+        for difference in differences:
+            name = subsystem(difference.traceback[0].filename)
+            by_subsystem[name] = by_subsystem.get(name, 0) + difference.size_diff / 1024**2
+        report = {"episode": self.episodes,
+                  "traced_mb": self.traced_mb[-1],
+                  "rss_mb": self.rss_mb[-1],
+                  "traced_growth_mb_per_episode": growth_per_episode(self.traced_mb),
+                  "rss_growth_mb_per_episode": growth_per_episode(self.rss_mb),
+                  "subsystems_growth_mb": dict(sorted(by_subsystem.items(), key=lambda item: -item[1])),
+                  "top_sites": [{"site": f"{difference.traceback[0].filename}:{difference.traceback[0].lineno}",
+                                 "growth_kb": difference.size_diff / 1024,
+                                 "blocks": difference.count_diff
+                                 } for difference in sorted(differences, key=lambda difference: -difference.size_diff)[:self.top]]
+                  }
+        self.reports.append(report)
+        if self.console:
+            self.print_report(report)
+        return report
+
+    @staticmethod
+    def print_report(report):
+        print(f"\n[MEMORY INFO] Episode {report['episode']}: traced {report['traced_mb']:.2f} MB, RSS {report['rss_mb']:.1f} MB, "
+              f"growth {report['traced_growth_mb_per_episode'] * 1024:.1f} KB/episode (traced), {report['rss_growth_mb_per_episode'] * 1024:.1f} KB/episode (RSS)")
+        for name, growth in report["subsystems_growth_mb"].items():
+            print(f"[MEMORY INFO] {name:{15}} {growth * 1024:>10.1f} KB since the baseline")
+        for site in report["top_sites"]:
+            print(f"[MEMORY INFO] {site['growth_kb']:>10.1f} KB {site['blocks']:>7} blocks  {site['site']}")
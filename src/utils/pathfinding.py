@@ -1,6 +1,9 @@
+import heapq
+import numpy as np
+
 from collections import deque
 from queue import PriorityQueue
-from typing import Tuple, Dict, Deque, List, Union
+from typing import Callable, Iterable, Tuple, Dict, Deque, List, Union
 from src.pygame.tilemap import Spot
 from src.utils.actions import Action
 
@@ -37,7 +40,6 @@ def reconstruct_path(came_from: Dict[Spot, Spot], current: Spot, start: Spot) ->
         next_pos = sequence_pos.popleft()
         sequence_actions.append(get_movement_action(pos_init, next_pos))
         pos_init = next_pos
-    print(f"[A* Optimal path actions] {sequence_actions}")
     return sequence_actions
 
 def a_star_algorithm(graph_map: List[List[Spot]], start: Spot, end: Spot) -> Union[Deque, None]:
@@ -45,10 +47,8 @@ def a_star_algorithm(graph_map: List[List[Spot]], start: Spot, end: Spot) -> Uni
     open_set = PriorityQueue()
     open_set.put((0, count, start))
     came_from = dict()
-    cost_so_far = {spot: float("inf") for row in graph_map for spot in row}
-    cost_so_far[start] = 0
-    priority = {spot: float("inf") for row in graph_map for spot in row}
-    priority[start] = heuristic(start.get_pos(), end.get_pos())
+    # Costs of the spots reached so far (the rest are infinite), so the search does not visit the whole map
+    cost_so_far = {start: 0}
     open_set_hash = {start}
 
     while not open_set.empty():
@@ -58,12 +58,365 @@ def a_star_algorithm(graph_map: List[List[Spot]], start: Spot, end: Spot) -> Uni
             return reconstruct_path(came_from, current, start)
         for neighbor in current.neighbors:
             new_cost_so_far = cost_so_far[current] + 1 # Here we assume all the edges are value 1, no cost moving
-            if new_cost_so_far < cost_so_far[neighbor]:
+            if new_cost_so_far < cost_so_far.get(neighbor, float("inf")):
                 came_from[neighbor] = current
                 cost_so_far[neighbor] = new_cost_so_far
-                priority[neighbor] = new_cost_so_far + heuristic(neighbor.get_pos(), end.get_pos())
                 if neighbor not in open_set_hash:
                     count += 1
-                    open_set.put((priority[neighbor], count, neighbor))
+                    open_set.put((new_cost_so_far + heuristic(neighbor.get_pos(), end.get_pos()), count, neighbor))
                     open_set_hash.add(neighbor)
     return None
+
+# Neighbors of a tile in the order of Spot.update_neighbors (down, up, right, left) as (row, col) steps
+GRID_NEIGHBORS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+def grid_a_star(is_blocked: Callable[[int, int], bool], start: Tuple[int], end: Tuple[int]) -> Union[Deque, None]:
+    """ A* on the tile grid of <is_blocked(col, row)>, from and to (row, col) positions. It builds no graph, so it
+    works on streamed maps (ChunkedWorld.is_blocked) and only touches the tiles it explores """
+    count = 0
+    open_set = [(heuristic(start, end), count, start)]
+    came_from = dict()
+    cost_so_far = {start: 0}
+    open_set_hash = {start}
+
+    while open_set:
+        current = heapq.heappop(open_set)[2]
+        open_set_hash.remove(current)
+        if current == end:
+            return reconstruct_grid_path(came_from, current)
+        for d_row, d_col in GRID_NEIGHBORS:
+            neighbor = (current[0] + d_row, current[1] + d_col)
+            if is_blocked(neighbor[1], neighbor[0]):
+                continue
+            new_cost_so_far = cost_so_far[current] + 1
+            if new_cost_so_far < cost_so_far.get(neighbor, float("inf")):
+                came_from[neighbor] = current
+                cost_so_far[neighbor] = new_cost_so_far
+                if neighbor not in open_set_hash:
+                    count += 1
+                    heapq.heappush(open_set, (new_cost_so_far + heuristic(neighbor, end), count, neighbor))
+                    open_set_hash.add(neighbor)
+    return None
+
+def reconstruct_grid_path(came_from: Dict[Tuple[int], Tuple[int]], current: Tuple[int]) -> Deque:
+    sequence_actions = deque()
+    while current in came_from:
+        previous = came_from[current]
+        sequence_actions.appendleft(get_movement_action(previous, current))
+        current = previous
+    return sequence_actions
+
+def nearest_target_path(start: Spot, targets: Iterable[Spot]) -> Union[Tuple[Spot, Deque], None]:
+    """ Breadth-first search from <start> that stops at the first of the <targets> it reaches, which is the nearest
+    reachable one. It returns that target and the sequence of actions to reach it, or None if none is reachable """
+    targets = set(targets)
+    if start in targets:
+        return start, deque()
+    came_from = dict()
+    visited = {start}
+    frontier = deque([start])
+    while frontier:
+        current = frontier.popleft()
+        for neighbor in current.neighbors: # All the edges are value 1, so the first visit is the shortest
+            if neighbor not in visited:
+                visited.add(neighbor)
+                came_from[neighbor] = current
+                if neighbor in targets:
+                    return neighbor, reconstruct_path(came_from, neighbor, start)
+                frontier.append(neighbor)
+    return None
+
+def grid_nearest_target_path(is_blocked: Callable[[int, int], bool], start: Tuple[int], targets: Iterable[Tuple[int]]) -> Union[Tuple[Tuple[int], Deque], None]:
+    """ nearest_target_path on the tile grid of <is_blocked(col, row)>, from and to (row, col) positions """
+    targets = set(targets)
+    if start in targets:
+        return start, deque()
+    came_from = dict()
+    visited = {start}
+    frontier = deque([start])
+    while frontier:
+        current = frontier.popleft()
+        for d_row, d_col in GRID_NEIGHBORS:
+            neighbor = (current[0] + d_row, current[1] + d_col)
+            if neighbor not in visited and not is_blocked(neighbor[1], neighbor[0]):
+                visited.add(neighbor)
+                came_from[neighbor] = current
+                if neighbor in targets:
+                    return neighbor, reconstruct_grid_path(came_from, neighbor)
+                frontier.append(neighbor)
+    return None
+
+def grid_lookup(obstacle_grid) -> Callable[[int, int], bool]:
+    """ is_blocked(col, row) of an obstacle grid (rows, cols), True outside of it. The grid is read once into lists,
+    much faster to index one tile at a time than an array """
+    walls = [[bool(wall) for wall in row] for row in np.asarray(obstacle_grid).tolist()]
+    rows, cols = len(walls), len(walls[0]) if walls else 0
+
+    def is_blocked(col, row):
+        return not (0 <= row < rows and 0 <= col < cols) or walls[row][col]
+    return is_blocked
+
+def jump_point_search(is_blocked: Callable[[int, int], bool], start: Tuple[int], end: Tuple[int]) -> Union[Deque, None]:
+    """ Jump point search on the 4-connected tile grid of <is_blocked(col, row)>, from and to (row, col) positions.
+    Straight runs of tiles are skipped without queueing them: horizontal jumps stop next to the corners of the
+    obstacles, and vertical jumps stop where a horizontal jump from them would stop. Only those jump points enter
+    the open set, so open areas cost a few scans instead of one node per tile. It returns a shortest path
+    (grid_a_star keeps the first priority of the tiles in its open set, so it may return a slightly longer one) """
+    if is_blocked(start[1], start[0]) or is_blocked(end[1], end[0]):
+        return None
+
+    # Result of the horizontal jumps by origin and direction. The vertical jumps scan the same rows again and again,
+    # and every tile scanned on the way to a result has that same result
+    horizontal_jumps = dict()
+
+    def jump_horizontal(row, col, d_col):
+        origins = []
+        while True:
+            if (row, col, d_col) in horizontal_jumps:
+                result = horizontal_jumps[(row, col, d_col)]
+                break
+            origins.append(col)
+            col += d_col
+            if is_blocked(col, row):
+                result = None
+                break
+            # Goal or forced neighbors: a tile above or below that the previous column could not reach
+            if (row, col) == end or (not is_blocked(col, row - 1) and is_blocked(col - d_col, row - 1)) or (not is_blocked(col, row + 1) and is_blocked(col - d_col, row + 1)):
+                result = (row, col)
+                break
+        for origin in origins:
+            horizontal_jumps[(row, origin, d_col)] = result
+        return result
+
+    def jump_vertical(row, col, d_row):
+        while True:
+            row += d_row
+            if is_blocked(col, row):
+                return None
+            if (row, col) == end:
+                return row, col
+            if (not is_blocked(col - 1, row) and is_blocked(col - 1, row - d_row)) or (not is_blocked(col + 1, row) and is_blocked(col + 1, row - d_row)):
+                return row, col
+            if jump_horizontal(row, col, 1) is not None or jump_horizontal(row, col, -1) is not None:
+                return row, col
+
+    def jump(node, direction):
+        if direction[0]:
+            return jump_vertical(node[0], node[1], direction[0])
+        return jump_horizontal(node[0], node[1], direction[1])
+
+    count = 0
+    open_set = [(heuristic(start, end), count, start)]
+    came_from = dict()
+    cost_so_far = {start: 0}
+    closed = set()
+
+    while open_set:
+        current = heapq.heappop(open_set)[2]
+        if current in closed:
+            continue
+        if current == end:
+            return reconstruct_jump_path(came_from, current)
+        closed.add(current)
+
+        # Pruned directions: all from the start, else ahead and to both sides of the move that reached the node
+        if current in came_from:
+            parent = came_from[current]
+            d_row, d_col = (current[0] > parent[0]) - (current[0] < parent[0]), (current[1] > parent[1]) - (current[1] < parent[1])
+            directions = ((d_row, d_col), (d_col, d_row), (-d_col, -d_row))
+        else:
+            directions = GRID_NEIGHBORS
+        for direction in directions:
+            neighbor = jump(current, direction)
+            if neighbor is None or neighbor in closed:
+                continue
+            new_cost_so_far = cost_so_far[current] + heuristic(current, neighbor) # Jump points are aligned with their parent
+            if new_cost_so_far < cost_so_far.get(neighbor, float("inf")):
+                came_from[neighbor] = current
+                cost_so_far[neighbor] = new_cost_so_far
+                count += 1
+                heapq.heappush(open_set, (new_cost_so_far + heuristic(neighbor, end), count, neighbor))
+    return None
+
+def reconstruct_jump_path(came_from: Dict[Tuple[int], Tuple[int]], current: Tuple[int]) -> Deque:
+    """ Actions along the straight segments between the jump points """
+    sequence_actions = deque()
+    while current in came_from:
+        previous = came_from[current]
+        action = get_movement_action(previous, current)
+        sequence_actions.extendleft([action] * heuristic(previous, current))
+        current = previous
+    return sequence_actions
+
+
+class HierarchicalPathfinder():
+    """ HPA* on a tile grid (rows, cols) of obstacles. The map is split once into square clusters of <cluster_size>
+    tiles, and an abstract graph links the entrances between neighboring clusters: one transition in the middle of
+    every free span of a border, or one at every end for spans of <long_entrance> tiles or more, and the distances
+    between the transitions of the same cluster. A query connects its start and end to the transitions of their
+    clusters, searches the abstract graph and refines every hop inside a cluster with a search of that cluster only.
+    The paths are near-optimal (they go through the transitions), and a query costs about the same on any map size.
+    The grid is only read cluster by cluster, so it can be a memory-mapped array """
+
+    def __init__(self, obstacle_grid, cluster_size=16, long_entrance=6):
+        self.grid = obstacle_grid
+        self.rows, self.cols = obstacle_grid.shape
+        self.cluster_size = cluster_size
+        self.long_entrance = long_entrance
+        self.cluster_rows = -(-self.rows // cluster_size)
+        self.cluster_cols = -(-self.cols // cluster_size)
+        self.transitions = dict() # Cluster (row, col) -> transition tiles (row, col)
+        self.edges = dict() # Transition tile -> [(transition tile, cost)]
+        self._build()
+
+    def cluster_of(self, node: Tuple[int]) -> Tuple[int]:
+        return node[0] // self.cluster_size, node[1] // self.cluster_size
+
+    def _bounds(self, cluster):
+        row, col = cluster[0] * self.cluster_size, cluster[1] * self.cluster_size
+        return row, col, min(row + self.cluster_size, self.rows), min(col + self.cluster_size, self.cols)
+
+    def _add_edge(self, a, b, cost):
+        self.edges.setdefault(a, []).append((b, cost))
+        self.edges.setdefault(b, []).append((a, cost))
+
+    def _add_transition(self, a, b):
+        for node in (a, b):
+            nodes = self.transitions.setdefault(self.cluster_of(node), [])
+            if node not in nodes:
+                nodes.append(node)
+        self._add_edge(a, b, 1)
+
+    def _add_entrances(self, pairs):
+        """ Transitions along a border, from its pairs of facing tiles (inside, outside) in order """
+        spans, span = [], []
+        for a, b in pairs:
+            if not self.grid[a] and not self.grid[b]:
+                span.append((a, b))
+            elif span:
+                spans.append(span)
+                span = []
+        if span:
+            spans.append(span)
+        for span in spans:
+            if len(span) >= self.long_entrance:
+                self._add_transition(*span[0])
+                self._add_transition(*span[-1])
+            else:
+                self._add_transition(*span[len(span) // 2])
+
+    def _build(self):
+        size = self.cluster_size
+        for cluster_row in range(self.cluster_rows):
+            for cluster_col in range(self.cluster_cols):
+                row0, col0, row1, col1 = self._bounds((cluster_row, cluster_col))
+                if col1 < self.cols: # Right border
+                    self._add_entrances([((row, col1 - 1), (row, col1)) for row in range(row0, row1)])
+                if row1 < self.rows: # Bottom border
+                    self._add_entrances([((row1 - 1, col), (row1, col)) for col in range(col0, col1)])
+        for cluster, nodes in self.transitions.items():
+            is_blocked = self._cluster_lookup(cluster)
+            for i, node in enumerate(nodes):
+                distances = self._search(is_blocked, node, nodes[i + 1:])[1]
+                for other, cost in distances.items():
+                    self._add_edge(node, other, cost)
+
+    def _cluster_lookup(self, cluster, other=None):
+        """ is_blocked(col, row) of the tiles of a cluster (or of the rectangle of two neighboring clusters), True
+        outside of it """
+        row0, col0, row1, col1 = self._bounds(cluster)
+        if other is not None:
+            other_bounds = self._bounds(other)
+            row0, col0, row1, col1 = min(row0, other_bounds[0]), min(col0, other_bounds[1]), max(row1, other_bounds[2]), max(col1, other_bounds[3])
+        walls = [[bool(wall) for wall in row] for row in np.asarray(self.grid[row0:row1, col0:col1]).tolist()]
+
+        def is_blocked(col, row):
+            return not (row0 <= row < row1 and col0 <= col < col1) or walls[row - row0][col - col0]
+        return is_blocked
+
+    @staticmethod
+    def _search(is_blocked, start, targets):
+        """ Breadth-first search from <start> until all the <targets> are reached. It returns the came_from links and
+        the distances of the targets reached """
+        targets = set(targets)
+        distances = {start: 0}
+        found = {target: 0 for target in targets if target == start}
+        came_from = dict()
+        frontier = deque([start])
+        while frontier and len(found) < len(targets):
+            current = frontier.popleft()
+            for d_row, d_col in GRID_NEIGHBORS:
+                neighbor = (current[0] + d_row, current[1] + d_col)
+                if neighbor not in distances and not is_blocked(neighbor[1], neighbor[0]):
+                    distances[neighbor] = distances[current] + 1
+                    came_from[neighbor] = current
+                    if neighbor in targets:
+                        found[neighbor] = distances[neighbor]
+                    frontier.append(neighbor)
+        return came_from, found
+
+    def find_path(self, start: Tuple[int], end: Tuple[int]) -> Union[Deque, None]:
+        """ Sequence of actions from <start> to <end> (row, col), or None if there is no path """
+        if start == end:
+            return deque()
+        if not (0 <= end[0] < self.rows and 0 <= end[1] < self.cols) or self.grid[end] or self.grid[start]:
+            return None
+
+        # Direct path when the start and the end are in the same or neighboring clusters, which the transitions
+        # would make much longer for close tiles. It is the answer if it is as short as the Manhattan distance
+        start_cluster, end_cluster = self.cluster_of(start), self.cluster_of(end)
+        direct = None
+        if abs(start_cluster[0] - end_cluster[0]) <= 1 and abs(start_cluster[1] - end_cluster[1]) <= 1:
+            came_from, found = self._search(self._cluster_lookup(start_cluster, end_cluster), start, [end])
+            if found:
+                direct = reconstruct_grid_path(came_from, end)
+                if len(direct) == heuristic(start, end):
+                    return direct
+
+        # Temporary edges of the start and the end to the transitions of their clusters
+        start_edges = self._search(self._cluster_lookup(start_cluster), start, self.transitions.get(start_cluster, []))[1]
+        end_edges = self._search(self._cluster_lookup(end_cluster), end, self.transitions.get(end_cluster, []))[1]
+
+        # A* on the abstract graph
+        count = 0
+        open_set = [(heuristic(start, end), count, start)]
+        came_from = dict()
+        cost_so_far = {start: 0}
+        closed = set()
+        while open_set:
+            current = heapq.heappop(open_set)[2]
+            if current == end:
+                break
+            if current in closed:
+                continue
+            closed.add(current)
+            edges = self.edges.get(current, [])
+            if current == start:
+                edges = list(start_edges.items()) + edges
+            if current in end_edges:
+                edges = edges + [(end, end_edges[current])]
+            for neighbor, cost in edges:
+                new_cost_so_far = cost_so_far[current] + cost
+                if new_cost_so_far < cost_so_far.get(neighbor, float("inf")):
+                    came_from[neighbor] = current
+                    cost_so_far[neighbor] = new_cost_so_far
+                    count += 1
+                    heapq.heappush(open_set, (new_cost_so_far + heuristic(neighbor, end), count, neighbor))
+        else:
+            return direct
+        if direct is not None and len(direct) <= cost_so_far[end]:
+            return direct
+
+        # Refinement of every hop: a step across a border, or a search inside the cluster of both nodes
+        nodes = [end]
+        while nodes[-1] != start:
+            nodes.append(came_from[nodes[-1]])
+        nodes.reverse()
+        sequence_actions = deque()
+        for a, b in zip(nodes, nodes[1:]):
+            cluster = self.cluster_of(a)
+            if cluster != self.cluster_of(b):
+                sequence_actions.append(get_movement_action(a, b))
+            else:
+                sequence_actions.extend(reconstruct_grid_path(self._search(self._cluster_lookup(cluster), a, [b])[0], b))
+        return sequence_actions
@@ -0,0 +1,212 @@
+import cProfile
+import collections
+import contextlib
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+
+# Subsystem of a frame, by a fragment of the path of its file and optionally its function names. The innermost
+# frame of a stack that matches decides (raycasting called while drawing counts as raycasting)
+PROFILE_SUBSYSTEMS = (('pacing', 'src/utils/profiling', ('_paced_sleep',)),
+                      ('raycasting', 'src/pygame/__main__', ('raycasting', 'line_rect_intersection_points')),
+                      ('raycasting', 'src/utils/geometry', None),
+                      ('raycasting', 'src/opengym/egocentric', None),
+                      ('rendering', 'src/pygame/__main__', ('draw_window', 'draw_grid', 'draw_night', 'draw_fog', 'end_screen')),
+                      ('rendering', 'src/pygame/hud', None),
+                      ('rendering', 'src/pygame/chunks', ('draw_background', '_load_background')),
+                      ('drives', 'src/pygame/drives', None),
+                      ('pathfinding', 'src/utils/pathfinding', None),
+                      ('sb3', 'stable_baselines3', None),
+                      ('sb3', 'sb3_contrib', None),
+                      ('sb3', 'site-packages/torch', None),
+                      )
+
+# Subsystem of the stacks that no rule above matches, by the innermost frame of the project
+FALLBACK_SUBSYSTEMS = (('src/pygame', 'game'),
+                       ('src/opengym', 'env'),
+                       ('src/rl_algorithms', 'policy'),
+                       ('src/utils', 'utils'),
+                       )
+
+PROFILERS = ('sampling', 'cprofile')
+
+
+def frame_subsystem(filename, function):
+    """ Subsystem of a single frame, or None if it is not one of PROFILE_SUBSYSTEMS """
+    filename = filename.replace(os.sep, '/')
+    for name, fragment, functions in PROFILE_SUBSYSTEMS:
+        if fragment in filename and (functions is None or function in functions):
+            return name
+    return None
+
+
+def stack_subsystem(frames):
+    """ Subsystem of a stack of (filename, function) frames, innermost first """
+    for filename, function in frames:
+        name = frame_subsystem(filename, function)
+        if name is not None:
+            return name
+    for filename, _ in frames:
+        for fragment, name in FALLBACK_SUBSYSTEMS:
+            if fragment in filename.replace(os.sep, '/'):
+                return name
+    return 'other'
+
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler():
+    """ Low overhead sampling profiler. A background thread records the stack of the profiled thread every
+    <interval> seconds (wall time, so waits such as the pacing sleeps of the policy loops are sampled too) """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter() # (subsystem, labels outermost first) -> samples
+        self.elapsed = 0.0
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed += time.perf_counter() - self._start
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            frames, labels = [], []
+            while frame is not None:
+                frames.append((frame.f_code.co_filename, frame.f_code.co_name))
+                labels.append(_label(frame.f_code))
+                frame = frame.f_back
+            if frames:
+                self.stacks[(stack_subsystem(frames), tuple(reversed(labels)))] += 1
+
+    def subsystems(self):
+        """ Wall time of every subsystem, in proportion to its samples (the sampler thread may be late when it waits
+        for the interpreter lock) """
+        totals = collections.Counter()
+        n_samples = sum(self.stacks.values()) or 1
+        for (subsystem, _), samples in self.stacks.items():
+            totals[subsystem] += samples / n_samples * self.elapsed
+        return dict(totals.most_common())
+
+    def write_collapsed(self, path):
+        """ Stacks in the collapsed format of flame graph tools (frames separated by ';' and the number of samples),
+        with the subsystem as the root frame """
+        with open(path, 'w') as f:
+            for (subsystem, labels), samples in sorted(self.stacks.items()):
+                f.write(f"{subsystem};{';'.join(labels)} {samples}\n")
+
+
+class DeterministicProfiler():
+    """ cProfile of the profiled thread. The own time of every function is assigned to its subsystem, and the time
+    of the built-in functions (e.g. pygame blits) to the subsystem of the caller that spends the most on them """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+        return self
+
+    def stop(self):
+        self.profile.disable()
+
+    def subsystems(self):
+        stats = pstats.Stats(self.profile).stats
+        totals = collections.Counter()
+        for (filename, _, function), (_, _, own_time, _, callers) in stats.items():
+            frame = (filename, function)
+            if filename == '~' and callers:
+                caller = max(callers, key=lambda caller: callers[caller][3])
+                frame = (caller[0], caller[2])
+            totals[stack_subsystem([frame])] += own_time
+        return dict(totals.most_common())
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+        with open(os.path.splitext(path)[0] + '.txt', 'w') as f:
+            pstats.Stats(self.profile, stream=f).sort_stats('cumulative').print_stats(100)
+
+
+class StepLimitReached(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def step_limit(env_class, max_steps=None, max_episodes=None):
+    """ Stops the run (StepLimitReached) once the envs of <env_class> have run <max_steps> steps or <max_episodes>
+    episodes. It yields the counters, which the caller can check between episodes """
+    counters = {"steps": 0, "episodes": 0}
+    step = env_class.step
+
+    def limited_step(self, action):
+        result = step(self, action)
+        counters["steps"] += 1
+        counters["episodes"] += bool(result[2])
+        if (max_steps is not None and counters["steps"] >= max_steps) or (max_episodes is not None and counters["episodes"] >= max_episodes):
+            raise StepLimitReached()
+        return result
+
+    env_class.step = limited_step
+    try:
+        yield counters
+    finally:
+        env_class.step = step
+
+
+_sleep = time.sleep
+
+
+def _paced_sleep(seconds):
+    # Pacing of the rendered policy loops, seen as a frame of its own by the profilers
+    _sleep(seconds)
+
+
+def profile(function, profiler='sampling', output=None, interval=0.005):
+    """ Runs <function> under the <profiler> ('sampling' or 'cprofile') until it returns or raises StepLimitReached.
+    The profile (stacks.collapsed or profile.prof and profile.txt) and the time per subsystem (subsystems.json) are
+    written to the <output> folder. It returns the time per subsystem """
+    profiler_instance = StackSampler(interval) if profiler == 'sampling' else DeterministicProfiler()
+    start = time.perf_counter()
+    time.sleep = _paced_sleep
+    profiler_instance.start()
+    try:
+        function()
+    except StepLimitReached:
+        pass
+    finally:
+        profiler_instance.stop()
+        time.sleep = _sleep
+    elapsed = time.perf_counter() - start
+
+    subsystems = profiler_instance.subsystems()
+    if output is not None:
+        os.makedirs(output, exist_ok=True)
+        if profiler == 'sampling':
+            profiler_instance.write_collapsed(os.path.join(output, 'stacks.collapsed'))
+        else:
+            profiler_instance.write(os.path.join(output, 'profile.prof'))
+        with open(os.path.join(output, 'subsystems.json'), 'w') as f:
+            json.dump({"profiler": profiler, "wall_time_s": elapsed, "subsystems_s": subsystems}, f, indent=2)
+    print(f"\n[PROFILE INFO] {profiler} profile of {elapsed:.2f} s" + (f" written to {output}" if output is not None else ""))
+    total = sum(subsystems.values()) or 1
+    for name, seconds in subsystems.items():
+        print(f"[PROFILE INFO] {name:{15}} {seconds:>9.3f} s {100 * seconds / total:>6.1f} %")
+    return subsystems
@@ -1,13 +1,8 @@
 import pytest
 
 from collections import deque
+from src.opengym.equivalence import EXAMPLE_ACTIONS
 
 @pytest.fixture
 def example_actions():
-    return deque([2, 0, 0, 0, 0, 2, 2, 2, 2, 2, 2, 2, 2, 6, 0, 0, 0, 6, 0, 0, 0, 6, 0, 0, 0,
-                  0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 2, 6, 3, 3, 3, 3, 3, 3, 3, 3, 3,
-                  3, 3, 3, 1, 1, 1, 3, 6, 1, 1, 1, 2, 6, 1, 1, 1, 2, 2, 2, 2, 2, 2, 0, 0, 0,
-                  6, 4, 4, 4, 4, 1, 1, 1, 3, 3, 3, 3, 3, 3, 0, 0, 0, 5, 3, 0, 0, 0, 5, 2, 0,
-                  0, 0, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 5, 2, 1, 1, 1, 1, 1, 1, 1, 1, 1,
-                  1, 1, 1, 3, 3, 3, 1, 1, 1, 1, 5, 1, 1, 1, 5, 1, 1, 1, 5, 8, 8, 8, 8, 8, 8,
-                  8, 8, 8, 8, 8, 8, 7])
+    return deque(EXAMPLE_ACTIONS)
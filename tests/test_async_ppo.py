@@ -0,0 +1,74 @@
+import multiprocessing
+import numpy as np
+import pytest
+
+from gymnasium import spaces
+from stable_baselines3.common.logger import configure
+from src.rl_algorithms.async_ppo import AsyncActorLearner, SharedWeights, build_learner_model
+from src.rl_algorithms.numpy_policy import policy_arrays
+
+
+class CountdownEnv():
+    """ Env with the step API of the GymGame and spaces that stable-baselines3 accepts. The episode ends after 5
+    steps, and the reward is 1 for the action of the parity of the step, which is observed """
+
+    observation_space = spaces.Dict({"parity": spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
+                                     "left": spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32)})
+    action_space = spaces.Discrete(3)
+
+    def reset(self, seed=None):
+        self.step_count = 0
+        return self._obs()
+
+    def _obs(self):
+        return {"parity": np.array([self.step_count % 2], dtype=np.float32), "left": np.array([1 - self.step_count / 5], dtype=np.float32)}
+
+    def valid_action_mask(self):
+        return [True, True, False]
+
+    def step(self, action):
+        reward = float(action == self.step_count % 2)
+        self.step_count += 1
+        return self._obs(), reward, self.step_count == 5, {}
+
+
+class CrashingEnv(CountdownEnv):
+
+    def step(self, action):
+        raise RuntimeError("The env crashed")
+
+
+def test_shared_weights_round_trip():
+    model = build_learner_model('MultiInputPolicy', CountdownEnv.observation_space, CountdownEnv.action_space, 2, 8, seed=0)
+    meta, weights = policy_arrays(model)
+    shared = SharedWeights(meta, weights)
+    assert shared.publish(weights) == 0
+    version, policy = shared.read()
+    obs = {"parity": np.zeros((4, 1), dtype=np.float32), "left": np.ones((4, 1), dtype=np.float32)}
+    with_mask = policy.log_probs(obs, np.tile([True, True, False], (4, 1)))
+    assert version == 0 and np.isneginf(with_mask[:, 2]).all()
+
+
+def test_async_actor_learner_trains_with_bounded_staleness():
+    model = build_learner_model('MultiInputPolicy', CountdownEnv.observation_space, CountdownEnv.action_space, 4, 16,
+                                seed=0, batch_size=32, n_epochs=4, learning_rate=3e-3)
+    trainer = AsyncActorLearner(CountdownEnv, n_actors=2, envs_per_actor=2, segment_length=16, n_segments=4, max_staleness=1, seed=0)
+    model.set_logger(configure(None, []))
+    summary = trainer.learn(model, total_timesteps=64 * 12)
+    assert summary["updates"] == 12 and summary["timesteps"] == 64 * 12
+    assert summary["staleness_max"] <= 1
+    assert not multiprocessing.active_children()
+
+    # The learned policy prefers the action of the parity
+    obs = {"parity": np.array([[0], [1]], dtype=np.float32), "left": np.array([[1], [0.8]], dtype=np.float32)}
+    actions, _ = model.predict(obs, action_masks=np.tile([True, True, False], (2, 1)), deterministic=True)
+    assert list(actions) == [0, 1]
+
+
+def test_async_actor_learner_fails_when_the_actors_die():
+    model = build_learner_model('MultiInputPolicy', CountdownEnv.observation_space, CountdownEnv.action_space, 4, 16, seed=0)
+    trainer = AsyncActorLearner(CrashingEnv, n_actors=2, envs_per_actor=1, segment_length=16, n_segments=4, seed=0, actor_timeout=0.1)
+    model.set_logger(configure(None, []))
+    with pytest.raises(RuntimeError, match="actor processes died"):
+        trainer.learn(model, total_timesteps=64)
+    assert not multiprocessing.active_children()
@@ -0,0 +1,50 @@
+import os
+import pytest
+
+from stable_baselines3 import PPO
+
+from src.rl_algorithms.checkpoints import BackgroundCheckpointCallback, CheckpointWriter, read_index, snapshot_model
+from src.rl_algorithms.ppo import Defaults, load_latest_model
+
+
+def test_background_checkpoints_keep_last_and_best(tmp_path):
+    model = PPO('MlpPolicy', 'CartPole-v1', n_steps=64, batch_size=32, n_epochs=1, seed=0)
+    callback = BackgroundCheckpointCallback(save_freq=64, save_path=str(tmp_path), name_prefix="test", keep_last=2)
+    model.learn(total_timesteps=64 * 6, callback=callback)
+
+    index = read_index(str(tmp_path))
+    files = sorted(file for file in os.listdir(tmp_path) if file.endswith('.zip'))
+    assert index["latest"]["steps"] == model.num_timesteps
+    assert sorted(checkpoint["file"] for checkpoint in index["checkpoints"]) == files
+    assert len(files) <= 3
+    assert index["best"]["file"] in files
+
+    loaded = PPO.load(os.path.join(tmp_path, index["latest"]["file"]))
+    assert loaded.num_timesteps == model.num_timesteps
+
+
+def test_checkpoint_retention_is_per_run(tmp_path):
+    model = PPO('MlpPolicy', 'CartPole-v1', n_steps=64, batch_size=32, n_epochs=1, seed=0)
+    first, second = CheckpointWriter(str(tmp_path), "first", keep_last=2), CheckpointWriter(str(tmp_path), "second", keep_last=2)
+    for steps in range(1, 6):
+        # Two runs saving to the same folder at the same time
+        first.submit(snapshot_model(model), steps, eval_return=float(steps == 2))
+        second.submit(snapshot_model(model), steps, eval_return=None)
+    first.close()
+    second.close()
+
+    index = read_index(str(tmp_path))
+    files = sorted(file for file in os.listdir(tmp_path) if file.endswith('.zip'))
+    assert sorted(checkpoint["file"] for checkpoint in index["checkpoints"]) == files
+    assert files == ["first_2_steps.zip", "first_4_steps.zip", "first_5_steps.zip", "second_4_steps.zip", "second_5_steps.zip"]
+    assert index["best"]["file"] == "first_2_steps.zip"
+
+
+def test_load_latest_model_without_a_model_of_the_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(Defaults, 'SAVE_PATH', str(tmp_path))
+    model = PPO('MlpPolicy', 'CartPole-v1', n_steps=64, seed=0)
+    writer = CheckpointWriter(str(tmp_path), "run", keep_last=2)
+    writer.submit(snapshot_model(model), 64)
+    writer.close()
+    with pytest.raises(FileNotFoundError):
+        load_latest_model(use_wandb=True)
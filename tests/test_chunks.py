@@ -0,0 +1,131 @@
+import numpy as np
+import os
+import pygame
+import pytest
+
+from src.opengym.__main__ import GymGame
+from src.opengym.egocentric import WALL_CHANNEL
+from src.pygame import assets
+from src.pygame.chunks import ChunkedEntities, ChunkedWorld, LRUCache
+from src.pygame.mapbundle import load_map_bundle
+from src.pygame.settings import *
+from src.pygame.tilemap import Camera
+from src.utils.actions import Action
+from src.utils.pathfinding import grid_a_star
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = LRUCache(2, lambda key: key * 10)
+    assert [cache.get(1), cache.get(2), cache.get(1), cache.get(3)] == [10, 20, 10, 30]
+    assert 1 in cache and 2 not in cache
+    assert cache.stats() == {"loaded": 2, "capacity": 2, "hits": 1, "misses": 3, "evictions": 1}
+
+    # Without a loader, the values are stored with put()
+    cache = LRUCache(2, None)
+    assert cache.get(1) is None
+    cache.put(1, False)
+    cache.put(2, True)
+    assert cache.get(1) is False
+    cache.put(3, True)
+    assert 1 in cache and 2 not in cache and len(cache) == 2
+
+    # Evicted values are handed to on_evict
+    evicted = []
+    cache = LRUCache(1, lambda key: key * 10, lambda key, value: evicted.append((key, value)))
+    cache.get(1)
+    cache.get(2)
+    assert evicted == [(1, 10)]
+
+
+def test_chunked_world_matches_the_whole_map():
+    bundle = load_map_bundle(os.path.join(ROOT_PROJECT_PATH, CONFIG_DIRECTORY_NAME, TILEDMAP_FILE))
+    world = ChunkedWorld(bundle, chunk_size=7, max_background_chunks=4, max_navigation_chunks=3)
+
+    # Navigation and spawn slots
+    walls = [[world.is_blocked(col, row) for col in range(bundle.cols)] for row in range(bundle.rows)]
+    assert np.array_equal(walls, bundle.walls != 0)
+    assert world.is_blocked(-1, 0) and world.is_blocked(0, bundle.rows)
+    assert len(world.navigation) == 3 and world.navigation.evictions > 0
+    chunks = [(cx, cy) for cy in range(world.chunk_rows) for cx in range(world.chunk_cols)]
+    assert sum(len(world.spawn_slots(chunk)) for chunk in chunks) == len(bundle.spawns)
+    assert sum(len(world.spawn_slots(chunk, 'wall')) for chunk in chunks) == bundle.walls.sum()
+
+    # Background around the camera
+    camera = Camera(bundle.cols * bundle.tilewidth, bundle.rows * bundle.tileheight)
+    camera.camera = pygame.Rect(-300, -200, camera.width, camera.height)
+    window = pygame.Surface((WIDTH, HEIGHT))
+    world.draw_background(window, camera)
+    assert len(world.backgrounds) == 4
+    assert np.array_equal(pygame.surfarray.array3d(window).swapaxes(0, 1), bundle.background[200:200 + HEIGHT, 300:300 + WIDTH])
+
+    # Shortest paths on the streamed grid
+    free = np.argwhere(bundle.walls == 0)
+    start, end = tuple(free[0]), tuple(free[-1])
+    path = grid_a_star(world.is_blocked, start, end)
+    row, col = start
+    moves = {Action.RIGHT.value: (0, 1), Action.LEFT.value: (0, -1), Action.DOWN.value: (1, 0), Action.UP.value: (-1, 0)}
+    for action in path:
+        row, col = row + moves[action][0], col + moves[action][1]
+        assert not world.is_blocked(col, row)
+    assert (row, col) == end
+
+
+@pytest.fixture
+def chunked_env(monkeypatch):
+    """ GymGame on the default map streamed in chunks of 4 tiles """
+    monkeypatch.setattr(assets, '_WORLD_ASSETS', {})
+    monkeypatch.setattr(assets, 'CHUNKED_WORLD', True)
+    monkeypatch.setattr(assets, 'ChunkedWorld', lambda bundle: ChunkedWorld(bundle, chunk_size=4, max_wall_mesh_chunks=6))
+    return GymGame(grid_size=7)
+
+
+@pytest.mark.gym_env
+def test_chunked_game_creates_the_sprites_of_the_chunks_loaded(chunked_env):
+    env = chunked_env
+    obs = env.reset(seed=0)
+    game, world = env.game, env.game.world
+    assert game.wall_sprites == []
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        for sprite in (*game.object_sprites, *game.mob_sprites):
+            assert world.chunk_of(sprite.col, sprite.row) in game.entities.chunks
+        assert len(game.object_sprites) <= game.max_items
+
+        # Egocentric window cut from the walls of the bundle
+        avatar = next(iter(game.avatar_sprites))
+        walls = np.pad(world.bundle.walls != 0, 3, constant_values=True)[avatar.row:avatar.row + 7, avatar.col:avatar.col + 7]
+        assert np.array_equal(obs["grid"][WALL_CHANNEL], walls)
+        obs, _, done, _ = env.step(int(rng.choice(np.flatnonzero(env.valid_action_mask()))))
+        if done:
+            break
+
+    # The wall meshes of the lines of sight are loaded on demand
+    rects = {tuple(rect) for chunk in [(cx, cy) for cy in range(world.chunk_rows) for cx in range(world.chunk_cols)] for rect in world.wall_mesh.as_array([chunk]).tolist()}
+    assert len(world.wall_meshes) <= 6
+    assert sum(w * h for _, _, w, h in rects) == world.bundle.walls.sum() * world.tilewidth * world.tileheight
+
+
+@pytest.mark.gym_env
+def test_chunked_entities_restore_the_chunks_evicted(chunked_env):
+    env = chunked_env
+    env.reset(seed=0)
+    game, world = env.game, env.game.world
+    for sprite in list(game.object_sprites):
+        sprite.kill()
+    entities = ChunkedEntities(game, world, max_chunks=1)
+    chunks = [(cx, cy) for cy in range(world.chunk_rows) for cx in range(world.chunk_cols)]
+    chunk = next(chunk for chunk in chunks if len(world.spawn_slots(chunk, 'object')))
+    other = next(other for other in chunks if other != chunk)
+
+    entities.load(chunk)
+    loaded = sorted((object.col, object.row, object.type) for object in game.object_sprites)
+    assert len(loaded) == len(world.spawn_slots(chunk, 'object')) == game.max_items
+    entities.spawn(*world._bounds(other)[:2], 'apple')
+    assert len(game.object_sprites) == len(loaded)
+
+    # The sprites of the chunk evicted are freed and come back as they were left
+    entities.load(other)
+    assert all(world.chunk_of(object.col, object.row) == other for object in game.object_sprites)
+    assert ('apple' in [object.type for object in game.object_sprites]) and entities.chunks.evictions == 1
+    entities.load(chunk)
+    assert sorted((object.col, object.row, object.type) for object in game.object_sprites) == loaded
@@ -0,0 +1,31 @@
+import numpy as np
+
+from src.opengym.__main__ import GymGame
+from src.rl_algorithms.controlled import ControlledAlgorithm
+from src.rl_algorithms.demonstrations import DemonstrationPolicy, generate, load_demonstrations
+
+
+def test_demonstrations_are_streamed_to_shards(tmp_path):
+    result = generate(str(tmp_path), 600, n_envs=2, shard_size=250)
+    assert result["records"] == 600 and result["shards"] == 3
+
+    obs, masks, actions, episode_starts = load_demonstrations(str(tmp_path))
+    assert len(actions) == len(masks) == len(obs["energy_stored"]) == 600
+    assert masks[np.arange(600), actions].all()
+    assert episode_starts[:2].all() and episode_starts.sum() == result["episodes"] + 2
+
+
+def test_demonstration_policy_follows_its_paths_to_the_nearest_object(monkeypatch):
+    searches = []
+    plan_path_to_nearest = ControlledAlgorithm.plan_path_to_nearest
+    monkeypatch.setattr(ControlledAlgorithm, 'plan_path_to_nearest', lambda self, *args: searches.append(args) or plan_path_to_nearest(self, *args))
+    env = GymGame()
+    policy = DemonstrationPolicy(env)
+    policy.reset(seed=0)
+    for _ in range(500):
+        mask = env.valid_action_mask()
+        action = policy.act(mask)
+        assert mask[action]
+        if env.step(action)[2]:
+            policy.reset(seed=1)
+    assert 0 < len(searches) < 50
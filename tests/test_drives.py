@@ -0,0 +1,30 @@
+import numpy as np
+
+from src.pygame.drives import BatchedBodyDrives, BodyDrives, DRIVE_ACTIONS, EAT, INTERNAL_STATES, sweep_drives
+
+
+def test_batched_drives_match_scalar_drives():
+    rng = np.random.default_rng(0)
+    temperatures = rng.uniform(5, 45, 16)
+    batched = BatchedBodyDrives(len(temperatures), environment_temperature=temperatures)
+    scalars = [BodyDrives(temperature) for temperature in temperatures]
+    for actions in rng.integers(0, len(DRIVE_ACTIONS), (200, len(temperatures))):
+        for drives, action, alive in zip(scalars, actions, batched.alive):
+            if alive:
+                if action == EAT:
+                    drives.update_energy(550)
+                drives.run_action(DRIVE_ACTIONS[action], 550)
+        batched.update_energy(550, actions == EAT)
+        batched.run_action(actions, 550)
+
+        for name in ("stored_energy", "water", "hunger", "thirst", "sleepiness", "biological_clock"):
+            assert np.allclose(getattr(batched, name), [getattr(drives, name) for drives in scalars], rtol=1e-12, atol=0)
+        assert [INTERNAL_STATES[state] for state in batched.internal_state] == [drives.internal_state for drives in scalars]
+
+
+def test_sweep_shapes_and_survival():
+    result = sweep_drives({"environment_temperature": [10, 30], "stored_energy": [1000, 2000, 3000]}, hours=48, record_every=1)
+    assert result["survival_hours"].shape == (2, 3)
+    assert result["curves"]["hunger"].shape == (result["steps"] + 1, 2, 3)
+    # More stored energy lasts longer
+    assert (np.diff(result["survival_hours"], axis=1) > 0).all()
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from src.opengym.__main__ import GymGame
+from src.opengym.egocentric import GRID_CHANNELS, VISIBLE_CHANNEL, WALL_CHANNEL
+
+
+@pytest.mark.gym_env
+def test_egocentric_grid_matches_the_world():
+    env = GymGame(grid_size=7)
+    obs = env.reset(seed=0)
+    grid = obs["grid"]
+    assert env.observation_space.contains(obs)
+    assert grid.shape == (len(GRID_CHANNELS), 7, 7)
+
+    avatar = next(iter(env.game.avatar_sprites))
+    walls = np.pad(env.game.obstacle_grid, 3, constant_values=True)[avatar.row:avatar.row + 7, avatar.col:avatar.col + 7]
+    assert np.array_equal(grid[WALL_CHANNEL], walls)
+    assert grid[VISIBLE_CHANNEL, 3, 3] == 1
+
+    # Every object around the avatar is on the channel of its type
+    for object in env.game.object_sprites:
+        row, col = object.row - avatar.row + 3, object.col - avatar.col + 3
+        if 0 <= row < 7 and 0 <= col < 7:
+            assert grid[GRID_CHANNELS.index(object.type), row, col] == 1
+
+
+@pytest.mark.gym_env
+def test_egocentric_grid_follows_the_sprites():
+    env = GymGame(grid_size=7)
+    env.reset(seed=0)
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        obs, _, done, _ = env.step(int(rng.choice(np.flatnonzero(env.valid_action_mask()))))
+        if done:
+            break
+
+        # The incrementally updated channels match the ones rebuilt from the sprites
+        avatar = next(iter(env.game.avatar_sprites))
+        expected = np.zeros((len(GRID_CHANNELS), *(np.array(env.game.obstacle_grid.shape) + 6)), dtype=np.uint8)
+        for object in env.game.object_sprites:
+            expected[GRID_CHANNELS.index(object.type), object.row + 3, object.col + 3] = 1
+        for mob in env.game.mob_sprites:
+            expected[GRID_CHANNELS.index('mob'), mob.row + 3, mob.col + 3] = 1
+        window = expected[:, avatar.row:avatar.row + 7, avatar.col:avatar.col + 7]
+        assert np.array_equal(obs["grid"][WALL_CHANNEL + 1:VISIBLE_CHANNEL], window[WALL_CHANNEL + 1:VISIBLE_CHANNEL])
@@ -0,0 +1,28 @@
+import pytest
+
+from src.opengym.__main__ import GymGame
+from src.opengym.equivalence import check_equivalence
+
+
+class DriftingGymGame(GymGame):
+    """ Candidate whose water consumption drifts after the 20th step """
+
+    def step(self, action):
+        if self.episodic_step > 20:
+            for avatar in self.game.avatar_sprites:
+                avatar.drives.water -= 1e-3
+        return super().step(action)
+
+
+@pytest.mark.gym_env
+def test_identical_envs_are_equivalent():
+    reports = check_equivalence(GymGame, GymGame, traces=('example', 'random'), seeds=(0,))
+    assert all(report["divergence"] is None and report["steps"] > 0 for report in reports)
+
+
+@pytest.mark.gym_env
+def test_first_divergence_is_reported():
+    report, = check_equivalence(GymGame, DriftingGymGame, traces=('example',), seeds=(0,))
+    divergence = report["divergence"]
+    assert divergence["step"] == 21 and "obs/water_stored" in divergence["fields"]
+    assert divergence["reference_state"]["avatars"][0]["drives"]["water"] > divergence["candidate_state"]["avatars"][0]["drives"]["water"]
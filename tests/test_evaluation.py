@@ -0,0 +1,11 @@
+from src.rl_algorithms.evaluation import aggregate, run_episode
+
+
+def test_seeded_episodes_are_reproducible():
+    results = [run_episode('random', seed=7), run_episode('random', seed=7), run_episode('controlled', seed=7)]
+    assert results[0] == results[1]
+    assert sum(results[2]["action_histogram"]) == results[2]["steps"]
+
+    report = aggregate(results)
+    assert report['random']['episodes'] == 2
+    assert report['random']['episodic_return'][1] == 0
@@ -0,0 +1,94 @@
+import numpy as np
+import os
+import pytest
+import threading
+import time
+
+from src.rl_algorithms.inference import BatchedPolicyServer, PolicyClient, PolicySocketServer
+
+
+class FirstValidActionModel():
+    def predict(self, obs, action_masks=None, deterministic=True):
+        assert obs["energy_stored"].shape == (len(action_masks), 1)
+        return np.argmax(action_masks, axis=1), None
+
+
+def test_batched_policy_server(tmp_path):
+    n_workers = 16
+    masks = np.eye(9, dtype=bool)[np.arange(n_workers) % 9]
+    actions = [None] * n_workers
+
+    with BatchedPolicyServer(FirstValidActionModel(), max_batch_size=n_workers, max_latency=0.05) as server:
+        # In-process workers
+        def worker(i):
+            actions[i] = server.predict({"energy_stored": np.array([0.5], dtype=np.float32)}, masks[i])
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(n_workers)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        assert actions == list(np.arange(n_workers) % 9)
+        assert server.metrics.summary()["max_batch_size"] > 1
+
+        # Workers connected through the Unix socket
+        address = os.path.join(tmp_path, "policy.sock")
+        socket_server = PolicySocketServer(server, address)
+        socket_server.listen()
+        threading.Thread(target=socket_server.serve_forever, daemon=True).start()
+        client = PolicyClient(address)
+        assert client.predict({"energy_stored": np.array([0.5], dtype=np.float32)}, masks[3]) == 3
+        client.close()
+        socket_server.close()
+
+    assert server.metrics.summary()["requests"] == n_workers + 1
+
+
+class FailingModel():
+    def predict(self, obs, action_masks=None, deterministic=True):
+        raise ValueError("broken model")
+
+
+def test_policy_server_errors(tmp_path):
+    obs = {"energy_stored": np.array([0.5], dtype=np.float32)}
+
+    # Errors of the model reach the socket clients
+    with BatchedPolicyServer(FailingModel()) as server:
+        address = os.path.join(tmp_path, "policy.sock")
+        socket_server = PolicySocketServer(server, address)
+        socket_server.listen()
+        threading.Thread(target=socket_server.serve_forever, daemon=True).start()
+        client = PolicyClient(address)
+        for _ in range(2):
+            # The connection keeps serving the client after an error
+            with pytest.raises(ValueError, match="broken model"):
+                client.predict(obs, np.ones(9, dtype=bool))
+        client.close()
+        socket_server.close()
+
+    # Requests still queued when the server stops fail, and a stopped server takes no more requests
+    server = BatchedPolicyServer(FirstValidActionModel())
+    server.running = True
+    future = server.submit(obs, np.ones(9, dtype=bool))
+    server.stop()
+    with pytest.raises(RuntimeError):
+        future.result(timeout=1)
+    with pytest.raises(RuntimeError):
+        server.submit(obs, np.ones(9, dtype=bool))
+
+    # Requests racing with the stop are either served or failed, never left waiting
+    server = BatchedPolicyServer(FirstValidActionModel()).start()
+    futures = []
+    def submit_until_stopped():
+        while True:
+            try:
+                futures.append(server.submit(obs, np.ones(9, dtype=bool)))
+            except RuntimeError:
+                return
+    submitters = [threading.Thread(target=submit_until_stopped) for _ in range(4)]
+    for submitter in submitters:
+        submitter.start()
+    time.sleep(0.05)
+    server.stop()
+    for submitter in submitters:
+        submitter.join()
+    assert all(future.done() for future in futures)
@@ -0,0 +1,30 @@
+import json
+
+from src.utils.logger import LogLevel, StepLogger
+
+
+def test_sampled_steps_are_written_as_json_lines(tmp_path, capsys):
+    path = tmp_path / "steps.jsonl"
+    logger = StepLogger(LogLevel.STEP, every=2, path=path, console=False)
+    for step in range(1, 11):
+        logger.step(step, None, 8, {"sleepiness": [0.1]}, 0.1, 0.1 * step, valid_actions=[0, 8])
+    logger.message("[Path] {}", [0, 1], level=LogLevel.STEP)
+    logger.episode('Test policy', 0, 1.0, 1.0, 11)
+    logger.close()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["episodic_step"] for record in records if record["type"] == "step"] == [2, 4, 6, 8, 10]
+    assert records[0]["action"] == "STAND_STILL"
+    assert records[-2]["type"] == "message" and records[-2]["text"] == "[Path] [0, 1]"
+    assert records[-1]["type"] == "episode"
+    assert capsys.readouterr().out == ""
+
+
+def test_silent_messages_are_not_formatted(capsys):
+    class Unformattable():
+        def __format__(self, spec):
+            raise AssertionError("formatted while silent")
+
+    StepLogger(LogLevel.SILENT).message("[Path] {}", Unformattable())
+    StepLogger(LogLevel.VERBOSE).message("[Path] {}", [2])
+    assert capsys.readouterr().out == "[Path] [2]\n"
@@ -0,0 +1,30 @@
+import os
+
+from src.pygame.mapbundle import SPAWN_WALL, MapBundle, bundle_path, compile_map
+from src.pygame.settings import *
+
+
+def test_compiled_map_bundle(tmp_path):
+    tmx_path = os.path.join(ROOT_PROJECT_PATH, CONFIG_DIRECTORY_NAME, TILEDMAP_FILE)
+    bundle = MapBundle(compile_map(tmx_path, str(tmp_path / "map.aimap")))
+
+    assert bundle.gids.shape[1:] == bundle.walls.shape == (bundle.rows, bundle.cols)
+    assert bundle.walls.sum() == (bundle.spawns[:, 0] == SPAWN_WALL).sum()
+    assert len(bundle.avatar_start) == 1
+    assert bundle.background.shape == (bundle.rows * bundle.tileheight, bundle.cols * bundle.tilewidth, 3)
+    assert not bundle.is_stale()
+
+    # A bundle older than its TMX file has to be rebuilt
+    os.utime(bundle.path, (0, 0))
+    assert bundle.is_stale()
+
+
+def test_bundles_of_maps_with_the_same_name(tmp_path):
+    tmx_path = os.path.join(ROOT_PROJECT_PATH, CONFIG_DIRECTORY_NAME, TILEDMAP_FILE)
+    other_path = str(tmp_path / TILEDMAP_FILE)
+    assert bundle_path(tmx_path) != bundle_path(other_path)
+
+    # A bundle built from another file is never reused
+    bundle = MapBundle(compile_map(tmx_path, str(tmp_path / "map.aimap")))
+    assert not bundle.is_stale(tmx_path)
+    assert bundle.is_stale(other_path)
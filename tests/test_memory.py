@@ -0,0 +1,36 @@
+import tracemalloc
+
+from src.utils.memory import MemoryProfiler
+
+
+def run_episodes(leak, n_episodes=8):
+    profiler = MemoryProfiler(every=4, warmup=2, console=False).start()
+    kept = []
+    try:
+        for _ in range(n_episodes):
+            episode = [bytearray(1024) for _ in range(100)]
+            if leak:
+                kept.append(episode)
+            profiler.episode_end()
+    finally:
+        profiler.stop()
+    return profiler.reports[-1]
+
+
+def test_memory_profiler_detects_growth():
+    leaking = run_episodes(leak=True)
+    assert leaking["traced_growth_mb_per_episode"] * 1024 > 90
+    assert leaking["top_sites"][0]["site"].endswith("test_memory.py:11")
+    assert run_episodes(leak=False)["traced_growth_mb_per_episode"] * 1024 < 8
+
+
+def test_memory_profiler_before_the_baseline_and_outer_tracing():
+    tracemalloc.start()
+    try:
+        profiler = MemoryProfiler(warmup=3, console=False).start()
+        profiler.episode_end()
+        assert profiler.report() is None
+        profiler.stop()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
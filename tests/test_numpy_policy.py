@@ -0,0 +1,46 @@
+import gymnasium
+import numpy as np
+
+from gymnasium import spaces
+from sb3_contrib.ppo_mask import MaskablePPO
+
+from src.rl_algorithms.numpy_policy import NumpyPolicy, export_policy, verify_export
+
+
+class DictEnv(gymnasium.Env):
+    """ Observation and action spaces shaped as the ones of the GymGame """
+
+    observation_space = spaces.Dict({"energy_stored": spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
+                                     "on_object": spaces.Box(low=0, high=1, shape=(1,), dtype=np.int32),
+                                     "grid": spaces.Box(low=0, high=1, shape=(3, 5, 5), dtype=np.uint8)})
+    action_space = spaces.Discrete(9)
+
+    def reset(self, seed=None, options=None):
+        return self.observation_space.sample(), {}
+
+    def step(self, action):
+        return self.observation_space.sample(), 0.0, False, False, {}
+
+    def action_masks(self):
+        return np.ones(9, dtype=bool)
+
+
+def test_numpy_policy_matches_torch_model(tmp_path):
+    model = MaskablePPO('MultiInputPolicy', DictEnv(), policy_kwargs=dict(net_arch=dict(pi=[128, 128, 128], vf=[128, 128, 128])), seed=0)
+    policy = NumpyPolicy(export_policy(model, str(tmp_path / 'policy.npz')))
+
+    space = DictEnv.observation_space
+    space.seed(0)
+    samples = [space.sample() for _ in range(256)]
+    observations = {key: np.stack([sample[key] for sample in samples]) for key in space.spaces}
+    action_masks = np.random.default_rng(0).random((256, 9)) < 0.5
+    action_masks[:, 8] = True
+
+    report = verify_export(model, policy, observations, action_masks)
+    assert report["equivalent"], report
+
+    # Single observations and sampled actions respect the mask
+    action, _ = policy.predict(samples[0], action_masks=action_masks[0], deterministic=True)
+    assert action == policy.predict(observations, action_masks=action_masks, deterministic=True)[0][0]
+    actions, _ = policy.predict(observations, action_masks=action_masks, rng=np.random.default_rng(0))
+    assert action_masks[np.arange(256), actions].all()
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from src.opengym.parallel import ParallelGymGame
+
+
+@pytest.mark.gym_env
+def test_parallel_environment():
+    n_agents = 8
+    env = ParallelGymGame(n_agents)
+    obs = env.reset(seed=42)
+    rng = np.random.default_rng(42)
+    assert all(value.shape == (n_agents, 1) for value in obs.values())
+    while env.agents:
+        # Take a random valid action for every agent
+        masks = env.valid_action_mask()
+        assert masks.shape == (n_agents, 9)
+        actions = [rng.choice(np.flatnonzero(mask)) for mask in masks]
+
+        # Run actions
+        dones_pre = env.dones.copy()
+        obs, rewards, dones, info = env.step(actions)
+        assert rewards.shape == dones.shape == (n_agents,)
+        assert np.all(rewards[dones_pre] == 0)
+        assert np.all(dones[dones_pre])
+        assert len(env.agents) == n_agents - dones.sum()
+
+    env.render()
+    env.close()
@@ -0,0 +1,84 @@
+import numpy as np
+
+from collections import deque
+from src.pygame.tilemap import Spot
+from src.utils.actions import Action
+from src.utils.pathfinding import HierarchicalPathfinder, a_star_algorithm, grid_lookup, grid_nearest_target_path, jump_point_search, nearest_target_path
+
+
+# The target at (0, 2) is the closest in a straight line but behind a wall, the one at (5, 0) is the nearest by path
+GRID = ["S#T.",
+        ".#..",
+        "....",
+        "....",
+        "....",
+        "T..."]
+
+MOVES = {Action.RIGHT.value: (0, 1), Action.LEFT.value: (0, -1), Action.DOWN.value: (1, 0), Action.UP.value: (-1, 0)}
+
+
+def make_graph_map(grid):
+    rows, cols = len(grid), len(grid[0])
+    graph_map = [[Spot(row, col, 1, 1, rows, cols) for col in range(cols)] for row in range(rows)]
+    for row in range(rows):
+        for col in range(cols):
+            if grid[row][col] == '#':
+                graph_map[row][col].make_obstacle()
+    for spots in graph_map:
+        for spot in spots:
+            spot.update_neighbors(graph_map)
+    return graph_map
+
+
+def is_blocked(col, row):
+    return not (0 <= row < len(GRID) and 0 <= col < len(GRID[0])) or GRID[row][col] == '#'
+
+
+def follow(start, path):
+    row, col = start
+    for action in path:
+        row, col = row + MOVES[action][0], col + MOVES[action][1]
+        assert not is_blocked(col, row)
+    return row, col
+
+
+def test_nearest_target_is_the_nearest_by_path():
+    targets = [(0, 2), (5, 0)]
+    target, path = grid_nearest_target_path(is_blocked, (0, 0), targets)
+    assert target == (5, 0) and len(path) == 5 and follow((0, 0), path) == target
+
+    graph_map = make_graph_map(GRID)
+    spot, graph_path = nearest_target_path(graph_map[0][0], [graph_map[row][col] for row, col in targets])
+    assert spot.get_pos() == target and len(graph_path) == len(path)
+    assert len(a_star_algorithm(graph_map, graph_map[0][0], graph_map[0][2])) > len(path)
+
+
+def test_nearest_target_unreachable_or_at_start():
+    assert grid_nearest_target_path(is_blocked, (0, 0), [(0, 1)]) is None
+    assert grid_nearest_target_path(is_blocked, (0, 0), []) is None
+    assert grid_nearest_target_path(is_blocked, (0, 0), [(0, 0), (5, 0)]) == ((0, 0), deque())
+    graph_map = make_graph_map(GRID)
+    assert nearest_target_path(graph_map[0][0], [graph_map[0][1]]) is None
+
+
+def test_jump_point_search_and_hpa_paths():
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        grid = rng.random(tuple(rng.integers(5, 40, 2))) < 0.3
+        lookup = grid_lookup(grid)
+        free = [tuple(map(int, tile)) for tile in np.argwhere(~grid)]
+        hpa = HierarchicalPathfinder(grid, cluster_size=int(rng.integers(3, 9)))
+        for _ in range(10):
+            start, end = (free[i] for i in rng.integers(len(free), size=2))
+            shortest = grid_nearest_target_path(lookup, start, [end])
+            jps, hierarchical = jump_point_search(lookup, start, end), hpa.find_path(start, end)
+            if shortest is None:
+                assert jps is None and hierarchical is None
+                continue
+            assert len(jps) == len(shortest[1])
+            for path in (jps, hierarchical):
+                row, col = start
+                for action in path:
+                    row, col = row + MOVES[action][0], col + MOVES[action][1]
+                    assert not lookup(col, row)
+                assert (row, col) == end
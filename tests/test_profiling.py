@@ -0,0 +1,27 @@
+import json
+import os
+
+from src.opengym.__main__ import GymGame
+from src.rl_algorithms import get_algorithm
+from src.utils.logger import LogLevel, StepLogger
+from src.utils.profiling import profile, stack_subsystem, step_limit
+
+
+def test_stack_subsystems():
+    assert stack_subsystem([("/x/src/utils/geometry.py", "segments_crossing"), ("/x/src/pygame/__main__.py", "draw_window")]) == 'raycasting'
+    assert stack_subsystem([("/x/site-packages/pygame/sprite.py", "__iter__"), ("/x/src/pygame/__main__.py", "draw_window")]) == 'rendering'
+    assert stack_subsystem([("/x/site-packages/pygame/sprite.py", "__iter__"), ("/x/src/opengym/__main__.py", "step")]) == 'env'
+    assert stack_subsystem([("/x/lib/json/encoder.py", "encode")]) == 'other'
+
+
+def test_profile_of_a_limited_number_of_steps(tmp_path):
+    env = GymGame()
+    policy = get_algorithm('random')(env, logger=StepLogger(LogLevel.SILENT))
+    with step_limit(GymGame, max_steps=5) as counters:
+        subsystems = profile(policy.run, 'sampling', str(tmp_path), interval=0.001)
+    assert counters["steps"] == 5
+    assert subsystems["pacing"] > 0.3 # 0.1 s per rendered step
+    with open(os.path.join(tmp_path, 'subsystems.json')) as f:
+        assert json.load(f)["profiler"] == 'sampling'
+    with open(os.path.join(tmp_path, 'stacks.collapsed')) as f:
+        assert any(line.startswith('pacing;') for line in f)
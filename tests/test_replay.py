@@ -0,0 +1,17 @@
+import os
+
+from src.opengym.replay import load_recording, render_recording
+from src.rl_algorithms.evaluation import run_episode
+
+
+def test_recorded_episodes_replay_and_render(tmp_path):
+    # The controlled policy draws from the same random generator as the spawns, the replay must not depend on it
+    result = run_episode('controlled', seed=3, record_dir=str(tmp_path))
+    path = os.path.join(tmp_path, 'controlled_3.json')
+    recording = load_recording(path)
+    assert len(recording["actions"]) == result["steps"]
+    assert recording["spawns"]
+
+    every = max(1, result["steps"] // 5)
+    frames = render_recording(path, str(tmp_path / 'frames'), every=every)
+    assert frames == len(os.listdir(tmp_path / 'frames')) == result["steps"] // every + 1 + (result["steps"] % every != 0)
@@ -0,0 +1,14 @@
+from src.pygame.spawning import EventCalendar
+
+
+def test_calendar_runs_periodic_events_in_bulk():
+    calendar = EventCalendar()
+    calendar.schedule(100, 'spawn', period=100)
+    calendar.schedule(250, 'once')
+    assert calendar.pop_due(99) == []
+    assert calendar.pop_due(100) == [('spawn', 1)]
+    assert calendar.next_tick == 200
+
+    # A long action (e.g. sleeping 8 hours) crosses several occurrences
+    assert calendar.pop_due(900) == [('spawn', 8), ('once', 1)]
+    assert calendar.next_tick == 1000
@@ -0,0 +1,8 @@
+import pytest
+
+from benchmarks.startup import measure_startup
+
+
+@pytest.mark.parametrize("mode", ['manual', 'random', 'controlled'])
+def test_policies_do_not_import_frameworks(mode):
+    assert measure_startup(mode)['heavy_modules'] == []
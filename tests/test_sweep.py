@@ -0,0 +1,39 @@
+import json
+import os
+
+from src.rl_algorithms.sweep import RESULT_FILE, RESULTS_FILE, SweepRunner, available_cores, expand_grid, parse_value, partition_cores
+
+
+def test_cores_are_split_into_disjoint_budgets():
+    assert partition_cores(list(range(10)), 4) == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert partition_cores([0, 1], 4) == []
+
+
+def test_grid_expands_every_combination_and_seed():
+    runs = expand_grid({"learning_rate": [parse_value("3e-4"), parse_value("1e-4")], "n_steps": [parse_value("1024")]}, seeds=[0, 1])
+    assert len(runs) == 4
+    assert runs[0] == {"run_id": "learning_rate=0.0003_n_steps=1024_seed=0", "hyperparameters": {"learning_rate": 3e-4, "n_steps": 1024}, "seed": 0}
+    assert len({run["run_id"] for run in runs}) == 4
+
+
+def test_failed_runs_are_recorded_and_free_their_slots(tmp_path):
+    # An invalid MaskablePPO keyword argument makes every worker fail fast. Two slots (on the same core) for three runs
+    runs = expand_grid({"not_a_hyperparameter": [1]}, seeds=[0, 1, 2])
+    core = available_cores()[0]
+    runner = SweepRunner("failing", runs, total_timesteps=64, cores_per_run=1, n_envs=1, cores=[core, core], store=str(tmp_path))
+    assert runner.run(poll_interval=0.1) == []
+
+    with open(os.path.join(runner.path, RESULTS_FILE)) as f:
+        results = [json.loads(line) for line in f]
+    assert sorted(result["run_id"] for result in results) == sorted(run["run_id"] for run in runs)
+    assert all(result["status"] == "failed" and result["returncode"] != 0 for result in results)
+    for run in runs:
+        assert os.path.exists(os.path.join(runner.run_path(run), 'output.log'))
+
+    # The third run only starts once a slot is freed, and a finished run is skipped when the sweep is relaunched
+    with open(os.path.join(runner.run_path(runs[0]), RESULT_FILE), 'w') as f:
+        json.dump({**runs[0], "status": "done"}, f)
+    assert runner.run(poll_interval=0.1) == [{**runs[0], "status": "done"}]
+    with open(os.path.join(runner.path, RESULTS_FILE)) as f:
+        relaunched = [json.loads(line) for line in f][len(results):]
+    assert sorted(result["run_id"] for result in relaunched) == sorted(run["run_id"] for run in runs[1:])
@@ -0,0 +1,36 @@
+import numpy as np
+import os
+import random
+
+from src.pygame.mapbundle import load_map_bundle
+from src.pygame.settings import *
+from src.pygame.walls import WallBVH, WallMesh, merge_wall_tiles
+
+
+def test_greedy_meshing_covers_every_wall_once():
+    grid = np.array([[1, 1, 1, 0],
+                     [1, 1, 1, 0],
+                     [0, 0, 1, 1],
+                     [1, 0, 0, 0]], dtype=bool)
+    assert merge_wall_tiles(grid) == [(0, 0, 3, 2), (2, 2, 2, 1), (0, 3, 1, 1)]
+
+    walls = load_map_bundle(os.path.join(ROOT_PROJECT_PATH, CONFIG_DIRECTORY_NAME, TILEDMAP_FILE)).walls != 0
+    coverage = np.zeros(walls.shape, dtype=np.int64)
+    rectangles = merge_wall_tiles(walls)
+    for col, row, width, height in rectangles:
+        coverage[row:row + height, col:col + width] += 1
+    assert np.array_equal(coverage, walls)
+    assert len(rectangles) < walls.sum() / 4
+
+
+def test_bvh_finds_every_rectangle_near_a_segment():
+    mesh = WallMesh(np.random.default_rng(0).random((20, 30)) < 0.3, 64)
+    rng = random.Random(0)
+    t = np.linspace(0, 1, 2000)[:, None]
+    for _ in range(300):
+        x1, y1, x2, y2 = (rng.uniform(-100, 2000) for _ in range(4))
+        points = np.array([x1, y1]) + t * np.array([x2 - x1, y2 - y1])
+        expected = [i for i, rect in enumerate(mesh.rects)
+                    if ((points >= [rect.left, rect.top]) & (points <= [rect.right, rect.bottom])).all(axis=1).any()]
+        assert set(expected) <= set(mesh.bvh.query_segment(x1, y1, x2, y2, margin=0))
+    assert WallBVH([]).query_segment(0, 0, 10, 10) == []